@@ -0,0 +1,313 @@
+"""
+Builds a deployable copy of the game with content-hashed asset filenames.
+
+The generators write assets under fixed names such as
+`{npc_id}_portrait.jpg`, so a static host cannot cache them for long without
+risking stale images after a regeneration. This build step copies `www/` to
+an output directory, renames every image referenced by a `portraitImage`,
+`gameViewImage` or `itemImage` field to `{name}.{hash}{ext}`, rewrites the
+data files in the output to point at the hashed names, and writes:
+
+  asset-manifest.json  Original path -> hashed path, with digest, size and,
+                       for location and portrait art, the image placeholder.
+  _headers             Cache-Control rules (Netlify/Cloudflare Pages format)
+                       marking hashed assets immutable and data files as
+                       always revalidated.
+
+Every `gameViewImage` and `portraitImage` also gets a low-quality
+placeholder (see placeholders.py) written next to it in the built data as
+`gameViewPlaceholder`/`portraitPlaceholder`, which the UI paints while the
+full image loads.
+
+Digests from the previous build's manifest are reused when a source file's
+size and mtime are unchanged, and placeholders are reused when the digest is
+unchanged, so rebuilding a large asset tree is cheap.
+
+Usage:
+  python scripts/build_assets.py [--output dist] [--no-placeholders]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+from data_store import DataStore
+from world_model import (DIALOGUES_FILENAME, ITEMS_FILENAME, NPCS_FILENAME, POIS_FILENAME,
+                         PUZZLES_FILENAME, load_world, save_json_file)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_ROOT = os.path.join(PROJECT_ROOT, "www")
+DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_ROOT, "dist")
+MANIFEST_FILENAME = "asset-manifest.json"
+HEADERS_FILENAME = "_headers"
+HASH_LENGTH = 12
+
+# Files that are only inputs to the generators and never served.
+EXCLUDED_SUFFIXES = ("_prompt.txt",)
+
+# Record attributes that hold the placeholder for an image attribute.
+PLACEHOLDER_ATTRIBUTES = {
+    "game_view_image": "game_view_placeholder",
+    "portrait_image": "portrait_placeholder",
+}
+
+# Some data files reference assets relative to the repository root
+# ("../www/assets/...") rather than the web root ("assets/...").
+_REPO_RELATIVE_PREFIX = "../www/"
+
+
+def web_relative_path(reference):
+    """
+    Normalises an asset reference from a data file to a path under www/.
+
+    Args:
+      reference: The value of a portraitImage/gameViewImage/itemImage field.
+
+    Returns:
+      The path relative to the web root, or None for URLs and empty values.
+    """
+    if not reference or "://" in reference or reference.startswith("data:"):
+        return None
+    if reference.startswith(_REPO_RELATIVE_PREFIX):
+        reference = reference[len(_REPO_RELATIVE_PREFIX):]
+    return os.path.normpath(reference.lstrip("/")).replace(os.sep, "/")
+
+
+def hashed_filename(relative_path, digest):
+    root, ext = os.path.splitext(relative_path)
+    return f"{root}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def iter_asset_fields(world):
+    """
+    Yields every asset reference in the world as (owner, key) pairs.
+
+    `owner` is either a record (accessed through its attribute) or a raw
+    dictionary such as a tradable good, so callers read and write the
+    reference with get_reference/set_reference.
+    """
+    for npc in world.npcs:
+        yield npc, "portrait_image"
+    for poi in world.pois:
+        yield poi, "game_view_image"
+        for hidden_object in poi.hidden_objects or []:
+            yield hidden_object, "item_image"
+        for good in poi.tradable_goods or []:
+            if isinstance(good, dict):
+                yield good, "itemImage"
+    for item in world.items:
+        yield item, "item_image"
+
+
+def get_reference(owner, key):
+    return owner.get(key) if isinstance(owner, dict) else getattr(owner, key)
+
+
+def set_reference(owner, key, value):
+    if isinstance(owner, dict):
+        owner[key] = value
+    else:
+        setattr(owner, key, value)
+
+
+class AssetHasher:
+    """Computes and caches content hashes for files under the web root."""
+
+    def __init__(self, web_root, previous_manifest=None):
+        self.web_root = web_root
+        self._previous = (previous_manifest or {}).get("assets", {})
+        self.assets = {}
+
+    def hash_asset(self, relative_path):
+        """
+        Returns the manifest entry for an asset, or None if the file is missing.
+        """
+        if relative_path in self.assets:
+            return self.assets[relative_path]
+        source_path = os.path.join(self.web_root, relative_path)
+        if not os.path.isfile(source_path):
+            return None
+
+        stat = os.stat(source_path)
+        previous = self._previous.get(relative_path)
+        if previous and previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime:
+            digest = previous["sha256"]
+        else:
+            digest = file_digest(source_path)
+        entry = {
+            "file": hashed_filename(relative_path, digest),
+            "sha256": digest,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+        self.assets[relative_path] = entry
+        return entry
+
+    def cached_placeholder(self, relative_path):
+        """Returns the previous build's placeholder for an asset if its content is unchanged."""
+        previous = self._previous.get(relative_path)
+        entry = self.assets.get(relative_path)
+        if previous and entry and previous.get("sha256") == entry["sha256"]:
+            return previous.get("placeholder")
+        return None
+
+
+def add_placeholders(hasher, targets):
+    """
+    Attaches placeholders to records and records them in the manifest entries.
+
+    Args:
+      hasher: The AssetHasher holding the manifest entries for this build.
+      targets: (record, placeholder_attribute, relative_path) tuples.
+
+    Returns:
+      The number of placeholders that had to be computed, or None if the
+      placeholder dependencies are not installed.
+    """
+    try:
+        from placeholders import compute_placeholders
+    except ImportError as e:
+        print(f"WARNING: Skipping image placeholders; NumPy and Pillow are required. Error: {e}")
+        return None
+
+    to_compute = {}
+    for _, _, relative_path in targets:
+        if "placeholder" in hasher.assets[relative_path]:
+            continue
+        cached = hasher.cached_placeholder(relative_path)
+        if cached is not None:
+            hasher.assets[relative_path]["placeholder"] = cached
+        else:
+            to_compute[relative_path] = os.path.join(hasher.web_root, relative_path)
+    for relative_path, placeholder in compute_placeholders(to_compute).items():
+        hasher.assets[relative_path]["placeholder"] = placeholder
+
+    for record, attr, relative_path in targets:
+        setattr(record, attr, hasher.assets[relative_path].get("placeholder"))
+    return len(to_compute)
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"WARNING: Ignoring unreadable previous manifest {path}. Error: {e}")
+        return None
+
+
+def copy_web_root(web_root, output_dir):
+    """Copies the web root to the output directory, skipping generator-only files."""
+    def ignore(directory, names):
+        return [name for name in names if name.endswith(EXCLUDED_SUFFIXES)]
+    shutil.copytree(web_root, output_dir, ignore=ignore, dirs_exist_ok=True)
+
+
+def write_headers(output_dir, assets):
+    lines = []
+    for entry in sorted(assets.values(), key=lambda entry: entry["file"]):
+        lines.append(f"/{entry['file']}")
+        lines.append("  Cache-Control: public, max-age=31536000, immutable")
+    lines.append("/data/*")
+    lines.append("  Cache-Control: no-cache")
+    lines.append(f"/{MANIFEST_FILENAME}")
+    lines.append("  Cache-Control: no-cache")
+    with open(os.path.join(output_dir, HEADERS_FILENAME), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def build(output_dir=DEFAULT_OUTPUT_DIR, web_root=WEB_ROOT, placeholders=True):
+    """
+    Runs the build.
+
+    Args:
+      output_dir: Where to write the build output.
+      web_root: The source web root (www/).
+      placeholders: Embed low-quality image placeholders in the built data.
+
+    Returns:
+      The manifest dictionary that was written.
+    """
+    world = load_world(os.path.join(web_root, "data"))
+    hasher = AssetHasher(web_root, load_manifest(output_dir))
+
+    print(f"INFO: Copying {web_root} to {output_dir}...")
+    copy_web_root(web_root, output_dir)
+
+    rewritten = 0
+    missing = set()
+    placeholder_targets = []
+    for owner, key in iter_asset_fields(world):
+        reference = get_reference(owner, key)
+        relative_path = web_relative_path(reference)
+        if relative_path is None:
+            continue
+        entry = hasher.hash_asset(relative_path)
+        if entry is None:
+            missing.add(reference)
+            continue
+        set_reference(owner, key, entry["file"])
+        rewritten += 1
+        if key in PLACEHOLDER_ATTRIBUTES and not isinstance(owner, dict):
+            placeholder_targets.append((owner, PLACEHOLDER_ATTRIBUTES[key], relative_path))
+
+    if placeholders:
+        computed = add_placeholders(hasher, placeholder_targets)
+        if computed is not None:
+            print(f"INFO: Embedded {len(placeholder_targets)} image placeholders ({computed} recomputed).")
+
+    for relative_path, entry in hasher.assets.items():
+        target_path = os.path.join(output_dir, entry["file"])
+        if not os.path.exists(target_path):
+            shutil.copyfile(os.path.join(web_root, relative_path), target_path)
+        plain_copy = os.path.join(output_dir, relative_path)
+        if os.path.exists(plain_copy):
+            os.remove(plain_copy)
+
+    # The game loads single data files, whatever layout the source uses.
+    data_dir = os.path.join(output_dir, "data")
+    for filename in (NPCS_FILENAME, POIS_FILENAME, ITEMS_FILENAME, PUZZLES_FILENAME, DIALOGUES_FILENAME):
+        store = DataStore(filename, data_dir=os.path.join(web_root, "data"))
+        if store.is_sharded:
+            shutil.rmtree(os.path.join(data_dir, store.name), ignore_errors=True)
+    save_json_file(os.path.join(data_dir, NPCS_FILENAME), world.npcs)
+    save_json_file(os.path.join(data_dir, POIS_FILENAME), world.pois)
+    save_json_file(os.path.join(data_dir, ITEMS_FILENAME), world.items)
+    save_json_file(os.path.join(data_dir, PUZZLES_FILENAME), world.puzzles)
+    save_json_file(os.path.join(data_dir, DIALOGUES_FILENAME), world.dialogues_to_dict())
+
+    manifest = {"assets": dict(sorted(hasher.assets.items()))}
+    save_json_file(os.path.join(output_dir, MANIFEST_FILENAME), manifest)
+    write_headers(output_dir, hasher.assets)
+
+    for reference in sorted(missing):
+        print(f"WARNING: Asset {reference} is referenced in the data files but does not exist. Left unchanged.")
+    print(f"SUCCESS: Rewrote {rewritten} asset references to {len(hasher.assets)} content-hashed files in {output_dir}.")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the game with content-hashed, long-cacheable asset filenames.')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT_DIR,
+                        help='Directory to write the build output to. Default: dist/ in the project root.')
+    parser.add_argument('--no-placeholders', action='store_true',
+                        help='Do not embed low-quality image placeholders in the built data files.')
+    args = parser.parse_args()
+    build(output_dir=args.output, placeholders=not args.no_placeholders)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""
+Record and replay `generate_images` and `edit_image` API traffic.
+
+A cassette is a directory holding:
+  interactions.jsonl  One JSON line per API call: method (omitted for
+                      generate_images), model, prompt, config,
+                      outcome (image digest or error code/message), the
+                      offset from the start of the recording, the observed
+                      latency and, for retries, the wait since the previous
+                      failed attempt at the same prompt. A 429 that a client
+                      pool absorbed by failing over to another entry is
+                      recorded too, with "failover" naming the entry.
+  blobs/<sha256>      Image bytes, stored once per distinct image.
+  meta.json           The random seed used during recording, so prompt
+                      selection replays identically.
+
+Wrap a real client with RecordingClient to capture a run, then point the
+generators at a ReplayClient to reproduce it with no network, either at the
+recorded speed or accelerated. `python scripts/cassettes.py summary DIR`
+prints the latency distribution and error counts of a cassette.
+
+Usage from a generator:
+  client = make_client(args)  # honours --record / --replay / --replay-speed
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from types import SimpleNamespace
+
+from latency_stats import percentile
+
+INTERACTIONS_FILENAME = "interactions.jsonl"
+META_FILENAME = "meta.json"
+BLOBS_DIRNAME = "blobs"
+
+
+def _config_to_dict(config):
+    """Converts a GenerateImagesConfig (or plain dict) to JSON-friendly data."""
+    if config is None:
+        return None
+    if hasattr(config, "model_dump"):
+        return config.model_dump(mode="json", exclude_none=True)
+    if isinstance(config, dict):
+        return config
+    return str(config)
+
+
+def _error_dict(error):
+    return {"type": type(error).__name__, "code": getattr(error, "code", None), "message": str(error)}
+
+
+def _request_key(model, prompt, method="generate_images"):
+    if method == "generate_images":
+        return f"{model}\n{prompt}"
+    return f"{method}\n{model}\n{prompt}"
+
+
+class CassetteWriter:
+    """
+    Writes interactions to a new cassette directory as they happen.
+
+    Raises:
+      ValueError: If the directory already holds a recording. Adding a second
+        run under a new seed would make the cassette replay differently.
+    """
+
+    def __init__(self, cassette_dir, seed):
+        self.cassette_dir = cassette_dir
+        log_path = os.path.join(cassette_dir, INTERACTIONS_FILENAME)
+        if os.path.exists(log_path) and os.path.getsize(log_path) > 0:
+            raise ValueError(f"Cassette {cassette_dir} already holds a recording. Record into a new directory.")
+        os.makedirs(os.path.join(cassette_dir, BLOBS_DIRNAME), exist_ok=True)
+        with open(os.path.join(cassette_dir, META_FILENAME), "w") as f:
+            json.dump({"seed": seed, "recorded_at": time.time()}, f, indent=2)
+        self._log = open(log_path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last_failure_end = {}
+
+    def write_blob(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = os.path.join(self.cassette_dir, BLOBS_DIRNAME, digest)
+        if not os.path.exists(blob_path):
+            with open(blob_path, "wb") as f:
+                f.write(data)
+        return digest
+
+    def record(self, model, prompt, config, started, finished, images=None, error=None, method="generate_images",
+               failover=None):
+        key = _request_key(model, prompt, method)
+        with self._lock:
+            entry = {"method": method} if method != "generate_images" else {}
+            entry.update({
+                "model": model,
+                "prompt": prompt,
+                "config": _config_to_dict(config),
+                "offset": round(started - self._started, 3),
+                "latency": round(finished - started, 3),
+            })
+            if failover is not None:
+                # Happened inside a pool call; the call's own entry follows and spans it.
+                entry["failover"] = failover
+            else:
+                previous_failure_end = self._last_failure_end.pop(key, None)
+                if previous_failure_end is not None:
+                    entry["retry_delay"] = round(started - previous_failure_end, 3)
+            if error is not None:
+                entry["error"] = error
+                if failover is None:
+                    self._last_failure_end[key] = finished
+            else:
+                entry["images"] = images or []
+            self._log.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._log.flush()
+
+    def close(self):
+        self._log.close()
+
+
+class _RecordingModels:
+    def __init__(self, models, writer):
+        self._models = models
+        self._writer = writer
+
+    def generate_images(self, model, prompt, config=None, **kwargs):
+        return self._record_call("generate_images", model, prompt, config, kwargs)
+
+    def edit_image(self, model, prompt, reference_images, config=None, **kwargs):
+        return self._record_call("edit_image", model, prompt, config, dict(kwargs, reference_images=reference_images))
+
+    def _record_call(self, method, model, prompt, config, kwargs):
+        started = time.monotonic()
+        try:
+            response = getattr(self._models, method)(model=model, prompt=prompt, config=config, **kwargs)
+        except Exception as e:
+            self._writer.record(model, prompt, config, started, time.monotonic(), error=_error_dict(e), method=method)
+            raise
+        finished = time.monotonic()
+
+        images = []
+        for generated in response.generated_images or []:
+            image = getattr(generated, "image", None)
+            image_bytes = getattr(image, "image_bytes", None) if image else None
+            rai_reason = getattr(generated, "rai_filtered_reason", None)
+            images.append({
+                "blob": self._writer.write_blob(image_bytes) if image_bytes else None,
+                "mime_type": getattr(image, "mime_type", None) if image else None,
+                "rai_filtered_reason": str(rai_reason) if rai_reason else None,
+            })
+        self._writer.record(model, prompt, config, started, finished, images=images, method=method)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class RecordingClient:
+    """
+    Wraps a genai.Client and records every generate_images and edit_image call to a cassette.
+
+    When the client is a client_pool.ClientPool, the 429s it absorbs by
+    failing over to another entry are recorded as well, so a replay sees the
+    same rate limiting. Everything else is passed straight through.
+    """
+
+    def __init__(self, client, cassette_dir, seed=None):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        random.seed(seed)
+        self._client = client
+        self.writer = CassetteWriter(cassette_dir, seed)
+        self.models = _RecordingModels(client.models, self.writer)
+        if hasattr(client, "on_failover"):
+            client.on_failover = self.record_failover
+        print(f"INFO: Recording API traffic to cassette {cassette_dir} (seed {seed}).")
+
+    def record_failover(self, entry_name, method, kwargs, error, started, finished):
+        """Records a 429 from one pool entry that the pool retried on another entry."""
+        self.writer.record(kwargs.get("model"), kwargs.get("prompt"), kwargs.get("config"), started, finished,
+                           error=_error_dict(error), method=method, failover=entry_name)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def load_interactions(cassette_dir):
+    """
+    Reads every recorded interaction from a cassette.
+
+    Args:
+      cassette_dir: The cassette directory.
+
+    Returns:
+      A list of interaction dictionaries in recording order.
+    """
+    interactions = []
+    with open(os.path.join(cassette_dir, INTERACTIONS_FILENAME), "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                interactions.append(json.loads(line))
+    return interactions
+
+
+def _replay_error(error):
+    """Rebuilds the exception a recorded call raised."""
+    code = error.get("code")
+    message = error.get("message", "")
+    if isinstance(code, int):
+        try:
+            from google.api_core.exceptions import from_http_status
+            return from_http_status(code, message)
+        except ImportError:
+            pass
+    return RuntimeError(message)
+
+
+class _ReplayModels:
+    def __init__(self, cassette_dir, interactions, speed, budget=None):
+        self._cassette_dir = cassette_dir
+        self._speed = speed
+        self._budget = budget
+        self._lock = threading.Lock()
+        self._by_key = {}
+        for index, interaction in enumerate(interactions):
+            key = _request_key(interaction["model"], interaction["prompt"], interaction.get("method", "generate_images"))
+            self._by_key.setdefault(key, []).append(index)
+        self._interactions = interactions
+
+    def _take(self, model, prompt, method="generate_images"):
+        with self._lock:
+            queue = self._by_key.get(_request_key(model, prompt, method))
+            if not queue:
+                raise RuntimeError(
+                    f"Cassette {self._cassette_dir} has no unreplayed {method} call for model {model} with this prompt; "
+                    f"the run has diverged from the recording: {prompt[:80]!r}"
+                )
+            return self._interactions[queue.pop(0)]
+
+    def _read_blob(self, digest):
+        with open(os.path.join(self._cassette_dir, BLOBS_DIRNAME, digest), "rb") as f:
+            return f.read()
+
+    def generate_images(self, model, prompt, config=None, **kwargs):
+        return self._respond(self._take_call(model, prompt))
+
+    def edit_image(self, model, prompt, reference_images, config=None, **kwargs):
+        return self._respond(self._take_call(model, prompt, "edit_image"))
+
+    def _take_call(self, model, prompt, method="generate_images"):
+        """
+        Returns the recorded outcome of one call, first replaying the pool
+        failovers inside it: each waits its recorded latency and, like the
+        pool did, is charged to the budget as an extra request.
+
+        Returns:
+          (interaction, seconds of its recorded latency already spent on failovers).
+        """
+        interaction = self._take(model, prompt, method)
+        spent = 0.0
+        while interaction.get("failover"):
+            if self._speed:
+                time.sleep(interaction.get("latency", 0) / self._speed)
+            spent += interaction.get("latency", 0)
+            if self._budget is not None and self._budget.reserve_request():
+                raise _replay_error(interaction["error"])
+            interaction = self._take(model, prompt, method)
+        return interaction, spent
+
+    def _respond(self, taken):
+        interaction, spent = taken
+        if self._speed:
+            time.sleep(max(0.0, interaction.get("latency", 0) - spent) / self._speed)
+        if "error" in interaction:
+            raise _replay_error(interaction["error"])
+
+        generated_images = []
+        for image in interaction.get("images", []):
+            image_bytes = self._read_blob(image["blob"]) if image.get("blob") else None
+            generated_images.append(SimpleNamespace(
+                image=SimpleNamespace(image_bytes=image_bytes, mime_type=image.get("mime_type")) if image_bytes else None,
+                rai_filtered_reason=image.get("rai_filtered_reason"),
+                rai_reason=None,
+            ))
+        return SimpleNamespace(generated_images=generated_images, candidates=None)
+
+
+class ReplayClient:
+    """
+    Stands in for a genai.Client, answering generate_images and edit_image from a cassette.
+
+    Calls are matched to recordings by method, model and prompt; a call with
+    no unreplayed match raises RuntimeError. The random seed from the recording is restored so the
+    generators build the same prompts as they did when it was made.
+
+    Args:
+      cassette_dir: The cassette directory.
+      speed: 1.0 replays at the recorded latency, 2.0 twice as fast, and
+        0 returns every response immediately.
+      budget: The run's GenerationBudget, charged for replayed pool
+        failovers as the pool charged it while recording. Optional.
+    """
+
+    def __init__(self, cassette_dir, speed=1.0, budget=None):
+        meta_path = os.path.join(cassette_dir, META_FILENAME)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                seed = json.load(f).get("seed")
+            if seed is not None:
+                random.seed(seed)
+        interactions = load_interactions(cassette_dir)
+        self.models = _ReplayModels(cassette_dir, interactions, speed, budget=budget)
+        print(f"INFO: Replaying {len(interactions)} recorded API calls from {cassette_dir} at speed {speed or 'instant'}.")
+
+
+def add_cassette_arguments(parser):
+    """Adds the --record/--replay/--replay-speed options to an argument parser."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', type=str, default=None, metavar='CASSETTE_DIR',
+                       help='Record every image generation request and response to this cassette directory.')
+    group.add_argument('--replay', type=str, default=None, metavar='CASSETTE_DIR',
+                       help='Answer image generation requests from this cassette instead of the API.')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='Replay speed multiplier; 0 replays without any delay. Default: 1.0 (recorded speed).')
+
+
+def make_client(args, budget=None):
+    """
+    Creates the client a generator should use, honouring the cassette options.
+
+    Args:
+      args: Parsed arguments from a parser set up with add_cassette_arguments
+        (and optionally client_pool.add_client_pool_arguments).
+      budget: The run's GenerationBudget, charged by a client pool (or a
+        replayed one) for the extra attempts it makes when failing over.
+
+    Returns:
+      A genai.Client (or a client_pool.ClientPool when --client-pool is
+      given), or a RecordingClient/ReplayClient standing in for one.
+    """
+    if getattr(args, "replay", None):
+        return ReplayClient(args.replay, speed=args.replay_speed, budget=budget)
+    if getattr(args, "client_pool", None):
+        from client_pool import ClientPool
+        client = ClientPool.from_file(args.client_pool, budget=budget)
+    else:
+        from google import genai
+        client = genai.Client()
+    if getattr(args, "record", None):
+        return RecordingClient(client, args.record)
+    return client
+
+
+def summarize(cassette_dir):
+    """Prints latency, error and retry statistics for a cassette."""
+    interactions = load_interactions(cassette_dir)
+    if not interactions:
+        print(f"INFO: Cassette {cassette_dir} is empty.")
+        return
+
+    by_model = {}
+    for interaction in interactions:
+        by_model.setdefault(interaction["model"], []).append(interaction)
+
+    for model, calls in sorted(by_model.items()):
+        latencies = [call["latency"] for call in calls]
+        errors = {}
+        for call in calls:
+            if "error" in call:
+                code = call["error"].get("code") or call["error"].get("type")
+                errors[code] = errors.get(code, 0) + 1
+        retry_delays = [call["retry_delay"] for call in calls if "retry_delay" in call]
+        failovers = sum(1 for call in calls if call.get("failover"))
+        blocked = sum(1 for call in calls for image in call.get("images", []) if not image.get("blob"))
+        print(f"{model}: {len(calls)} calls, "
+              f"latency p50 {percentile(latencies, 0.5):.2f}s / p95 {percentile(latencies, 0.95):.2f}s / "
+              f"mean {statistics.mean(latencies):.2f}s")
+        print(f"  errors: {errors or 'none'}; blocked images: {blocked}; "
+              f"retries: {len(retry_delays)}" + (f" (mean wait {statistics.mean(retry_delays):.2f}s)" if retry_delays else "")
+              + (f"; pool failovers: {failovers}" if failovers else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect recorded image generation cassettes.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary_parser = subparsers.add_parser('summary', help='Print latency and error statistics for a cassette.')
+    summary_parser.add_argument('cassette_dir', type=str)
+    args = parser.parse_args()
+
+    if args.command == 'summary':
+        summarize(args.cassette_dir)
+
+
+if __name__ == "__main__":
+    main()
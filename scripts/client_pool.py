@@ -0,0 +1,264 @@
+"""
+Spread image generation requests across several projects, regions or keys.
+
+A single genai.Client is capped by one project's quota. A client pool holds
+one client per configured entry and stands in for a genai.Client: every
+`models.generate_images` / `models.edit_image` call is routed to the entry
+with the most headroom left in its requests-per-minute allowance. An entry
+that answers with a 429 is drained (taken out of rotation for a cooldown that
+doubles on every consecutive 429) and the request is retried on the next
+entry, so the pool's throughput is the sum of its entries' quotas. When every
+entry is drained, the call waits for the first one to come back (at most
+MAX_WAIT_SECONDS, and never past the budget's deadline) instead of failing.
+
+Given a GenerationBudget (make_client passes the run's budget), the pool
+charges it for every failover attempt it sends. The caller's own reserved
+request covers the first attempt, and is refunded if the call gives up
+before sending anything.
+
+The pool is configured with a JSON file, passed with --client-pool:
+
+  [
+    {"name": "main", "project": "my-project", "location": "us-central1", "requestsPerMinute": 20},
+    {"name": "europe", "project": "my-project", "location": "europe-west4", "requestsPerMinute": 20},
+    {"name": "second-project", "project": "other-project", "location": "us-central1",
+     "credentialsFile": "~/keys/other-project.json"},
+    {"name": "studio", "apiKeyEnv": "GOOGLE_API_KEY_2", "requestsPerMinute": 10}
+  ]
+
+Entries with a "project" use Vertex AI (with Application Default Credentials
+unless "credentialsFile" names a service account key). Entries with
+"apiKeyEnv" use the Gemini API key stored in that environment variable; keys
+are never read from the file itself.
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+DEFAULT_REQUESTS_PER_MINUTE = 20
+WINDOW_SECONDS = 60.0
+DRAIN_SECONDS = 60.0
+MAX_DRAIN_SECONDS = 600.0
+MAX_WAIT_SECONDS = 600.0
+_CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+
+def is_rate_limit_error(error):
+    """Returns True if an API error is a 429 / RESOURCE_EXHAUSTED response."""
+    return ("429" in str(error) and "RESOURCE_EXHAUSTED" in str(error)) or getattr(error, "code", None) == 429
+
+
+def _pool_exhausted_error(message):
+    """Builds a 429 error so callers back off exactly as for a single client."""
+    try:
+        from google.api_core.exceptions import TooManyRequests
+        return TooManyRequests(message)
+    except ImportError:
+        return RuntimeError(f"429 RESOURCE_EXHAUSTED: {message}")
+
+
+class PoolEntry:
+    """One client in the pool and its request accounting."""
+
+    def __init__(self, name, client, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE):
+        self.name = name
+        self.client = client
+        self.requests_per_minute = requests_per_minute
+        self.recent = collections.deque() # Start times of requests within the window
+        self.in_flight = 0
+        self.last_used = 0.0
+        self.drained_until = 0.0
+        self.strikes = 0
+        self.requests = 0
+        self.rate_limited = 0
+
+    def headroom(self, now):
+        """Returns how many more requests this entry may start in the current window."""
+        while self.recent and now - self.recent[0] >= WINDOW_SECONDS:
+            self.recent.popleft()
+        return self.requests_per_minute - len(self.recent)
+
+    def is_drained(self, now):
+        return now < self.drained_until
+
+
+def _make_entry_client(config):
+    from google import genai
+    if config.get("apiKeyEnv"):
+        api_key = os.getenv(config["apiKeyEnv"])
+        if not api_key:
+            raise ValueError(f"Environment variable {config['apiKeyEnv']} is not set.")
+        return genai.Client(api_key=api_key)
+    if not config.get("project"):
+        raise ValueError("Each pool entry needs either a \"project\" or an \"apiKeyEnv\".")
+    credentials = None
+    if config.get("credentialsFile"):
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_file(
+            os.path.expanduser(config["credentialsFile"]), scopes=[_CLOUD_PLATFORM_SCOPE])
+    return genai.Client(vertexai=True, project=config["project"],
+                        location=config.get("location", "us-central1"), credentials=credentials)
+
+
+class _PoolModels:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def generate_images(self, model, prompt, config=None, **kwargs):
+        return self._pool.call("generate_images", model=model, prompt=prompt, config=config, **kwargs)
+
+    def edit_image(self, model, prompt, reference_images, config=None, **kwargs):
+        return self._pool.call("edit_image", model=model, prompt=prompt, reference_images=reference_images,
+                               config=config, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._pool.entries[0].client.models, name)
+
+
+class ClientPool:
+    """
+    Stands in for a genai.Client, routing each request to the pool entry
+    with the most headroom. Safe to share between threads.
+
+    Args:
+      entries: The PoolEntry objects to route between.
+      budget: The GenerationBudget charged for failover attempts. Optional.
+      max_wait_seconds: The longest a call waits for a drained entry to return.
+
+    Attributes:
+      on_failover: Optional callable, called with (entry name, method name,
+        call kwargs, error, started, finished) for every 429 the pool absorbs
+        by retrying on another entry; cassettes.RecordingClient sets it.
+    """
+
+    def __init__(self, entries, budget=None, max_wait_seconds=MAX_WAIT_SECONDS):
+        if not entries:
+            raise ValueError("A client pool needs at least one entry.")
+        self.entries = entries
+        self.budget = budget
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self.on_failover = None
+        self.models = _PoolModels(self)
+
+    @classmethod
+    def from_file(cls, path, budget=None):
+        """Creates a pool with one client per entry of a JSON pool file."""
+        with open(path, "r") as f:
+            configs = json.load(f)
+        entries = []
+        for number, config in enumerate(configs):
+            name = config.get("name") or config.get("project") or f"entry-{number}"
+            entries.append(PoolEntry(name, _make_entry_client(config),
+                                     config.get("requestsPerMinute", DEFAULT_REQUESTS_PER_MINUTE)))
+        total = sum(entry.requests_per_minute for entry in entries)
+        print(f"INFO: Client pool with {len(entries)} entries ({', '.join(entry.name for entry in entries)}), "
+              f"{total} requests per minute in total.")
+        return cls(entries, budget=budget)
+
+    def _acquire(self, exclude, deadline):
+        """
+        Reserves a request slot on the entry with the most headroom.
+
+        Waits for a slot when every usable entry is at its per-minute limit.
+        When every entry is drained (or in `exclude`), waits until the first
+        drained entry returns, then clears `exclude`. Returns None if that
+        would take past `deadline` (a time.monotonic() value).
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [entry for entry in self.entries
+                              if entry not in exclude and not entry.is_drained(now)]
+                if candidates:
+                    best = max(candidates, key=lambda entry: (entry.headroom(now), -entry.in_flight, -entry.last_used))
+                    if best.headroom(now) > 0:
+                        best.recent.append(now)
+                        best.in_flight += 1
+                        best.last_used = now
+                        best.requests += 1
+                        return best
+                    wait = min(entry.recent[0] + WINDOW_SECONDS for entry in candidates) - now
+                    message = f"Every client in the pool is at its request limit. Waiting {wait:.1f} seconds."
+                else:
+                    back_at = min(entry.drained_until for entry in self.entries)
+                    if back_at > deadline:
+                        return None
+                    wait = back_at - now
+                    exclude.clear() # Entries tried by this call may be used again once they return
+                    message = f"Every client in the pool is drained. Waiting {max(wait, 0.0):.1f} seconds for one to return."
+            print(f"INFO: {message}")
+            time.sleep(max(wait, 0.1))
+
+    def _release(self, entry, rate_limited=False):
+        with self._lock:
+            entry.in_flight -= 1
+            if not rate_limited:
+                entry.strikes = 0
+                return
+            entry.strikes += 1
+            entry.rate_limited += 1
+            cooldown = min(MAX_DRAIN_SECONDS, DRAIN_SECONDS * (2 ** (entry.strikes - 1)))
+            entry.drained_until = time.monotonic() + cooldown
+        print(f"WARNING: Client pool entry {entry.name} hit its quota. Draining it for {cooldown:.0f} seconds.")
+
+    def call(self, method_name, **kwargs):
+        """
+        Makes one API call through the pool, failing over to the next entry on a 429.
+
+        The first attempt uses the request the caller reserved; every further
+        attempt is charged to the pool's budget.
+
+        Raises:
+          The last 429 error (or an equivalent one) when no entry returns
+          before the wait deadline or the budget runs out, so the caller's own
+          backoff and budget checks apply.
+        """
+        tried = set()
+        last_error = None
+        failover = None # The absorbed 429 the next attempt retries, as on_failover arguments
+        attempts = 0
+        deadline = time.monotonic() + self.max_wait_seconds
+        if self.budget is not None:
+            deadline = min(deadline, time.monotonic() + self.budget.remaining_seconds())
+        while True:
+            if attempts and self.budget is not None:
+                reason = self.budget.reserve_request()
+                if reason:
+                    raise last_error or _pool_exhausted_error(f"Not failing over: {reason}.")
+            entry = self._acquire(tried, deadline)
+            if entry is None:
+                if self.budget is not None:
+                    self.budget.refund_request() # This attempt's request was never sent
+                raise last_error or _pool_exhausted_error("Every client in the pool is drained.")
+            if failover is not None and self.on_failover is not None:
+                self.on_failover(*failover)
+            attempts += 1
+            started = time.monotonic()
+            try:
+                result = getattr(entry.client.models, method_name)(**kwargs)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                self._release(entry, rate_limited=rate_limited)
+                if not rate_limited:
+                    raise
+                tried.add(entry)
+                last_error = e
+                failover = (entry.name, method_name, kwargs, e, started, time.monotonic())
+                continue
+            self._release(entry)
+            return result
+
+    def summary(self):
+        """Returns a one-line summary of how requests were spread across the pool."""
+        return ", ".join(f"{entry.name}: {entry.requests} requests ({entry.rate_limited} rate limited)"
+                         for entry in self.entries)
+
+
+def add_client_pool_arguments(parser):
+    """Adds the --client-pool option to an argument parser."""
+    parser.add_argument('--client-pool', type=str, default=None, metavar='POOL_FILE',
+                        help='JSON file listing several projects/regions/API keys to spread requests across.')
@@ -0,0 +1,358 @@
+"""
+Streaming access and an optional sharded on-disk layout for the data files.
+
+A collection (npcs, pois, items, puzzles or dialogues) is stored either as
+the usual single file, e.g. `www/data/npcs.json`, or sharded:
+
+  www/data/npcs/index.json       {"container": "list", "shardSize": 500,
+                                  "shards": ["npcs-00000.json", ...],
+                                  "ids": {"npc_one_eyed_jack": 0, ...}}
+  www/data/npcs/npcs-00000.json  The first 500 entries, same format as npcs.json.
+
+List collections are keyed by each entry's "id"; dialogues.json is keyed by
+its top-level NPC ids. DataStore hides the difference:
+
+  store = DataStore("npcs.json", data_dir)
+  for npc in store.iter_entries():        # streams, one entry in memory at a time
+      ...
+  store.patch({"npc_one_eyed_jack": {"portraitImage": "assets/..."}})
+
+Patches to a sharded collection rewrite only the shards holding the changed
+entries. Patches to a single file are streamed through a temporary file, so
+memory stays flat even though the whole file is rewritten.
+
+The game itself still loads the single files; `build_assets.py` always
+writes single files into its output, and `data_store.py unshard` converts a
+collection back for local development.
+
+Usage:
+  python scripts/data_store.py shard npcs.json [--shard-size 500]
+  python scripts/data_store.py unshard npcs.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "www", "data")
+DEFAULT_SHARD_SIZE = 500
+INDEX_FILENAME = "index.json"
+_CHUNK_SIZE = 1 << 16
+_DECODER = json.JSONDecoder()
+
+
+class _StreamReader:
+    """Incrementally decodes JSON values from a text file."""
+
+    def __init__(self, f):
+        self._f = f
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._f.read(_CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it, or '' at EOF."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expected {char!r}", self._buffer, self._pos)
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof or not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self._buffer) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def iter_json_array(f):
+    """Yields the elements of a top-level JSON array one at a time."""
+    reader = _StreamReader(f)
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == "]":
+            return
+        reader.expect(",")
+
+
+def iter_json_object(f):
+    """Yields the (key, value) pairs of a top-level JSON object one at a time."""
+    reader = _StreamReader(f)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        yield key, reader.value()
+        if reader.peek() == "}":
+            return
+        reader.expect(",")
+
+
+def _indent(text):
+    return "\n".join("  " + line for line in text.split("\n"))
+
+
+def write_json_container(f, container, pairs):
+    """
+    Writes (key, entry) pairs as a JSON list or object, one entry at a time.
+
+    The output is byte-identical to json.dump(..., indent=2) of the same data.
+    """
+    opener, closer = ("[", "]") if container == "list" else ("{", "}")
+    first = True
+    f.write(opener)
+    for key, entry in pairs:
+        f.write("\n" if first else ",\n")
+        first = False
+        body = json.dumps(entry, indent=2)
+        if container == "list":
+            f.write(_indent(body))
+        else:
+            f.write(_indent(f"{json.dumps(key)}: {body}"))
+    f.write(closer if first else "\n" + closer)
+
+
+def _atomic_write(path, container, pairs):
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            write_json_container(f, container, pairs)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _apply_changes(entry, changes):
+    entry.update(changes)
+    return entry
+
+
+class DataStore:
+    """
+    One data collection, in either the single-file or the sharded layout.
+
+    Args:
+      filename: The collection's single-file name, e.g. "npcs.json".
+      data_dir: The data directory (www/data by default).
+    """
+
+    def __init__(self, filename, data_dir=None):
+        self.data_dir = data_dir or DEFAULT_DATA_DIR
+        self.filename = filename
+        self.name = os.path.splitext(filename)[0]
+        self.file_path = os.path.join(self.data_dir, filename)
+        self.shard_dir = os.path.join(self.data_dir, self.name)
+        self.index_path = os.path.join(self.shard_dir, INDEX_FILENAME)
+        self._index = None
+
+    @property
+    def is_sharded(self):
+        return os.path.exists(self.index_path)
+
+    def exists(self):
+        return self.is_sharded or os.path.exists(self.file_path)
+
+    def index(self):
+        if self._index is None:
+            with open(self.index_path, "r") as f:
+                self._index = json.load(f)
+        return self._index
+
+    def container(self):
+        """Returns "list" or "dict" depending on the collection's top-level JSON type."""
+        if self.is_sharded:
+            return self.index()["container"]
+        with open(self.file_path, "r") as f:
+            return "list" if _StreamReader(f).peek() == "[" else "dict"
+
+    def _iter_file(self, path, container):
+        with open(path, "r") as f:
+            if container == "list":
+                for entry in iter_json_array(f):
+                    yield entry.get("id") if isinstance(entry, dict) else None, entry
+            else:
+                yield from iter_json_object(f)
+
+    def iter_items(self):
+        """Streams (id, entry) pairs in collection order."""
+        container = self.container()
+        if not self.is_sharded:
+            yield from self._iter_file(self.file_path, container)
+            return
+        for shard in self.index()["shards"]:
+            yield from self._iter_file(os.path.join(self.shard_dir, shard), container)
+
+    def iter_entries(self):
+        """Streams entries in collection order."""
+        for _, entry in self.iter_items():
+            yield entry
+
+    def load(self):
+        """Loads the whole collection as a list (or dict for dialogues)."""
+        if self.container() == "list":
+            return list(self.iter_entries())
+        return dict(self.iter_items())
+
+    def get(self, entry_id):
+        """Returns a single entry, reading only its shard when sharded."""
+        if self.is_sharded:
+            shard_number = self.index()["ids"].get(entry_id)
+            if shard_number is None:
+                return None
+            items = self._iter_file(os.path.join(self.shard_dir, self.index()["shards"][shard_number]),
+                                    self.container())
+        else:
+            items = self.iter_items()
+        for item_id, entry in items:
+            if item_id == entry_id:
+                return entry
+        return None
+
+    def patch(self, updates):
+        """
+        Applies field-level changes to existing entries.
+
+        Args:
+          updates: {entry_id: {json_key: new_value}}.
+
+        Returns:
+          The number of entries changed. Unknown ids are reported and skipped.
+        """
+        if not updates:
+            return 0
+        container = self.container()
+        changed = 0
+        shards_written = 0
+
+        if not self.is_sharded:
+            def patched_items():
+                nonlocal changed
+                for item_id, entry in self.iter_items():
+                    if item_id in updates:
+                        entry = _apply_changes(entry, updates[item_id])
+                        changed += 1
+                    yield item_id, entry
+            _atomic_write(self.file_path, container, patched_items())
+        else:
+            by_shard = {}
+            for entry_id, changes in updates.items():
+                shard_number = self.index()["ids"].get(entry_id)
+                if shard_number is not None:
+                    by_shard.setdefault(shard_number, {})[entry_id] = changes
+            for shard_number, shard_updates in sorted(by_shard.items()):
+                shard_path = os.path.join(self.shard_dir, self.index()["shards"][shard_number])
+                items = [(item_id, _apply_changes(entry, shard_updates[item_id]) if item_id in shard_updates else entry)
+                         for item_id, entry in self._iter_file(shard_path, container)]
+                _atomic_write(shard_path, container, items)
+                changed += len(shard_updates)
+                shards_written += 1
+
+        if changed < len(updates):
+            print(f"WARNING: {len(updates) - changed} of {len(updates)} updates to {self.filename} matched no entry.")
+        if self.is_sharded:
+            print(f"INFO: Patched {changed} entries in {self.filename} ({shards_written} shard(s) rewritten).")
+        else:
+            print(f"INFO: Patched {changed} entries in {self.filename}.")
+        return changed
+
+    def shard(self, shard_size=DEFAULT_SHARD_SIZE):
+        """Converts a single-file collection to the sharded layout and removes the single file."""
+        if self.is_sharded:
+            print(f"INFO: {self.filename} is already sharded in {self.shard_dir}.")
+            return
+        container = self.container()
+        os.makedirs(self.shard_dir, exist_ok=True)
+        index = {"container": container, "shardSize": shard_size, "shards": [], "ids": {}}
+
+        batch = []
+        def flush():
+            shard_name = f"{self.name}-{len(index['shards']):05d}.json"
+            _atomic_write(os.path.join(self.shard_dir, shard_name), container, batch)
+            for item_id, _ in batch:
+                index["ids"][item_id] = len(index["shards"])
+            index["shards"].append(shard_name)
+            batch.clear()
+
+        for item in self.iter_items():
+            batch.append(item)
+            if len(batch) >= shard_size:
+                flush()
+        if batch or not index["shards"]:
+            flush()
+
+        with open(self.index_path, "w") as f:
+            json.dump(index, f, indent=2)
+        os.remove(self.file_path)
+        self._index = index
+        print(f"SUCCESS: Sharded {self.filename} into {len(index['shards'])} shard(s) in {self.shard_dir}.")
+
+    def unshard(self):
+        """Converts a sharded collection back to a single file and removes the shards."""
+        if not self.is_sharded:
+            print(f"INFO: {self.filename} is not sharded.")
+            return
+        index = self.index()
+        _atomic_write(self.file_path, index["container"], self.iter_items())
+        for shard in index["shards"]:
+            os.remove(os.path.join(self.shard_dir, shard))
+        os.remove(self.index_path)
+        if not os.listdir(self.shard_dir):
+            os.rmdir(self.shard_dir)
+        self._index = None
+        print(f"SUCCESS: Joined {len(index['shards'])} shard(s) back into {self.file_path}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert data files between the single-file and sharded layouts.')
+    parser.add_argument('--data-dir', type=str, default=DEFAULT_DATA_DIR, help='Data directory. Default: www/data.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    shard_parser = subparsers.add_parser('shard', help='Split a data file into shards plus an index.')
+    shard_parser.add_argument('filename', type=str, help='Data file name, e.g. npcs.json.')
+    shard_parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help='Entries per shard.')
+    unshard_parser = subparsers.add_parser('unshard', help='Join a sharded data file back into one file.')
+    unshard_parser.add_argument('filename', type=str, help='Data file name, e.g. npcs.json.')
+    args = parser.parse_args()
+
+    store = DataStore(args.filename, data_dir=args.data_dir)
+    if args.command == 'shard':
+        store.shard(args.shard_size)
+    else:
+        store.unshard()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,33 @@
 import json
 import os
-import random
 import time
 import argparse
 from io import BytesIO
 
-from PIL import Image
-from google.api_core.exceptions import GoogleAPIError
+from PIL import Image, ImageDraw, ImageFilter
 from google import genai
 from google.genai import types
 
-# --- Configuration ---
+from generation_scheduler import GenerationBudget, add_budget_arguments
+from world_model import load_world
+from cassettes import add_cassette_arguments, make_client
+from client_pool import add_client_pool_arguments
+from provenance import ProvenanceStore
+from image_pipeline import ImageJob, fetch_image
+from model_profiles import CANDIDATE_MODELS, add_model_arguments, model_from_args
 
-# List of all Points of Interest to include in the map
-# (As determined from previous interactions based on pois.json)
-ALL_POIS = [
-    "Mystic Forest Entrance", "Abandoned Mine Shaft", "Smuggler's Cove", "Sunken Shipwreck",
-    "Pirate Outpost", "Port Royal Market", "Volcano Island", "Hidden Lagoon", "Tortuga Town",
-    "Kraken's Abyss", "Cursed Galleon Graveyard", "Mermaid's Rock", "Blackbeard's Hidden Cache",
-    "Stormy Cape of No Return", "Davy Jones' Locker Entrance", "Cannibal Island",
-    "Smuggler's Secret Strait", "Treasure Fleet Wreckage Site", "Fort Caroline Ruins",
-    "Ship-Trap Island", "Marooner's Rock", "The Leviathan's Ribcage", "Coral Reef Labyrinth",
-    "Skeleton Key Islet", "The Barnacle Bank", "Ghost Ship Anchorage", "Sea Serpent's Pass",
-    "Dead Man's Chest Island", "Rum Runner's Rendezvous", "Spyglass Hill", "Mutineer's Gallows",
-    "Buried Doubloon Beach", "Captain's Quarrel Cove", "Lagoon Trader's Rest",
-    "Serpent's Spine Pass", "Hidden Falls Cache", "Port Aurora"
-]
+# --- Configuration ---
 
 TARGET_WIDTH = 1280
 TARGET_HEIGHT = 900
 #API_ASPECT_RATIO = "4:3" # Standard aspect ratio to request from API
 
-# Models to try for generation
-# You can add more Imagen model IDs here
-MODEL_IDS_TO_TRY = [
-    "imagen-3.0-fast-generate-001",
-    "imagen-3.0-generate-001",
-    "imagen-3.0-generate-002",
-    "imagen-4.0-generate-preview-05-20",
-    "imagen-4.0-generate-002",
-    "imagegeneration@006", 
-    #"imagegeneration@005",
-    #"imagegeneration@002"
-    ]
+# Models tried with --all-models. Otherwise the fastest acceptable one is
+# picked from the measured profiles (see model_profiles.py).
+MODEL_IDS_TO_TRY = CANDIDATE_MODELS["map"]
+MAP_VERSIONS = 4 # Versions generated per model (v1, v2, ...)
+BASE_MAP_FILENAME = "game_archipelago_map"
+MAP_COOLDOWN_SECONDS = 5 # Pause after each saved map
 
 def generate_map_prompt_text(poi_list):
     """
@@ -65,106 +50,381 @@ def generate_map_prompt_text(poi_list):
     )
     return prompt
 
-def generate_and_save_map(client, model_name, prompt_text, maps_output_dir, base_filename, version_suffix=""):
+def map_output_filename(base_filename, model_name, version_suffix=""):
+    """Returns the file name a map version generated with a model is saved under."""
+    # Sanitize model_name for use in filename
+    safe_model_name = model_name.replace("/", "_").replace(":", "_")
+    return f"{base_filename}_{safe_model_name}{version_suffix}.jpg"
+
+def map_request_config():
+    return types.GenerateImagesConfig(
+        number_of_images=1,
+        include_rai_reason=True,
+        output_mime_type='image/jpeg', # Using JPEG
+    )
+
+def plan_map_jobs(world, maps_output_dir, model_ids, base_filename=BASE_MAP_FILENAME, versions=MAP_VERSIONS):
+    """
+    Resolves the map versions still missing for each model, without making any API request.
+
+    Returns:
+      A list of (version_suffix, job) tuples, where job is an
+      image_pipeline.ImageJob describing the request generate_and_save_map
+      makes. Versions whose file already exists are left out.
+    """
+    poi_names = [poi.name for poi in world.pois if poi.name]
+    if not poi_names:
+        return []
+    prompt_text = generate_map_prompt_text(poi_names)
+    planned = []
+    for model_id in model_ids:
+        for i in range(1, versions + 1):
+            version_suffix = f"_v{i}"
+            full_image_path = os.path.join(maps_output_dir, map_output_filename(base_filename, model_id, version_suffix))
+            if os.path.exists(full_image_path):
+                continue
+            planned.append((version_suffix, ImageJob(
+                f"map {model_id} (Version: {version_suffix})", "map", prompt_text, model_id, map_request_config(),
+                full_image_path, (TARGET_WIDTH, TARGET_HEIGHT),
+            )))
+    return planned
+
+def generate_and_save_map(client, model_name, prompt_text, maps_output_dir, base_filename, version_suffix="", budget=None,
+                          provenance=None):
     """
     Generates a map using the specified model and saves it.
     Adds a version_suffix to the filename if provided.
+    Makes no API request once the optional GenerationBudget is exhausted.
+    The prompt and settings are recorded in the ProvenanceStore.
     """
+    if budget is None:
+        budget = GenerationBudget()
+    if provenance is None:
+        provenance = ProvenanceStore()
     print(f"\n--- Attempting generation with model: {model_name} (Version: {version_suffix or 'default'}) ---")
     
-    # Sanitize model_name for use in filename
-    safe_model_name = model_name.replace("/", "_").replace(":", "_")
-    output_image_filename = f"{base_filename}_{safe_model_name}{version_suffix}.jpg"
-    output_prompt_filename = f"{base_filename}_{safe_model_name}{version_suffix}_prompt.txt"
-    
-    full_image_path = os.path.join(maps_output_dir, output_image_filename)
-    full_prompt_path = os.path.join(maps_output_dir, output_prompt_filename)
+    full_image_path = os.path.join(maps_output_dir, map_output_filename(base_filename, model_name, version_suffix))
 
     if os.path.exists(full_image_path):
         print(f"INFO: Map for model {model_name} already exists at {full_image_path}. Skipping.")
         return
+
+    if budget.exhausted():
+        print(f"INFO: Skipping map for model {model_name} (Version: {version_suffix or 'default'}): {budget.exhausted()}.")
+        return
     
-    print(f"INFO: Generating map with prompt: {prompt_text[:200]}... (full prompt in {output_prompt_filename})")
-
-    max_retries = 3
-    base_delay_seconds = 10 # Increased base delay for potentially larger image generation
-    response = None
-
-    for attempt in range(max_retries):
-        try:
-            response = client.models.generate_images(
-                model=model_name,
-                prompt=prompt_text,
-                #aspect_ratio=API_ASPECT_RATIO,
-                config=types.GenerateImagesConfig(
-                    number_of_images=1,
-                    include_rai_reason=True,
-                    output_mime_type='image/jpeg', # Using JPEG
-                )
-            )
-            break # Success
-        except GoogleAPIError as e:
-            is_rate_limit_error = ("429" in str(e) and "RESOURCE_EXHAUSTED" in str(e)) or \
-                                  (hasattr(e, 'code') and e.code == 429)
-            if is_rate_limit_error and attempt < max_retries - 1:
-                delay = base_delay_seconds * (2 ** attempt)
-                jitter = random.uniform(0, 0.1 * delay)
-                actual_delay = delay + jitter
-                print(f"WARNING: Rate limit hit for model {model_name}. Retrying in {actual_delay:.2f} seconds (attempt {attempt + 1}/{max_retries}). Error: {e}")
-                time.sleep(actual_delay)
-            else:
-                print(f"ERROR: Failed to generate map with {model_name} due to Google API Error (attempt {attempt + 1}/{max_retries}). Error: {e}")
-                response = None
+    print(f"INFO: Generating map with prompt: {prompt_text[:200]}...")
+
+    request_config = map_request_config()
+    job = ImageJob(f"map with {model_name} (Version: {version_suffix or 'default'})", "map", prompt_text, model_name,
+                   request_config, full_image_path, (TARGET_WIDTH, TARGET_HEIGHT))
+    image_bytes_to_save, request_latency = fetch_image(client, job, budget)
+    if image_bytes_to_save is None:
+        return
+
+    try:
+        img = Image.open(BytesIO(image_bytes_to_save))
+        print(f"INFO: Original image size from {model_name}: {img.size}")
+
+        # Resize to target dimensions
+        img_resized = img.resize((TARGET_WIDTH, TARGET_HEIGHT), Image.Resampling.LANCZOS)
+        img_resized.save(full_image_path, "JPEG", quality=90)
+
+        provenance.record(full_image_path, "map", prompt_text, model=model_name,
+                          config=request_config, latency=request_latency)
+        provenance.flush()
+
+        print(f"SUCCESS: Generated and saved map for {model_name} (Version: {version_suffix or 'default'}) to {full_image_path} (resized to {TARGET_WIDTH}x{TARGET_HEIGHT})")
+
+        # Wait a bit before the next model or if in a loop for multiple maps
+        # This is a general courtesy for APIs.
+        print(f"INFO: Waiting for {MAP_COOLDOWN_SECONDS} seconds before next operation...")
+        time.sleep(MAP_COOLDOWN_SECONDS)
+
+    except ImportError:
+        print("ERROR: Pillow (PIL) or io library might be missing. Please ensure 'Pillow' is installed. Cannot save image.")
+    except Exception as e:
+        print(f"ERROR: Failed to save image from {model_name}. Error: {e}")
+
+# --- Incremental Map Updates ---
+
+# The map the game shows, and the coordinate space of each POI's x/y
+# (pixels on that map as laid out by map-view.js).
+GAME_MAP_PATH = os.path.join("www", "assets", "images", "mapv1.jpg")
+MAP_COORDINATE_SIZE = (1280, 896)
+# Records which POIs each map already shows, so only the differences are repainted.
+MAP_STATE_DIR = os.path.join("provenance", "maps")
+
+# Inpainting needs an Imagen model with editing capability (Vertex AI).
+EDIT_MODEL_ID = "imagen-3.0-capability-001"
+TILE_SIZE = 128 # Repainted regions are snapped to this grid
+POI_RADIUS = 64 # Radius in map pixels repainted around a changed POI
+FEATHER_RADIUS = 12 # Blur applied to the mask edge when blending a region back in
+
+
+def map_state_path(project_root_path, map_path):
+    name = os.path.splitext(os.path.basename(map_path))[0]
+    return os.path.join(project_root_path, MAP_STATE_DIR, f"{name}.json")
+
+
+def _map_state_entry(poi):
+    return {"name": poi.name, "x": poi.x, "y": poi.y}
+
+
+def load_map_state(state_path):
+    """Returns {"pois": {poi_id: {"name", "x", "y"}}} for a map, or None if it has no state yet."""
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, "r") as f:
+        return json.load(f)
+
+
+def save_map_state(state_path, state):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    state["pois"] = dict(sorted(state["pois"].items()))
+    with open(state_path, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def diff_map_pois(state, pois):
+    """
+    Compares the POIs a map shows with the current POIs.
+
+    Args:
+      state: The map's state from load_map_state.
+      pois: The current Poi records.
+
+    Returns:
+      A list of sites to repaint as (action, poi_id, entry) tuples, where
+      action is "add" (paint the POI described by entry) or "clear" (paint
+      over the landmark previously drawn at entry's x/y).
+    """
+    painted = state.get("pois", {})
+    current = {poi.id: _map_state_entry(poi) for poi in pois if poi.x is not None and poi.y is not None}
+    sites = []
+    for poi_id, entry in painted.items():
+        moved = poi_id in current and (current[poi_id]["x"], current[poi_id]["y"]) != (entry["x"], entry["y"])
+        if poi_id not in current or moved:
+            sites.append(("clear", poi_id, entry))
+    for poi_id, entry in current.items():
+        if painted.get(poi_id) != entry:
+            sites.append(("add", poi_id, entry))
+    return sites
+
+
+def site_box(entry, scale, map_size):
+    """Returns the tile-aligned (left, top, right, bottom) box repainted for a site."""
+    center_x, center_y = entry["x"] * scale[0], entry["y"] * scale[1]
+    radius_x, radius_y = POI_RADIUS * scale[0], POI_RADIUS * scale[1]
+    left = max(0, int(center_x - radius_x) // TILE_SIZE * TILE_SIZE)
+    top = max(0, int(center_y - radius_y) // TILE_SIZE * TILE_SIZE)
+    right = min(map_size[0], -(-int(center_x + radius_x) // TILE_SIZE) * TILE_SIZE)
+    bottom = min(map_size[1], -(-int(center_y + radius_y) // TILE_SIZE) * TILE_SIZE)
+    return (left, top, right, bottom)
+
+
+def box_tile_count(box):
+    """Counts the map tiles a box covers, including the partial tiles at a clamped right or bottom edge."""
+    columns = -(-box[2] // TILE_SIZE) - box[0] // TILE_SIZE
+    rows = -(-box[3] // TILE_SIZE) - box[1] // TILE_SIZE
+    return columns * rows
+
+
+def _boxes_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def group_sites_into_regions(sites, scale, map_size):
+    """
+    Merges sites whose boxes overlap, so each region costs a single request.
+
+    Returns:
+      A list of (box, sites) pairs.
+    """
+    regions = [(site_box(site[2], scale, map_size), [site]) for site in sites]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                if _boxes_overlap(regions[i][0], regions[j][0]):
+                    box_a, sites_a = regions[i]
+                    box_b, sites_b = regions.pop(j)
+                    regions[i] = ((min(box_a[0], box_b[0]), min(box_a[1], box_b[1]),
+                                   max(box_a[2], box_b[2]), max(box_a[3], box_b[3])), sites_a + sites_b)
+                    merged = True
+                    break
+            if merged:
                 break
-        except Exception as e:
-            print(f"ERROR: An unexpected error occurred during API call for {model_name} (attempt {attempt + 1}/{max_retries}). Error: {e}")
-            response = None
-            break
+    return regions
 
-    if response:
-        image_bytes_to_save = None
-        if response.generated_images and response.generated_images[0].image:
-            image_bytes_to_save = response.generated_images[0].image.image_bytes
-        
-        if image_bytes_to_save:
-            try:
-                img = Image.open(BytesIO(image_bytes_to_save))
-                print(f"INFO: Original image size from {model_name}: {img.size}")
-                
-                # Resize to target dimensions
-                img_resized = img.resize((TARGET_WIDTH, TARGET_HEIGHT), Image.Resampling.LANCZOS)
-                img_resized.save(full_image_path, "JPEG", quality=90)
-                
-                with open(full_prompt_path, "w", encoding="utf-8") as f:
-                    f.write(prompt_text)
-
-                print(f"SUCCESS: Generated and saved map for {model_name} (Version: {version_suffix or 'default'}) to {full_image_path} (resized to {TARGET_WIDTH}x{TARGET_HEIGHT})")
-                print(f"SUCCESS: Saved prompt to {full_prompt_path}")
-
-                # Wait a bit before the next model or if in a loop for multiple maps
-                # This is a general courtesy for APIs.
-                print("INFO: Waiting for 5 seconds before next operation...")
-                time.sleep(5)
-
-            except ImportError: 
-                print("ERROR: Pillow (PIL) or io library might be missing. Please ensure 'Pillow' is installed. Cannot save image.")
-            except Exception as e:
-                print(f"ERROR: Failed to save image from {model_name}. Error: {e}")
-        elif hasattr(response, 'candidates') and response.candidates and \
-             not (response.candidates[0].content and response.candidates[0].content.parts): # Check for empty candidates
-             print(f"ERROR: Gemini API call for {model_name} (Version: {version_suffix or 'default'}) succeeded but returned no content parts. Candidate: {response.candidates[0]}")
-        else:
-            rai_reason = ""
-            if response.generated_images and response.generated_images[0].rai_reason:
-                rai_reason = f" RAI Reason: {response.generated_images[0].rai_reason.name}"
-            print(f"ERROR: Gemini API call for {model_name} (Version: {version_suffix or 'default'}) returned no image or an unexpected response after retries.{rai_reason} Response: {str(response)[:500]}")
+
+def generate_region_prompt_text(world, sites):
+    """Generates the inpainting prompt for one map region."""
+    additions = []
+    for action, poi_id, _ in sites:
+        poi = world.pois_by_id.get(poi_id)
+        if action == "add" and poi is not None:
+            additions.append(f"{poi.name} ({poi.description})" if poi.description else poi.name)
+    prompt = (
+        "Seamlessly repaint the masked area of this top-down fantasy pirate archipelago game map "
+        "in exactly the same rich, painterly style, colours and lighting as the surrounding map. "
+    )
+    if additions:
+        prompt += (
+            f"Within it, depict {'; '.join(additions)} using clear visual iconography or distinct "
+            f"environmental features, identifiable without text labels. "
+        )
     else:
-        print(f"INFO: No response received from API for model {model_name} (Version: {version_suffix or 'default'}) after retries.")
+        prompt += "Fill it with islands, terrain or sea that naturally continue the surroundings, with no landmark. "
+    prompt += "Negative prompts: no text, no words, no letters, no character figures, no people, no borders, no visible seams."
+    return prompt
+
+
+def _region_mask(box, sites, scale):
+    mask = Image.new("L", (box[2] - box[0], box[3] - box[1]), 0)
+    draw = ImageDraw.Draw(mask)
+    radius_x, radius_y = POI_RADIUS * scale[0], POI_RADIUS * scale[1]
+    for _, _, entry in sites:
+        center_x, center_y = entry["x"] * scale[0] - box[0], entry["y"] * scale[1] - box[1]
+        draw.ellipse((center_x - radius_x, center_y - radius_y, center_x + radius_x, center_y + radius_y), fill=255)
+    return mask
+
+
+def _encode_image(img, image_format):
+    buffer = BytesIO()
+    img.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def inpaint_map_region(client, map_image, box, sites, prompt_text, request_config, budget):
+    """
+    Repaints one region of the map in place.
+
+    Only the region is sent to the API, along with a mask covering the
+    changed sites. The result is blended back with a feathered mask so the
+    rest of the map is untouched.
+
+    Returns:
+      The latency of the successful request in seconds, or None on failure.
+    """
+    region = map_image.crop(box)
+    mask = _region_mask(box, sites, (map_image.width / MAP_COORDINATE_SIZE[0], map_image.height / MAP_COORDINATE_SIZE[1]))
+    reference_images = [
+        types.RawReferenceImage(
+            reference_id=1,
+            reference_image=types.Image(image_bytes=_encode_image(region, "PNG"), mime_type="image/png"),
+        ),
+        types.MaskReferenceImage(
+            reference_id=2,
+            reference_image=types.Image(image_bytes=_encode_image(mask, "PNG"), mime_type="image/png"),
+            config=types.MaskReferenceConfig(mask_mode="MASK_MODE_USER_PROVIDED", mask_dilation=0.03),
+        ),
+    ]
+
+    job = ImageJob(f"map region {box}", "map", prompt_text, EDIT_MODEL_ID, request_config, None, region.size,
+                   reference_images=reference_images)
+    image_bytes, request_latency = fetch_image(client, job, budget)
+    if image_bytes is None:
+        return None
+
+    painted = Image.open(BytesIO(image_bytes)).convert("RGB")
+    if painted.size != region.size:
+        painted = painted.resize(region.size, Image.Resampling.LANCZOS)
+    feathered_mask = mask.filter(ImageFilter.GaussianBlur(FEATHER_RADIUS))
+    map_image.paste(Image.composite(painted, region, feathered_mask), box[:2])
+    return request_latency
+
+
+def update_map_incrementally(client, world, project_root_path, map_path=None, budget=None, provenance=None,
+                             assume_current=False):
+    """
+    Repaints only the parts of the game map whose POIs were added, moved,
+    renamed or removed since the map was last updated.
+
+    Changed POIs are grouped into tile-aligned regions around their x/y; each
+    region is one inpainting request, and only those tiles of the map change.
+
+    Args:
+      client: The genai client.
+      world: The loaded WorldModel.
+      project_root_path: The project root.
+      map_path: The map image to update. Defaults to the map the game shows.
+      budget: Optional GenerationBudget limiting the requests made.
+      provenance: The ProvenanceStore to record each repainted region in.
+      assume_current: If the map has no state yet, record that it shows
+        every current POI instead of refusing to run.
+    """
+    if budget is None:
+        budget = GenerationBudget()
+    if provenance is None:
+        provenance = ProvenanceStore()
+    map_path = map_path or os.path.join(project_root_path, GAME_MAP_PATH)
+    state_path = map_state_path(project_root_path, map_path)
+    state = load_map_state(state_path)
+    if state is None:
+        if not assume_current:
+            print(f"ERROR: No record of which POIs {map_path} shows ({state_path} is missing). "
+                  "Re-run with --assume-current if the map already shows every POI in pois.json, "
+                  "so later runs repaint only what changes.")
+            return
+        state = {"pois": {poi.id: _map_state_entry(poi) for poi in world.pois if poi.x is not None and poi.y is not None}}
+        save_map_state(state_path, state)
+        print(f"INFO: Assuming {map_path} shows all {len(state['pois'])} current POIs. "
+              f"Saved to {state_path}; later runs repaint only what changes.")
+        return
+
+    sites = diff_map_pois(state, world.pois)
+    if not sites:
+        print(f"INFO: {map_path} already shows every POI in pois.json. Nothing to update.")
+        return
+
+    map_image = Image.open(map_path).convert("RGB")
+    scale = (map_image.width / MAP_COORDINATE_SIZE[0], map_image.height / MAP_COORDINATE_SIZE[1])
+    regions = group_sites_into_regions(sites, scale, map_image.size)
+    print(f"INFO: {len(sites)} POI change(s) to paint in {len(regions)} region(s) of {map_path}.")
+
+    request_config = types.EditImageConfig(
+        edit_mode="EDIT_MODE_INPAINT_INSERTION",
+        number_of_images=1,
+        include_rai_reason=True,
+        output_mime_type='image/jpeg',
+    )
+    current_ids = {poi.id for poi in world.pois}
+    updated_regions = []
+    for box, region_sites in regions:
+        prompt_text = generate_region_prompt_text(world, region_sites)
+        print(f"INFO: Repainting region {box} for {', '.join(sorted({poi_id for _, poi_id, _ in region_sites}))}...")
+        latency = inpaint_map_region(client, map_image, box, region_sites, prompt_text, request_config, budget)
+        if latency is None:
+            continue
+        updated_regions.append((box, prompt_text, latency))
+        for action, poi_id, entry in region_sites:
+            if action == "add":
+                state["pois"][poi_id] = entry
+            elif poi_id not in current_ids:
+                state["pois"].pop(poi_id, None)
+
+    if not updated_regions:
+        print("INFO: No map regions were updated.")
+        return
+
+    map_image.save(map_path, "JPEG", quality=90)
+    save_map_state(state_path, state)
+    for box, prompt_text, latency in updated_regions:
+        config = request_config.model_dump(mode="json", exclude_none=True)
+        config["region"] = list(box)
+        provenance.record(map_path, "map", prompt_text, model=EDIT_MODEL_ID, config=config, latency=latency)
+    provenance.flush()
+
+    tiles = sum(box_tile_count(box) for box, _, _ in updated_regions)
+    total_tiles = -(-map_image.width // TILE_SIZE) * -(-map_image.height // TILE_SIZE)
+    print(f"SUCCESS: Repainted {len(updated_regions)} of {len(regions)} region(s) ({tiles} of {total_tiles} tiles) in {map_path}.")
 
 
 def main():
     """
-    Main function to generate the game map using different models.
+    Main function to generate the game map with the selected model, or with every model for comparison.
     """
     # --- Path Setup ---
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -177,7 +437,22 @@ def main():
     parser = argparse.ArgumentParser(description='Generate a game map using Gemini/Imagen models.')
     parser.add_argument('--project_id', type=str, help='Google Cloud Project ID. Can also be set via GOOGLE_CLOUD_PROJECT env var.')
     parser.add_argument('--api_key', type=str, help='Google API Key. Can also be set via GOOGLE_API_KEY env var.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Repaint only the regions of the game map around POIs added, moved or removed since its last update, '
+                             'instead of generating whole new maps.')
+    parser.add_argument('--map', type=str, default=None,
+                        help=f'Map image to update with --incremental. Default: {GAME_MAP_PATH}.')
+    parser.add_argument('--assume-current', action='store_true',
+                        help='With --incremental, record a map that has no POI state yet as showing every current POI.')
+    parser.add_argument('--all-models', action='store_true',
+                        help='Generate versions with every model in MODEL_IDS_TO_TRY for comparison, '
+                             'instead of only the model picked from the measured profiles.')
+    add_budget_arguments(parser)
+    add_cassette_arguments(parser)
+    add_client_pool_arguments(parser)
+    add_model_arguments(parser)
     args = parser.parse_args()
+    budget = GenerationBudget.from_args(args)
 
     if args.api_key:
         os.environ['GOOGLE_API_KEY'] = args.api_key
@@ -193,12 +468,13 @@ def main():
     # --- Initialize Gemini Client ---
     try:
         # GOOGLE_API_KEY should be set in environment or via --api_key
-        if not os.getenv("GOOGLE_API_KEY") and not os.getenv("GOOGLE_GENAI_USE_VERTEXAI"):
+        if not os.getenv("GOOGLE_API_KEY") and not os.getenv("GOOGLE_GENAI_USE_VERTEXAI") and not args.replay \
+                and not args.client_pool:
              print("ERROR: GOOGLE_API_KEY not found as environment variable or via --api_key argument, "
                    "and GOOGLE_GENAI_USE_VERTEXAI is not set. Exiting.")
              return
         
-        client = genai.Client()
+        client = make_client(args, budget=budget)
         print("INFO: Gemini client initialized successfully.")
     except ImportError:
         print("ERROR: The 'google-generativeai' library is not installed. "
@@ -209,19 +485,36 @@ def main():
               "Ensure GOOGLE_API_KEY is set or Application Default Credentials are configured. Exiting.")
         return
 
+    if args.incremental:
+        update_map_incrementally(client, load_world(), project_root_path, map_path=args.map, budget=budget,
+                                 assume_current=args.assume_current)
+        return
+
     # --- Generate Prompt ---
-    map_prompt = generate_map_prompt_text(ALL_POIS)
+    # Every Point of Interest in pois.json is included in the map
+    poi_names = [poi.name for poi in load_world().pois if poi.name]
+    if not poi_names:
+        print("ERROR: Could not load any POIs from pois.json. Exiting.")
+        return
+    map_prompt = generate_map_prompt_text(poi_names)
 
-    # --- Generate Map with Different Models ---
-    base_map_filename = "game_archipelago_map"
+    # --- Generate Map with the Selected Model(s) ---
+    base_map_filename = BASE_MAP_FILENAME
 
-    if not MODEL_IDS_TO_TRY:
+    if args.all_models:
+        model_ids = MODEL_IDS_TO_TRY
+    else:
+        model_ids = [model_from_args(args, client, "map", budget)]
+    if not model_ids:
         print("INFO: No models specified in MODEL_IDS_TO_TRY. Nothing to generate.")
         return
 
-    for model_id in MODEL_IDS_TO_TRY:
+    for model_id in model_ids:
+        if budget.exhausted():
+            print(f"INFO: Stopping map generation: {budget.exhausted()}.")
+            break
         print(f"\n===== Processing Model: {model_id} =====")
-        for i in range(1, 5): # Generate 4 versions (v1, v2, v3, v4)
+        for i in range(1, MAP_VERSIONS + 1): # Generate versions v1, v2, ...
             version_suffix = f"_v{i}"
             generate_and_save_map(
                 client=client,
@@ -229,18 +522,21 @@ def main():
                 prompt_text=map_prompt,
                 maps_output_dir=maps_output_dir,
                 base_filename=base_map_filename,
-                version_suffix=version_suffix
+                version_suffix=version_suffix,
+                budget=budget
             )
             # The 5-second delay inside generate_and_save_map will apply between versions.
 
         # Delay between different models
-        current_model_index = MODEL_IDS_TO_TRY.index(model_id)
-        if current_model_index < len(MODEL_IDS_TO_TRY) - 1:
-            next_model_id = MODEL_IDS_TO_TRY[current_model_index + 1]
+        current_model_index = model_ids.index(model_id)
+        if current_model_index < len(model_ids) - 1:
+            next_model_id = model_ids[current_model_index + 1]
             print(f"INFO: Finished all versions for {model_id}. Waiting 10 seconds before trying the next model ({next_model_id})...")
             time.sleep(10)
         print(f"===== Finished Model: {model_id} =====")
 
+    if getattr(client, "summary", None):
+        print(f"INFO: Client pool usage: {client.summary()}")
     print("\n--- Map generation process finished. ---")
 
 if __name__ == "__main__":
@@ -1,39 +1,21 @@
-import json
 import os
 import random
-import time # Added for retry backoff and rate limiting
 import argparse # Added for command-line arguments
 # subprocess was not used
 # base64 is not needed for Gemini raw image bytes
 # from google.cloud import aiplatform # Replaced with google.generativeai
-from google.api_core.exceptions import GoogleAPIError
 
 # New imports for Gemini API
 from google import genai
 from google.genai import types
-from PIL import Image
-from io import BytesIO
 
-def load_location_data(filepath):
-  """
-  Loads location data from a JSON file.
-
-  Args:
-    filepath: The path to the JSON file.
-
-  Returns:
-    A list of location objects if successful, None otherwise.
-  """
-  try:
-    with open(filepath, 'r') as f:
-      data = json.load(f)
-    return data
-  except FileNotFoundError:
-    print(f"Error: File not found at {filepath}")
-    return None
-  except json.JSONDecodeError:
-    print(f"Error: Could not parse JSON data from {filepath}")
-    return None
+from generation_scheduler import GenerationBudget, add_budget_arguments, add_priority_arguments, rank_locations
+from cassettes import add_cassette_arguments, make_client
+from client_pool import add_client_pool_arguments
+from world_model import POIS_FILENAME, load_world
+from provenance import ProvenanceStore
+from image_pipeline import ImageJob, ImagePipeline, add_pipeline_arguments, pipeline_options_from_args
+from model_profiles import DEFAULT_MODELS, add_model_arguments, model_from_args
 
 def main():
   """
@@ -41,22 +23,27 @@ def main():
   """
   # File paths
   base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Assuming script is in 'scripts' dir
-  locations_filepath = os.path.join(base_path, "www", "data", "pois.json")
-  locations_file_to_save = locations_filepath # Save back to the same file
 
   # Load data
-  location_data = load_location_data(locations_filepath)
+  world = load_world()
 
-  if not location_data:
+  if not world.pois:
     print("Could not load location data. Exiting.")
     return
-  print(f"Successfully loaded {len(location_data)} locations. First location: {location_data[0].get('name', 'N/A')}")
+  print(f"Successfully loaded {len(world.pois)} locations. First location: {world.pois[0].name or 'N/A'}")
 
   # Argument parsing for project_id and api_key
   parser = argparse.ArgumentParser(description='Generate location images.')
   parser.add_argument('--project_id', type=str, help='Google Cloud Project ID')
   parser.add_argument('--api_key', type=str, help='Google API Key')
+  add_budget_arguments(parser)
+  add_priority_arguments(parser)
+  add_cassette_arguments(parser)
+  add_client_pool_arguments(parser)
+  add_pipeline_arguments(parser)
+  add_model_arguments(parser)
   args = parser.parse_args()
+  budget = GenerationBudget.from_args(args)
 
   # Set GOOGLE_API_KEY environment variable if --api_key is provided
   cmd_line_api_key = args.api_key
@@ -68,7 +55,7 @@ def main():
   if not project_id:
     project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
 
-  if not project_id:
+  if not project_id and not args.replay and not args.client_pool:
     print("ERROR: GOOGLE_CLOUD_PROJECT environment variable not set, and no --project_id argument provided. "
           "Location image generation will be skipped. Exiting.")
     return
@@ -82,62 +69,66 @@ def main():
   genai_use_vertex = os.getenv("GOOGLE_GENAI_USE_VERTEXAI")
   print(f"Using Vertex AI: {genai_use_vertex}")
 
-  if not api_key_to_use and not genai_use_vertex:
+  if not api_key_to_use and not genai_use_vertex and not args.replay and not args.client_pool:
       print("ERROR: GOOGLE_API_KEY not found as environment variable or via --api_key argument. Exiting.")
       return
 
-  # Generate images
-  print("Proceeding with image generation for locations...")
-  updated_locations = generate_images_for_locations(location_data, base_path)
+  try:
+    client = make_client(args, budget=budget)
+  except Exception as e:
+    print(f"ERROR: Failed to initialize Gemini Client: {e}. Exiting.")
+    return
 
-  if updated_locations:
-    print("Finished processing locations for image generation.")
-    if len(updated_locations) > 0 and updated_locations[0].get('gameViewImage') and "placeholder" not in updated_locations[0].get('gameViewImage', ''):
-        print(f"DEBUG: First location's updated image path: {updated_locations[0].get('gameViewImage')}")
-    elif len(updated_locations) > 0:
-        print(f"DEBUG: First location processed. Image path: {updated_locations[0].get('gameViewImage', 'Not set')}. Check logs for success/failure.")
+  # Rank locations so a limited budget is spent on the places players see first
+  generation_order = rank_locations(world, args.start_location)
 
-    if save_location_data(locations_file_to_save, updated_locations):
-      print(f"Location data with updated image paths saved to {locations_file_to_save}")
-    else:
-      print(f"Failed to save updated location data to {locations_file_to_save}")
+  # Pick the fastest acceptable model, re-measuring stale profiles first
+  model_name = model_from_args(args, client, "location", budget)
+
+  # Generate images
+  print("Proceeding with image generation for locations...")
+  generate_images_for_locations(world, base_path, generation_order=generation_order, budget=budget,
+                                client=client, pipeline_options=pipeline_options_from_args(args),
+                                model_name=model_name)
+
+  print("Finished processing locations for image generation.")
+  if getattr(client, "summary", None):
+    print(f"INFO: Client pool usage: {client.summary()}")
+  print(f"DEBUG: First location processed. Image path: {world.pois[0].game_view_image or 'Not set'}. Check logs for success/failure.")
+
+  if not world.has_changes():
+    print("No data changes to save.")
+  elif world.save_changes():
+    print(f"Location data with updated image paths saved to {world.path(POIS_FILENAME)}")
   else:
-    print("Image generation did not return updated location data. Not saving.")
+    print(f"Failed to save updated location data to {world.path(POIS_FILENAME)}")
 
-def save_location_data(filepath, location_data_list):
+def plan_location_jobs(world, project_root_path, generation_order=None, model_name=None):
   """
-  Saves the list of location data to a JSON file.
+  Resolves the image every location still needs, without making any API request.
 
-  Args:
-    filepath: The path to the JSON file.
-    location_data_list: The list of location objects to save.
-
-  Returns:
-    True if saving was successful, False otherwise.
-  """
-  try:
-    with open(filepath, 'w') as f:
-      json.dump(location_data_list, f, indent=2)
-    print(f"Successfully saved updated location data to {filepath}")
-    return True
-  except IOError as e:
-    print(f"ERROR: Could not write location data to {filepath}. Error: {e}")
-    return False
-  except Exception as e: # Catch any other potential errors during save
-    print(f"ERROR: An unexpected error occurred while saving location data to {filepath}. Error: {e}")
-    return False
-
-def generate_images_for_locations(locations_data_list, project_root_path):
-  """
-  Generates images for locations using the Gemini API.
+  Each missing image gets its final prompt here (with the seed that picked
+  its parts), so generate_images_for_locations and generation_plan.py build
+  identical jobs.
 
   Args:
-    locations_data_list: A list of location data dictionaries.
+    world: A world_model.WorldModel with the POI data.
     project_root_path: The absolute path to the project's root directory.
+    generation_order: Indexes into world.pois in the order to process them.
+      Defaults to file order.
+    model_name: The image model to use. Defaults to the asset class's
+      model_profiles.DEFAULT_MODELS entry.
+
+  Returns:
+    A list of (location, full_image_path, relative_image_path, job) tuples
+    in generation order. job is an image_pipeline.ImageJob, or None when the
+    image already exists.
   """
-  updated_locations_data_list = []
+  if generation_order is None:
+    generation_order = range(len(world.pois))
+  if model_name is None:
+    model_name = DEFAULT_MODELS["location"]
   locations_dir = os.path.join(project_root_path, "www", "assets", "images", "locations")
-  os.makedirs(locations_dir, exist_ok=True)
 
   # --- Location Themed Prompts ---
   setting_prompts = [ # General ambiance, could be combined or used to guide
@@ -168,48 +159,22 @@ def generate_images_for_locations(locations_data_list, project_root_path):
       "Stylized realism, similar to high-end video game environments, with rich detail, dynamic lighting, and a strong sense of place.",
       "A slightly fantastical and romanticized depiction, emphasizing the allure and danger of pirate legends."
   ]
-  try:
-    # Configure the Gemini client using API Key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key and not os.getenv("GOOGLE_GENAI_USE_VERTEXAI"):
-        print("ERROR: GOOGLE_API_KEY environment variable not set. Image generation will be skipped.")
-        return [loc.copy() for loc in locations_data_list]
-    client = genai.Client()
-    
-    # model_name should be the specific model identifier for image generation
-    # For example, 'gemini-pro-vision' can take image and text, but for pure image generation,
-    # an Imagen model is typically used. The script had "imagen-4.0-generate-preview-05-20".
-    # Let's assume this is a valid model for genai.GenerativeModel
-    #model_name = "imagen-4.0-generate-preview-05-20"
-    model_name = "imagen-3.0-fast-generate-001"
-
-
-  except ImportError:
-    print("ERROR: The 'google-generativeai' library is not installed. Please install it using 'pip install google-generativeai'.")
-    return [loc.copy() for loc in locations_data_list]
-  except Exception as e: # Catching broader exceptions during configuration or API key check
-    print(f"ERROR: Failed to configure Gemini or missing API Key: {e}")
-    # Ensure GOOGLE_API_KEY message is part of a more general error if needed,
-    # but the specific check above should handle the missing key.
-    return [loc.copy() for loc in locations_data_list]
 
-  for location in locations_data_list:
-    location_copy = location.copy() # Work with a copy
-    location_id = location_copy.get('id', 'unknown_location_id')
-    location_name = location_copy.get('name', 'Unknown Location')
-    location_description = location_copy.get('description', 'No description available.')
-    game_view_image = location_copy.get('gameViewImage', '')
+  planned = []
+  for location_index in generation_order:
+    location = world.pois[location_index]
+    location_id = location.id or 'unknown_location_id'
+    location_name = location.name or 'Unknown Location'
+    location_description = location.description or 'No description available.'
+    game_view_image = location.game_view_image or ''
 
     # Only process if gameViewImage contains 'placeholder_poi_'
     if '' not in game_view_image:
         print(f"INFO: Location {location_id} ({location_name}) does not use a placeholder image ('{game_view_image}'). Skipping generation.")
-        updated_locations_data_list.append(location_copy)
         continue
 
     image_filename = f"{location_id}_generated.jpg"
-    prompt_filename = f"{location_id}_prompt.txt"
     full_image_path = os.path.join(locations_dir, image_filename)
-    full_prompt_path = os.path.join(locations_dir, prompt_filename)
     # Relative path for JSON, assuming 'www' is the web root.
     # The original paths in pois.json are like "../www/assets/images/locations/placeholder_poi_1.jpg"
     # So, when saving the new path, it should match this structure from the perspective of the pois.json file.
@@ -223,120 +188,104 @@ def generate_images_for_locations(locations_data_list, project_root_path):
 
 
     if os.path.exists(full_image_path):
+        planned.append((location, full_image_path, relative_image_path, None))
+        continue
+
+    prompt_seed = random.randrange(2 ** 32) # Recorded so the prompt can be reproduced
+    prompt_rng = random.Random(prompt_seed)
+    selected_subject_template = prompt_rng.choice(subject_detail_prompts)
+    selected_style = prompt_rng.choice(style_prompts)
+    # Optional: Add a setting prompt for more variety if desired
+    # selected_setting = prompt_rng.choice(setting_prompts).format(location_type=location.icon or 'island') # Use icon as a hint for type
+
+    subject_text = selected_subject_template.format(location_name=location_name, location_description=location_description)
+    # prompt_text = f"{selected_setting}. {subject_text}. {selected_style}."
+    prompt_text = f"{subject_text}. {selected_style}."
+    prompt_text += " No text, no words, no letters, no characters, no people, no animals, no ships, no boats unless explicitly part of the location's description. Focus on the environment and atmosphere."
+
+    request_config = types.GenerateImagesConfig(
+      number_of_images=1,
+      personGeneration="allow_all",
+      include_rai_reason=True,
+      output_mime_type='image/jpeg',
+    )
+    planned.append((location, full_image_path, relative_image_path, ImageJob(
+        f"{location_id} ({location_name})", "location", prompt_text, model_name, request_config,
+        full_image_path, (1024, 1024), seed=prompt_seed,
+        on_saved=lambda location=location, path=relative_image_path: world.update(location, "game_view_image", path),
+    )))
+  return planned
+
+def generate_images_for_locations(world, project_root_path, generation_order=None, budget=None, client=None,
+                                  provenance=None, pipeline_options=None, model_name=None):
+  """
+  Generates images for locations using the Gemini API.
+
+  Updates each POI record's game_view_image through world.update().
+
+  Args:
+    world: A world_model.WorldModel with the POI data.
+    project_root_path: The absolute path to the project's root directory.
+    generation_order: Indexes into world.pois in the order to process them
+      (see generation_scheduler.rank_locations). Defaults to file order.
+    budget: A GenerationBudget limiting API requests. Defaults to unlimited.
+    client: The genai client (or cassette stand-in) to use. Defaults to a
+      new genai.Client().
+    provenance: The ProvenanceStore recording how each image was made.
+      Defaults to the project's store.
+    pipeline_options: Keyword arguments for the image_pipeline.ImagePipeline
+      that fetches, resizes and saves the images concurrently.
+    model_name: The image model to use. Defaults to the asset class's
+      model_profiles.DEFAULT_MODELS entry.
+  """
+  if budget is None:
+    budget = GenerationBudget()
+  if provenance is None:
+    provenance = ProvenanceStore()
+  locations_dir = os.path.join(project_root_path, "www", "assets", "images", "locations")
+  os.makedirs(locations_dir, exist_ok=True)
+
+  try:
+    # Configure the Gemini client using API Key
+    if client is None:
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key and not os.getenv("GOOGLE_GENAI_USE_VERTEXAI"):
+            print("ERROR: GOOGLE_API_KEY environment variable not set. Image generation will be skipped.")
+            return
+        client = genai.Client()
+
+  except ImportError:
+    print("ERROR: The 'google-generativeai' library is not installed. Please install it using 'pip install google-generativeai'.")
+    return
+  except Exception as e: # Catching broader exceptions during configuration or API key check
+    print(f"ERROR: Failed to configure Gemini or missing API Key: {e}")
+    # Ensure GOOGLE_API_KEY message is part of a more general error if needed,
+    # but the specific check above should handle the missing key.
+    return
+
+  pipeline = ImagePipeline(client, budget=budget, provenance=provenance, **(pipeline_options or {}))
+  for location, full_image_path, relative_image_path, job in plan_location_jobs(world, project_root_path,
+                                                                               generation_order, model_name):
+    location_id = location.id or 'unknown_location_id'
+    location_name = location.name or 'Unknown Location'
+
+    if job is None:
         print(f"INFO: Image for {location_id} ({location_name}) already exists at {full_image_path}. Skipping generation.")
-        location_copy['gameViewImage'] = relative_image_path
+        world.update(location, "game_view_image", relative_image_path)
+    elif budget.exhausted():
+        print(f"INFO: Skipping image for {location_id} ({location_name}): {budget.exhausted()}.")
     else:
+        print(f"INFO: Generating image for {location_id} ({location_name}) with prompt: {job.prompt}")
+        # The API call, resize and save run in the pipeline's stages, so the
+        # next location's request starts while this image is still being processed.
         try:
-            selected_subject_template = random.choice(subject_detail_prompts)
-            selected_style = random.choice(style_prompts)
-            # Optional: Add a setting prompt for more variety if desired
-            # selected_setting = random.choice(setting_prompts).format(location_type=location_copy.get('icon', 'island')) # Use icon as a hint for type
-
-            subject_text = selected_subject_template.format(location_name=location_name, location_description=location_description)
-            # prompt_text = f"{selected_setting}. {subject_text}. {selected_style}."
-            prompt_text = f"{subject_text}. {selected_style}."
-            prompt_text += " No text, no words, no letters, no characters, no people, no animals, no ships, no boats unless explicitly part of the location's description. Focus on the environment and atmosphere."
-
-
-            print(f"INFO: Generating image for {location_id} ({location_name}) with prompt: {prompt_text}")
-
-            max_retries = 3
-            base_delay_seconds = 5
-            response = None
-
-            for attempt in range(max_retries):
-                try:
-                    # Using the instantiated model to generate content (image)
-                    # The prompt is passed directly.
-                    # For image generation models, the response structure needs to be handled carefully.
-                    # Assuming the model.generate_content(prompt) for an Imagen model returns a response
-                    # where the image data can be extracted. This might need adjustment based on actual API.
-                    # The previous code expected response.generated_images[0].image.image_bytes
-                    # For GenerativeModel, it's usually response.parts[0].inline_data.data (for raw bytes) or similar.
-                    # Or, if it's a specialized image generation function on the model, it might differ.
-                    # Let's try with generate_content and then inspect the response.
-                    # It's also possible that the model expects a list of Parts, not just a string prompt.
-                    response = client.models.generate_images(
-                        model=model_name,
-                        prompt=prompt_text,
-                        config=types.GenerateImagesConfig(
-                          number_of_images=1,
-                          personGeneration="allow_all",
-                          include_rai_reason=True,
-                          output_mime_type='image/jpeg',
-                      )
-                    )
-
-                    # IMPORTANT: The response structure from model.generate_content for an Imagen model
-                    # might not be `response.generated_images`. It's more likely to be in `response.parts`.
-                    # This part will likely need refinement after seeing the actual response or error.
-                    # For now, let's assume a structure that MIGHT work or will fail informatively.
-                    break
-                except GoogleAPIError as e:
-                    is_rate_limit_error = ("429" in str(e) and "RESOURCE_EXHAUSTED" in str(e)) or \
-                                          (hasattr(e, 'code') and e.code == 429)
-                    if is_rate_limit_error and attempt < max_retries - 1:
-                        delay = base_delay_seconds * (2 ** attempt)
-                        jitter = random.uniform(0, 0.1 * delay)
-                        actual_delay = delay + jitter
-                        print(f"WARNING: Rate limit hit for {location_id} ({location_name}). Retrying in {actual_delay:.2f} seconds (attempt {attempt + 1}/{max_retries}). Error: {e}")
-                        time.sleep(actual_delay)
-                    else:
-                        print(f"ERROR: Failed to generate image for {location_id} ({location_name}) due to Google API Error (attempt {attempt + 1}/{max_retries}). Error: {e}")
-                        response = None
-                        break
-                except Exception as e:
-                    print(f"ERROR: An unexpected error occurred during API call for {location_id} ({location_name}) (attempt {attempt + 1}/{max_retries}). Error: {e}")
-                    response = None
-                    break
-
-            if response:
-                image_bytes_to_save = None
-                # Standard way to get image bytes, as seen in generate_portraits.py
-                # Ensure generated_images list exists, is not empty,
-                # the first image object exists, and it contains image data.
-                if (response.generated_images and
-                    len(response.generated_images) > 0 and
-                    response.generated_images[0].image):
-                    image_bytes_to_save = response.generated_images[0].image.image_bytes
-
-                if image_bytes_to_save:
-                    try:
-                        img = Image.open(BytesIO(image_bytes_to_save))
-                        img = img.resize((1024, 1024)) # Resize to 1024x1024
-                        img.save(full_image_path, "JPEG") # Save as JPEG
-
-                        with open(full_prompt_path, "w") as f:
-                            f.write(prompt_text)
-
-                        print(f"SUCCESS: Generated and saved image and prompt for {location_id} ({location_name}) to {full_image_path} and {full_prompt_path}")
-                        location_copy['gameViewImage'] = relative_image_path
-                        print(f"DEBUG: Location {location_id} gameViewImage updated to: {relative_image_path}")
-
-                        # Crucial: Wait for 10 seconds after each successful generation
-                        print(f"INFO: Waiting for 10 seconds before processing next location to respect API rate limits...")
-                        time.sleep(10)
-
-                    except ImportError:
-                        print("ERROR: Pillow or io library might be missing. Please ensure 'Pillow' is installed ('pip install Pillow'). Cannot save image.")
-                    except Exception as e:
-                        print(f"ERROR: Failed to save image for {location_id} ({location_name}). Error: {e}")
-                # Mimic error handling from generate_portraits.py for consistency
-                # Note: GenerateImagesResponse doesn't typically have 'candidates'. This 'elif' might be based on a different response type.
-                # Adding hasattr for safety, though generate_portraits.py doesn't have it.
-                elif hasattr(response, 'candidates') and response.candidates and \
-                     not (response.candidates[0].content and response.candidates[0].content.parts):
-                     print(f"ERROR: Gemini API call succeeded for {location_id} ({location_name}) but returned no content parts. Candidate: {response.candidates[0]}")
-                else:
-                    print(f"ERROR: Gemini API call for {location_id} ({location_name}) returned no image or an unexpected response after retries: {response}")
-
-
+            pipeline.submit(job)
         except Exception as e:
             print(f"ERROR: An unexpected error occurred while generating image for {location_id} ({location_name}). Error: {e}")
 
-    updated_locations_data_list.append(location_copy)
-
-  return updated_locations_data_list
+  pipeline.close()
+  print(f"INFO: Saved {pipeline.saved} new image(s); {pipeline.failed} could not be generated.")
+  provenance.flush()
 
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -0,0 +1,498 @@
+"""
+Plan image generation up front, then apply exactly that plan.
+
+`plan` resolves every pending portrait, location and map job with the same
+code the generators use (final prompt, prompt seed, target path, model and
+request config) without making any API request, groups the jobs into batches
+of one kind and model, and writes them to a plan file with predictions:
+
+  requests  One per job (retries after rate limiting are not included).
+  duration  Each batch's requests times the expected latency of its model:
+            the median latency recorded in the provenance log for that model
+            and kind, else the model profile's p50 (see model_profiles.py),
+            else DEFAULT_LATENCY_SECONDS. Portrait and location requests run
+            --fetch-workers at a time; maps run one at a time, with a pause
+            after each.
+  cost      PRICE_PER_IMAGE_USD per job. Models without a price are listed.
+
+Batches are spread over --workers so that each worker's predicted time is
+about the same. Model selection uses the stored profiles as they are, even
+when stale, because planning never calls the API. A plan is only written
+(and only applied) if every job's request config rebuilds into the same
+GenerateImagesConfig, so a bad config fails at planning time.
+
+`apply` runs the jobs of a plan file and nothing else. With --worker I it
+runs only the batches assigned to worker I, so a plan made with --workers N
+can be applied by N processes (or machines sharing the tree) at once. Jobs
+whose image already exists are skipped, so an interrupted apply can simply
+be re-run. Each worker finishes by pointing npcs.json / pois.json at every
+image of the plan that exists by then, holding a lock file in www/data
+while it reloads and saves them, so the last worker to finish leaves the
+data files complete.
+
+Usage:
+  python scripts/generation_plan.py plan [--kind portrait] [--workers 2] [--output PLAN_FILE]
+  python scripts/generation_plan.py show PLAN_FILE
+  python scripts/generation_plan.py apply PLAN_FILE [--worker 0] [--max-requests 50]
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+
+from google.genai import types
+
+from cassettes import add_cassette_arguments, make_client
+from client_pool import add_client_pool_arguments
+from generate_game_map import BASE_MAP_FILENAME, MAP_COOLDOWN_SECONDS, MODEL_IDS_TO_TRY, generate_and_save_map, plan_map_jobs
+from generate_locations import plan_location_jobs
+from generate_portraits import plan_portrait_jobs
+from generation_scheduler import (GenerationBudget, add_budget_arguments, add_priority_arguments, rank_locations,
+                                  rank_npcs)
+from image_pipeline import (DEFAULT_FETCH_WORKERS, ImageJob, ImagePipeline, add_pipeline_arguments,
+                            pipeline_options_from_args)
+from model_profiles import PRICE_PER_IMAGE_USD, ModelProfileStore, add_model_arguments, model_from_args
+from provenance import ProvenanceStore
+from world_model import DEFAULT_DATA_DIR, load_world
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PLAN_PATH = os.path.join(PROJECT_ROOT, "plans", "generation_plan.json")
+PLAN_VERSION = 1
+KINDS = ("portrait", "location", "map")
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_LATENCY_SECONDS = 20.0
+MIN_LATENCY_SAMPLES = 3
+
+# Where apply records each finished image: {kind: (world attribute, record field)}.
+LINKED_FIELDS = {
+    "portrait": ("npcs_by_id", "portrait_image"),
+    "location": ("pois_by_id", "game_view_image"),
+}
+# Held while a worker links its images, so concurrent workers never interleave their data file saves.
+LINK_LOCK_PATH = os.path.join(DEFAULT_DATA_DIR, ".generation_plan.lock")
+LINK_LOCK_STALE_SECONDS = 300
+
+
+def _project_relative(path):
+    return os.path.relpath(os.path.abspath(path), PROJECT_ROOT).replace(os.sep, "/")
+
+
+def _job_entry(job, link=None, **extra):
+    """Converts an ImageJob to its JSON form in a plan file."""
+    config = job.config
+    if hasattr(config, "model_dump"):
+        config = config.model_dump(mode="json", exclude_none=True)
+    entry = {
+        "label": job.label,
+        "prompt": job.prompt,
+        "config": config,
+        "output_path": _project_relative(job.output_path),
+        "size": list(job.size),
+        "seed": job.seed,
+    }
+    if link is not None:
+        entry["link"] = link
+    entry.update(extra)
+    return entry
+
+
+def _request_config(config):
+    """Rebuilds a job's GenerateImagesConfig from its JSON form in a plan file."""
+    return types.GenerateImagesConfig.model_validate(config)
+
+
+def validate_plan(plan):
+    """
+    Checks that every job's config rebuilds into the GenerateImagesConfig it was planned with.
+
+    Returns:
+      A list of problems, one per bad job; empty if the plan can be applied.
+    """
+    problems = []
+    for batch in plan["batches"]:
+        for job in batch["jobs"]:
+            try:
+                config = _request_config(job["config"])
+            except ValueError as e:
+                problems.append(f"{job['label']}: invalid request config: {e}")
+                continue
+            rebuilt = config.model_dump(mode="json", exclude_none=True)
+            if rebuilt != job["config"]:
+                problems.append(f"{job['label']}: request config {job['config']} rebuilds as {rebuilt}")
+    return problems
+
+
+def _report_problems(problems):
+    for problem in problems:
+        print(f"ERROR: {problem}")
+    return bool(problems)
+
+
+def resolve_jobs(world, args):
+    """
+    Resolves every pending job of the requested kinds, without making any API request.
+
+    Returns:
+      {(kind, model): [job entry, ...]} in generation order.
+    """
+    store = ModelProfileStore()
+    resolved = {}
+    if "portrait" in args.kind:
+        model = model_from_args(args, None, "portrait", None, store=store, allow_refresh=False)
+        for npc, _, relative_path, job in plan_portrait_jobs(world, PROJECT_ROOT, rank_npcs(world, args.start_location),
+                                                             model):
+            if job is not None:
+                link = {"id": npc.id, "value": relative_path}
+                resolved.setdefault(("portrait", model), []).append(_job_entry(job, link))
+    if "location" in args.kind:
+        model = model_from_args(args, None, "location", None, store=store, allow_refresh=False)
+        for location, _, relative_path, job in plan_location_jobs(world, PROJECT_ROOT,
+                                                                  rank_locations(world, args.start_location), model):
+            if job is not None:
+                link = {"id": location.id, "value": relative_path}
+                resolved.setdefault(("location", model), []).append(_job_entry(job, link))
+    if "map" in args.kind:
+        if args.all_models:
+            models = MODEL_IDS_TO_TRY
+        else:
+            models = [model_from_args(args, None, "map", None, store=store, allow_refresh=False)]
+        maps_output_dir = os.path.join(PROJECT_ROOT, "www", "assets", "images", "game_maps")
+        for version_suffix, job in plan_map_jobs(world, maps_output_dir, models):
+            resolved.setdefault(("map", job.model), []).append(
+                _job_entry(job, base_filename=BASE_MAP_FILENAME, version_suffix=version_suffix))
+    return resolved
+
+
+def expected_latency(kind, model, provenance, profiles):
+    """
+    Returns (seconds, source) for one request of an asset class to a model.
+
+    Prefers the median latency the provenance log recorded for the model and
+    kind, then the model profile's p50, then DEFAULT_LATENCY_SECONDS.
+    """
+    latencies = [entry["latency"] for entry in provenance.for_model(model)
+                 if entry.get("kind") == kind and entry.get("latency") is not None]
+    if len(latencies) >= MIN_LATENCY_SAMPLES:
+        return statistics.median(latencies), f"provenance median of {len(latencies)}"
+    profile = profiles.for_kind(kind).get(model)
+    if profile and profile.get("p50_latency") is not None:
+        return profile["p50_latency"], "model profile p50"
+    return DEFAULT_LATENCY_SECONDS, "default"
+
+
+def batch_seconds(kind, requests, latency, fetch_workers):
+    """Predicts how long a batch takes: maps run one at a time, other kinds fetch_workers at a time."""
+    if kind == "map":
+        return requests * (latency + MAP_COOLDOWN_SECONDS)
+    return math.ceil(requests / max(1, fetch_workers)) * latency
+
+
+def build_plan(resolved, batch_size=DEFAULT_BATCH_SIZE, workers=1, fetch_workers=DEFAULT_FETCH_WORKERS,
+               provenance=None, profiles=None):
+    """
+    Groups resolved jobs into batches, assigns them to workers and adds the predictions.
+
+    Args:
+      resolved: The result of resolve_jobs().
+      batch_size: Most jobs per batch.
+      workers: How many apply workers the batches are spread across.
+      fetch_workers: Requests each worker keeps in flight for portraits and locations.
+      provenance: The ProvenanceStore with historical latencies. Defaults to the project's store.
+      profiles: The ModelProfileStore. Defaults to the project's store.
+
+    Returns:
+      The plan as a JSON-friendly dict.
+    """
+    if provenance is None:
+        provenance = ProvenanceStore()
+    if profiles is None:
+        profiles = ModelProfileStore()
+
+    batches = []
+    for (kind, model), jobs in resolved.items():
+        latency, source = expected_latency(kind, model, provenance, profiles)
+        price = PRICE_PER_IMAGE_USD.get(model)
+        for start in range(0, len(jobs), batch_size):
+            batch_jobs = jobs[start:start + batch_size]
+            batches.append({
+                "id": f"{kind}-{model}-{start // batch_size + 1:03d}",
+                "kind": kind,
+                "model": model,
+                "latency_per_request": round(latency, 3),
+                "latency_source": source,
+                "predicted_seconds": round(batch_seconds(kind, len(batch_jobs), latency, fetch_workers), 1),
+                "predicted_cost_usd": round(price * len(batch_jobs), 4) if price is not None else None,
+                "jobs": batch_jobs,
+            })
+
+    # Longest batches first, each to the least loaded worker; workers run their batches in plan order.
+    loads = [0.0] * workers
+    for batch in sorted(batches, key=lambda batch: -batch["predicted_seconds"]):
+        worker = loads.index(min(loads))
+        batch["worker"] = worker
+        loads[worker] += batch["predicted_seconds"]
+
+    requests = sum(len(batch["jobs"]) for batch in batches)
+    by_kind = {}
+    for batch in batches:
+        totals = by_kind.setdefault(batch["kind"], {"requests": 0, "predicted_seconds": 0.0, "predicted_cost_usd": 0.0})
+        totals["requests"] += len(batch["jobs"])
+        totals["predicted_seconds"] = round(totals["predicted_seconds"] + batch["predicted_seconds"], 1)
+        totals["predicted_cost_usd"] = round(totals["predicted_cost_usd"] + (batch["predicted_cost_usd"] or 0.0), 4)
+    return {
+        "version": PLAN_VERSION,
+        "created_at": round(time.time(), 3),
+        "workers": workers,
+        "fetch_workers": fetch_workers,
+        "summary": {
+            "requests": requests,
+            "batches": len(batches),
+            "predicted_seconds": round(max(loads), 1) if batches else 0.0,
+            "predicted_seconds_per_worker": [round(load, 1) for load in loads],
+            "predicted_cost_usd": round(sum(batch["predicted_cost_usd"] or 0.0 for batch in batches), 4),
+            "unpriced_models": sorted({batch["model"] for batch in batches if batch["predicted_cost_usd"] is None}),
+            "by_kind": by_kind,
+        },
+        "batches": batches,
+    }
+
+
+def write_plan(plan, path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+        f.write("\n")
+    os.replace(temp_path, path)
+
+
+def read_plan(path):
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"{path} is a version {plan.get('version')} plan; this script reads version {PLAN_VERSION}.")
+    return plan
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def print_summary(plan):
+    summary = plan["summary"]
+    print(f"Plan: {summary['requests']} request(s) in {summary['batches']} batch(es) across {plan['workers']} worker(s).")
+    print(f"  Predicted duration: {_format_duration(summary['predicted_seconds'])} "
+          f"(per worker: {', '.join(_format_duration(seconds) for seconds in summary['predicted_seconds_per_worker'])})")
+    print(f"  Predicted cost: ${summary['predicted_cost_usd']:.2f}"
+          + (f" plus {', '.join(summary['unpriced_models'])} (no price listed)" if summary["unpriced_models"] else ""))
+    for kind, totals in summary["by_kind"].items():
+        print(f"  {kind}: {totals['requests']} request(s), {_format_duration(totals['predicted_seconds'])}, "
+              f"${totals['predicted_cost_usd']:.2f}")
+    for batch in plan["batches"]:
+        print(f"  [{batch['id']}] worker {batch['worker']}: {len(batch['jobs'])} job(s), "
+              f"{batch['latency_per_request']:.1f}s/request ({batch['latency_source']}), "
+              f"{_format_duration(batch['predicted_seconds'])}")
+
+
+@contextlib.contextmanager
+def _exclusive_lock(path, stale_seconds=LINK_LOCK_STALE_SECONDS):
+    """
+    Holds a lock file created with O_EXCL, so it also works for workers on machines sharing the tree.
+
+    A lock older than stale_seconds is assumed to belong to a crashed worker and is taken over.
+    """
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale_seconds:
+                    print(f"WARNING: Removing stale lock {path}.")
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.5)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+def link_finished_images(plan, project_root_path=PROJECT_ROOT, lock_path=LINK_LOCK_PATH):
+    """
+    Points the data files at every image of the plan that exists on disk.
+
+    The world is reloaded, updated and saved while holding lock_path, so
+    workers finishing at the same time keep each other's updates.
+
+    Returns:
+      True if saving succeeded (or there was nothing to save).
+    """
+    with _exclusive_lock(lock_path):
+        return _link_finished_images(plan, project_root_path)
+
+
+def _link_finished_images(plan, project_root_path):
+    world = load_world()
+    for batch in plan["batches"]:
+        if batch["kind"] not in LINKED_FIELDS:
+            continue
+        index_name, attr = LINKED_FIELDS[batch["kind"]]
+        records = getattr(world, index_name)
+        for job in batch["jobs"]:
+            if not os.path.exists(os.path.join(project_root_path, job["output_path"])):
+                continue
+            record = records.get(job["link"]["id"])
+            if record is None:
+                print(f"WARNING: {job['label']} was generated, but {job['link']['id']} is no longer in the data files.")
+                continue
+            world.update(record, attr, job["link"]["value"])
+    return world.save_changes()
+
+
+def apply_plan(plan, client, budget=None, worker=None, provenance=None, pipeline_options=None,
+               project_root_path=PROJECT_ROOT):
+    """
+    Runs the jobs of a plan.
+
+    Args:
+      plan: A plan read with read_plan().
+      client: The genai client (or cassette/pool stand-in) to use.
+      budget: A GenerationBudget limiting API requests. Defaults to unlimited.
+      worker: Run only the batches assigned to this worker. Defaults to all.
+      provenance: The ProvenanceStore recording how each image was made.
+        Defaults to the project's store.
+      pipeline_options: Keyword arguments for the image_pipeline.ImagePipeline.
+      project_root_path: The directory the plan's paths are relative to.
+
+    Returns:
+      (attempted, skipped) job counts.
+    """
+    if budget is None:
+        budget = GenerationBudget()
+    if provenance is None:
+        provenance = ProvenanceStore()
+    batches = [batch for batch in plan["batches"] if worker is None or batch["worker"] == worker]
+    attempted = skipped = 0
+    pipeline = ImagePipeline(client, budget=budget, provenance=provenance, **(pipeline_options or {}))
+    for batch in batches:
+        print(f"INFO: Running batch {batch['id']} ({len(batch['jobs'])} job(s)).")
+        for job in batch["jobs"]:
+            output_path = os.path.join(project_root_path, job["output_path"])
+            if os.path.exists(output_path):
+                print(f"INFO: {job['label']} already exists at {output_path}. Skipping.")
+                skipped += 1
+                continue
+            if budget.exhausted():
+                print(f"INFO: Skipping {job['label']}: {budget.exhausted()}.")
+                skipped += 1
+                continue
+            attempted += 1
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            if batch["kind"] == "map":
+                # Maps keep their own resize and save settings.
+                generate_and_save_map(client, batch["model"], job["prompt"], os.path.dirname(output_path),
+                                      job["base_filename"], job["version_suffix"], budget=budget, provenance=provenance)
+            else:
+                pipeline.submit(ImageJob(
+                    job["label"], batch["kind"], job["prompt"], batch["model"], _request_config(job["config"]),
+                    output_path, tuple(job["size"]), seed=job["seed"],
+                ))
+    pipeline.close()
+    provenance.flush()
+    print(f"INFO: Saved {pipeline.saved} new image(s) through the pipeline; {pipeline.failed} could not be generated.")
+    return attempted, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plan image generation with time and cost estimates, then apply the plan.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = subparsers.add_parser('plan', help='Resolve every pending job and write a plan file. Makes no API request.')
+    plan_parser.add_argument('--kind', choices=KINDS, action='append', default=None,
+                             help='Asset class to plan; repeat for several. Default: all.')
+    plan_parser.add_argument('--output', type=str, default=DEFAULT_PLAN_PATH,
+                             help=f'Plan file to write. Default: {_project_relative(DEFAULT_PLAN_PATH)}.')
+    plan_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                             help=f'Most jobs per batch. Default: {DEFAULT_BATCH_SIZE}.')
+    plan_parser.add_argument('--workers', type=int, default=1,
+                             help='How many apply workers to spread the batches across. Default: 1.')
+    plan_parser.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS,
+                             help=f'Requests each worker will keep in flight, for the duration estimate. Default: {DEFAULT_FETCH_WORKERS}.')
+    plan_parser.add_argument('--all-models', action='store_true',
+                             help='Plan map versions for every model in MODEL_IDS_TO_TRY instead of only the selected one.')
+    add_priority_arguments(plan_parser)
+    add_model_arguments(plan_parser)
+
+    show_parser = subparsers.add_parser('show', help='Print the predictions and batches of a plan file.')
+    show_parser.add_argument('plan_file', type=str)
+
+    apply_parser = subparsers.add_parser('apply', help='Run the jobs of a plan file.')
+    apply_parser.add_argument('plan_file', type=str)
+    apply_parser.add_argument('--worker', type=int, default=None,
+                              help='Run only the batches assigned to this worker (0-based). Default: every batch.')
+    add_budget_arguments(apply_parser)
+    add_cassette_arguments(apply_parser)
+    add_client_pool_arguments(apply_parser)
+    add_pipeline_arguments(apply_parser)
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        args.kind = args.kind or list(KINDS)
+        world = load_world()
+        plan = build_plan(resolve_jobs(world, args), batch_size=args.batch_size, workers=max(1, args.workers),
+                          fetch_workers=args.fetch_workers)
+        if _report_problems(validate_plan(plan)):
+            print("ERROR: Not writing a plan that could not be applied.")
+            return
+        write_plan(plan, args.output)
+        print_summary(plan)
+        print(f"SUCCESS: Wrote the plan to {args.output}.")
+        return
+
+    try:
+        plan = read_plan(args.plan_file)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: Could not read plan {args.plan_file}: {e}")
+        return
+    if args.command == 'show':
+        print_summary(plan)
+        return
+    if _report_problems(validate_plan(plan)):
+        print(f"ERROR: Plan {args.plan_file} has invalid jobs; re-run `plan` to rebuild it.")
+        return
+
+    if args.worker is not None and not 0 <= args.worker < plan["workers"]:
+        print(f"ERROR: The plan has {plan['workers']} worker(s); --worker must be between 0 and {plan['workers'] - 1}.")
+        return
+    budget = GenerationBudget.from_args(args)
+    try:
+        client = make_client(args, budget=budget)
+    except Exception as e:
+        print(f"ERROR: Failed to initialize Gemini Client: {e}. Exiting.")
+        return
+    attempted, skipped = apply_plan(plan, client, budget=budget, worker=args.worker,
+                                    pipeline_options=pipeline_options_from_args(args))
+    print(f"INFO: Attempted {attempted} job(s); skipped {skipped}.")
+    if getattr(client, "summary", None):
+        print(f"INFO: Client pool usage: {client.summary()}")
+    if link_finished_images(plan):
+        print("INFO: Data files point at every finished image of the plan.")
+    else:
+        print("ERROR: Could not save the updated data files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Quota-aware scheduling for the asset generators.
+
+The generators used to walk their data files in file order, so a run with a
+limited daily quota could spend all of it on obscure NPCs before reaching the
+ones the player meets first. This module ranks pending assets so the most
+visible content is generated first, and provides a request/time budget that
+the generators consult before every API call.
+
+Priority is decided, in order, by:
+  1. An explicit `generationPriority` field on the NPC or POI (higher first).
+  2. Travel distance from the start location (closer first): sailing across
+     the map, free `targetLocationId` links, and POIs behind `requiredItems`
+     only once their items can be obtained.
+  3. How many quests, dialogue nodes and puzzles reference the asset (more first).
+  4. Original file order, so ties stay stable.
+"""
+
+import argparse
+import heapq
+import math
+import threading
+import time
+from datetime import datetime
+
+PRIORITY_OVERRIDE_FIELD = "generationPriority"
+
+
+def build_poi_graph(pois):
+    """
+    Builds a weighted adjacency map of the POIs from the game's navigation.
+
+    The world map sails between any two POIs with coordinates, at the
+    straight-line distance between them. Explicit `targetLocationId` actions
+    (e.g. a tavern inside the docks) are free links in both directions
+    because the player never leaves the game view. Edges into POIs with
+    `requiredItems` are included; compute_poi_distances applies their gates.
+
+    Args:
+      pois: A list of world_model.Poi records.
+
+    Returns:
+      A dictionary mapping POI id to a dictionary of {neighbour_id: cost}.
+    """
+    graph = {poi.id: {} for poi in pois if poi.id}
+    positioned = [poi for poi in pois if poi.id and _has_coordinates(poi)]
+
+    for poi_a in positioned:
+        for poi_b in positioned:
+            if poi_b is not poi_a:
+                graph[poi_a.id][poi_b.id] = _travel_cost(poi_a, poi_b)
+
+    for poi in pois:
+        for action in poi.actions or []:
+            target_id = action.get("targetLocationId") if isinstance(action, dict) else None
+            if target_id in graph and poi.id in graph:
+                graph[poi.id][target_id] = 0.0
+                graph[target_id][poi.id] = 0.0
+
+    return graph
+
+
+def _has_coordinates(poi):
+    return isinstance(poi.x, (int, float)) and isinstance(poi.y, (int, float))
+
+
+def _travel_cost(poi_a, poi_b):
+    if _has_coordinates(poi_a) and _has_coordinates(poi_b):
+        return math.hypot(poi_a.x - poi_b.x, poi_a.y - poi_b.y)
+    return 0.0
+
+
+def find_item_sources(world):
+    """
+    Finds where the player can obtain each item.
+
+    An item comes from a POI if one of its hidden objects gives or reveals
+    it, its market sells it, or an NPC there hands it out (an ADD_ITEM effect
+    in their dialogue or puzzles).
+
+    Returns:
+      A dictionary mapping POI id to the set of item ids obtainable there.
+    """
+    sources = {}
+    for poi in world.pois:
+        item_ids = set()
+        for hidden_object in poi.hidden_objects or []:
+            item_ids.add(hidden_object.item_id)
+            if isinstance(hidden_object.interaction, dict):
+                item_ids.add(hidden_object.interaction.get("revealsItemId"))
+        for good in poi.tradable_goods or []:
+            if isinstance(good, dict) and good.get("type") == "item" and good.get("marketSellsToPlayerPrice"):
+                item_ids.add(good.get("itemIdToTrade"))
+        for npc in world.npcs_by_location.get(poi.id, []):
+            for effects in _npc_effect_lists(world, npc):
+                for effect in effects or []:
+                    if isinstance(effect, dict) and effect.get("type") == "ADD_ITEM":
+                        item_ids.add(effect.get("itemId"))
+        item_ids.discard(None)
+        if item_ids:
+            sources[poi.id] = item_ids
+    return sources
+
+
+def _npc_effect_lists(world, npc):
+    for node in world.dialogues.get(npc.id, {}).values():
+        yield node.effects
+        for choice in node.player_choices or []:
+            yield choice.effects
+    for puzzle in world.puzzles_by_npc.get(npc.id, []):
+        yield puzzle.success_effects
+        yield puzzle.failure_effects
+
+
+def compute_poi_distances(world, start_location_id):
+    """
+    Computes the shortest travel cost from the start location to every POI.
+
+    Travel follows build_poi_graph. A POI with `requiredItems`, whether
+    reached over the map or through a `targetLocationId` link, opens once
+    every item can be obtained: its cost is at least that of reaching the POI
+    where the last of them is first found, plus the sail from there.
+
+    Args:
+      world: A world_model.WorldModel.
+      start_location_id: The id of the POI the player starts at.
+
+    Returns:
+      A dictionary mapping POI id to its distance. Unreachable POIs (and all
+      POIs if the start location is unknown) are absent from the result.
+    """
+    graph = build_poi_graph(world.pois)
+    if start_location_id not in graph:
+        return {}
+
+    gates = {poi.id: set(poi.required_items) for poi in world.pois if poi.id in graph and poi.required_items}
+    gates_by_item = {}
+    for poi_id, item_ids in gates.items():
+        for item_id in item_ids:
+            gates_by_item.setdefault(item_id, []).append(poi_id)
+    item_sources = find_item_sources(world)
+    item_found = {}  # item id -> (distance, POI id) where it is first obtainable
+    routes = {}  # gated POI id -> cheapest way there, ignoring its gate
+    unlocks = {}  # gated POI id -> cost at which its gate opens
+
+    distances = {start_location_id: 0.0}
+    queue = [(0.0, start_location_id)]
+
+    def push(poi_id, candidate):
+        if candidate < distances.get(poi_id, math.inf):
+            distances[poi_id] = candidate
+            heapq.heappush(queue, (candidate, poi_id))
+
+    def relax(poi_id, candidate):
+        if poi_id in gates:
+            routes[poi_id] = min(routes.get(poi_id, math.inf), candidate)
+            if poi_id not in unlocks:
+                return
+            candidate = max(candidate, unlocks[poi_id])
+        push(poi_id, candidate)
+
+    while queue:
+        distance, poi_id = heapq.heappop(queue)
+        if distance > distances.get(poi_id, math.inf):
+            continue
+        for neighbour_id, cost in graph[poi_id].items():
+            relax(neighbour_id, distance + cost)
+        for item_id in item_sources.get(poi_id, ()):
+            if item_id in item_found:
+                continue
+            item_found[item_id] = (distance, poi_id)
+            for gated_id in gates_by_item.get(item_id, []):
+                if gates[gated_id] <= item_found.keys():
+                    gated = world.pois_by_id[gated_id]
+                    unlocks[gated_id] = max(found_distance + _travel_cost(world.pois_by_id[source_id], gated)
+                                            for found_distance, source_id in (item_found[i] for i in gates[gated_id]))
+                    if gated_id in routes:
+                        push(gated_id, max(routes[gated_id], unlocks[gated_id]))
+    return distances
+
+
+def count_npc_references(world, npc):
+    """Returns how many quests, dialogue nodes and puzzles belong to an NPC."""
+    return (len(npc.quests or [])
+            + len(world.dialogues.get(npc.id, {}))
+            + len(world.puzzles_by_npc.get(npc.id, [])))
+
+
+def _priority_key(record, index, distance, references):
+    override = record.get(PRIORITY_OVERRIDE_FIELD)
+    if not isinstance(override, (int, float)):
+        override = 0
+    return (-override, distance, -references, index)
+
+
+def _default_start_location(world, start_location_id):
+    if start_location_id is None and world.pois:
+        return world.pois[0].id
+    return start_location_id
+
+
+def rank_npcs(world, start_location_id=None):
+    """
+    Orders NPCs by how soon the player is likely to meet them.
+
+    Args:
+      world: A world_model.WorldModel.
+      start_location_id: The starting POI id. Defaults to the first POI,
+        matching the game's own default.
+
+    Returns:
+      A list of indexes into `world.npcs`, highest priority first.
+    """
+    distances = compute_poi_distances(world, _default_start_location(world, start_location_id))
+
+    def key(index):
+        npc = world.npcs[index]
+        distance = distances.get(world.location_id_by_npc.get(npc.id), math.inf)
+        return _priority_key(npc, index, distance, count_npc_references(world, npc))
+
+    return sorted(range(len(world.npcs)), key=key)
+
+
+def rank_locations(world, start_location_id=None):
+    """
+    Orders POIs by distance from the start location.
+
+    POIs with more characters and hidden objects win when distances tie.
+
+    Args:
+      world: A world_model.WorldModel.
+      start_location_id: The starting POI id. Defaults to the first POI.
+
+    Returns:
+      A list of indexes into `world.pois`, highest priority first.
+    """
+    distances = compute_poi_distances(world, _default_start_location(world, start_location_id))
+
+    def key(index):
+        poi = world.pois[index]
+        distance = distances.get(poi.id, math.inf)
+        references = len(world.npcs_by_location.get(poi.id, [])) + len(poi.hidden_objects or [])
+        return _priority_key(poi, index, distance, references)
+
+    return sorted(range(len(world.pois)), key=key)
+
+
+def add_priority_arguments(parser):
+    """Adds the --start-location option used to rank assets by distance."""
+    parser.add_argument('--start-location', type=str, default=None,
+                        help='POI id the player starts at, used to prioritise nearby assets. Defaults to the first POI.')
+
+
+def parse_deadline(value):
+    """
+    Parses a --deadline argument into an absolute epoch timestamp.
+
+    Accepts either a number of seconds from now (e.g. "3600") or an ISO 8601
+    timestamp (e.g. "2025-06-01T18:00:00").
+
+    Args:
+      value: The raw argument string, or None.
+
+    Returns:
+      The deadline as seconds since the epoch, or None if no deadline was given.
+
+    Raises:
+      argparse.ArgumentTypeError: If the value is neither a number nor an ISO
+        timestamp, so argparse reports it as a usage error.
+    """
+    if value is None:
+        return None
+    try:
+        return time.time() + float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid deadline {value!r}: expected seconds from now or an ISO 8601 timestamp")
+
+
+def add_budget_arguments(parser):
+    """Adds the shared --max-requests/--deadline options to an argument parser."""
+    parser.add_argument('--max-requests', type=int, default=None,
+                        help='Maximum number of image generation API requests to make in this run.')
+    parser.add_argument('--deadline', type=parse_deadline, default=None,
+                        help='Stop starting new requests after this point. Seconds from now or an ISO 8601 timestamp.')
+
+
+class GenerationBudget:
+    """
+    Tracks how many API requests a run may still make and until when.
+
+    A budget with neither limit set never runs out, which keeps the
+    generators' default behaviour unchanged.
+    """
+
+    def __init__(self, max_requests=None, deadline=None):
+        self.max_requests = max_requests
+        self.deadline = deadline
+        self.requests_made = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(max_requests=args.max_requests, deadline=args.deadline)
+
+    def exhausted(self):
+        """Returns a short reason if no further request may start, otherwise None."""
+        if self.max_requests is not None and self.requests_made >= self.max_requests:
+            return f"request budget of {self.max_requests} used"
+        if self.deadline is not None and time.time() >= self.deadline:
+            return "deadline reached"
+        return None
+
+    def record_request(self):
+        with self._lock:
+            self.requests_made += 1
+
+    def reserve_request(self):
+        """
+        Atomically claims a request, for callers making requests from several threads.
+
+        Returns:
+          None if the request may go ahead, otherwise the reason it may not.
+        """
+        with self._lock:
+            reason = self.exhausted()
+            if reason is None:
+                self.requests_made += 1
+            return reason
+
+    def refund_request(self):
+        """Gives back a reserved request that was never sent to the API."""
+        with self._lock:
+            self.requests_made = max(0, self.requests_made - 1)
+
+    def remaining_seconds(self):
+        if self.deadline is None:
+            return math.inf
+        return max(0.0, self.deadline - time.time())
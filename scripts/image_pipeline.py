@@ -0,0 +1,284 @@
+"""
+Staged pipeline that generates, resizes and saves images concurrently.
+
+  fetch   Threads call the image API (with the usual retries and 429 backoff),
+          so a request is in flight while earlier images are still being
+          processed.
+  decode  A process pool decodes, resizes and re-encodes each image, so the
+          CPU work overlaps the network waits instead of delaying the next
+          request. Its workers are started with the "spawn" method, because
+          forking a process that already runs the fetch threads is unsafe.
+  write   A writer thread saves each encoded image and records its provenance.
+
+Stages are joined by bounded queues. fetch_workers caps the requests in
+flight, and a separate semaphore caps how many fetched image buffers (raw or
+encoded) wait in the decode and write stages: when those fall behind, each
+fetch worker holds its newest image until a slot frees up and takes no new
+job meanwhile, so at most max_buffered_images + fetch_workers images are in
+memory.
+
+Each ImageJob's on_saved callback (for example `world.update(...)`) runs on
+the thread that submits jobs, during submit() and close(), so generators
+never touch the world model from another thread.
+
+Usage:
+  pipeline = ImagePipeline(client, budget=budget, provenance=provenance)
+  for ...:
+      pipeline.submit(ImageJob(...))
+  pipeline.close()
+"""
+
+import multiprocessing
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+from google.api_core.exceptions import GoogleAPIError
+
+from client_pool import is_rate_limit_error
+from generation_scheduler import GenerationBudget
+
+DEFAULT_FETCH_WORKERS = 2
+DEFAULT_MAX_BUFFERED_IMAGES = 4
+MAX_RETRIES = 3
+BASE_DELAY_SECONDS = 5
+
+
+class ImageJob:
+    """
+    One image to generate.
+
+    Args:
+      label: How the image is named in log messages, e.g. "npc_x (Name)".
+      kind: The provenance kind ("portrait", "location", ...).
+      prompt: The full prompt text.
+      model: The model id.
+      config: The GenerateImagesConfig for the request.
+      output_path: Where to save the image.
+      size: The (width, height) to resize the image to.
+      image_format: The Pillow format to save in.
+      seed: The seed that picked the prompt's parts, for provenance.
+      on_saved: Called with no arguments once the image has been saved.
+      reference_images: For edits, the reference images (e.g. source and
+        mask) sent to `edit_image` instead of calling `generate_images`.
+    """
+
+    def __init__(self, label, kind, prompt, model, config, output_path, size, image_format="JPEG",
+                 seed=None, on_saved=None, reference_images=None):
+        self.label = label
+        self.kind = kind
+        self.prompt = prompt
+        self.model = model
+        self.config = config
+        self.output_path = output_path
+        self.size = size
+        self.image_format = image_format
+        self.seed = seed
+        self.on_saved = on_saved
+        self.reference_images = reference_images
+
+
+def decode_and_resize(image_bytes, size, image_format):
+    """Decodes an image, resizes it and returns the re-encoded bytes. Runs in a worker process."""
+    img = Image.open(BytesIO(image_bytes))
+    img = img.resize(size)
+    buffer = BytesIO()
+    img.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def fetch_image(client, job, budget):
+    """
+    Requests one image, retrying rate-limited requests with exponential backoff.
+
+    Returns:
+      (image_bytes, latency_seconds), or (None, None) if no image was produced.
+    """
+    response = None
+    request_latency = None
+    for attempt in range(MAX_RETRIES):
+        reason = budget.reserve_request()
+        if reason:
+            print(f"WARNING: Not requesting {job.label}: {reason}.")
+            return None, None
+        try:
+            request_started = time.monotonic()
+            if job.reference_images:
+                response = client.models.edit_image(
+                    model=job.model,
+                    prompt=job.prompt,
+                    reference_images=job.reference_images,
+                    config=job.config,
+                )
+            else:
+                response = client.models.generate_images(
+                    model=job.model,
+                    prompt=job.prompt,
+                    config=job.config,
+                )
+            request_latency = time.monotonic() - request_started
+            break
+        except GoogleAPIError as e:
+            if is_rate_limit_error(e) and attempt < MAX_RETRIES - 1:
+                delay = BASE_DELAY_SECONDS * (2 ** attempt) # Exponential backoff
+                actual_delay = delay + random.uniform(0, 0.1 * delay) # Add some jitter
+                print(f"WARNING: Rate limit hit for {job.label}. Retrying in {actual_delay:.2f} seconds (attempt {attempt + 1}/{MAX_RETRIES}). Error: {e}")
+                time.sleep(actual_delay)
+            else:
+                print(f"ERROR: Failed to generate image for {job.label} due to Google API Error (attempt {attempt + 1}/{MAX_RETRIES}). Error: {e}")
+                return None, None
+        except Exception as e:
+            print(f"ERROR: An unexpected error occurred during API call for {job.label} (attempt {attempt + 1}/{MAX_RETRIES}). Error: {e}")
+            return None, None
+
+    if not response:
+        return None, None
+    if response.generated_images and response.generated_images[0].image and response.generated_images[0].image.image_bytes:
+        return response.generated_images[0].image.image_bytes, request_latency
+    if getattr(response, "candidates", None) and not (response.candidates[0].content and response.candidates[0].content.parts):
+        print(f"ERROR: Gemini API call succeeded for {job.label} but returned no content parts. Candidate: {response.candidates[0]}")
+    else:
+        print(f"ERROR: Gemini API call for {job.label} returned no image or an unexpected response after retries: {response}")
+    return None, None
+
+
+def _write_file_atomically(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class ImagePipeline:
+    """
+    Runs ImageJobs through the fetch, decode and write stages.
+
+    Args:
+      client: The genai client (or a pool or cassette stand-in). Must be safe
+        to call from several threads when fetch_workers > 1.
+      budget: Optional GenerationBudget shared by all fetch workers.
+      provenance: The ProvenanceStore saved images are recorded in.
+      fetch_workers: How many API requests may be in flight at once.
+      decode_workers: Size of the decode process pool. Defaults to the CPU count.
+      max_buffered_images: How many fetched image buffers may wait for the
+        decode and write stages at once.
+    """
+
+    def __init__(self, client, budget=None, provenance=None, fetch_workers=DEFAULT_FETCH_WORKERS,
+                 decode_workers=None, max_buffered_images=DEFAULT_MAX_BUFFERED_IMAGES):
+        self.client = client
+        self.budget = budget or GenerationBudget()
+        self.provenance = provenance
+        self.saved = 0
+        self.failed = 0
+        self._jobs = queue.Queue(maxsize=fetch_workers)
+        self._writes = queue.Queue(maxsize=max_buffered_images)
+        self._finished = queue.Queue()
+        self._buffers = threading.BoundedSemaphore(max_buffered_images)
+        self._decode_pool = ProcessPoolExecutor(max_workers=decode_workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        self._fetchers = [threading.Thread(target=self._fetch_loop, name=f"image-fetch-{number}", daemon=True)
+                          for number in range(fetch_workers)]
+        self._writer = threading.Thread(target=self._write_loop, name="image-write", daemon=True)
+        for thread in self._fetchers + [self._writer]:
+            thread.start()
+
+    def submit(self, job):
+        """Queues a job, blocking while every fetch worker is busy."""
+        self._run_callbacks()
+        self._jobs.put(job)
+
+    def close(self):
+        """Waits for every submitted job to be saved (or fail) and shuts the stages down."""
+        for _ in self._fetchers:
+            self._jobs.put(None)
+        for thread in self._fetchers:
+            thread.join()
+        self._writes.put(None)
+        self._writer.join()
+        self._decode_pool.shutdown()
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        while True:
+            try:
+                job, saved = self._finished.get_nowait()
+            except queue.Empty:
+                return
+            if saved:
+                self.saved += 1
+                if job.on_saved:
+                    job.on_saved()
+            else:
+                self.failed += 1
+
+    def _fetch_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            holds_buffer = False
+            try:
+                image_bytes, latency = fetch_image(self.client, job, self.budget)
+                if image_bytes is None:
+                    self._finished.put((job, False))
+                    continue
+                self._buffers.acquire() # Released once the image has been written
+                holds_buffer = True
+                future = self._decode_pool.submit(decode_and_resize, image_bytes, job.size, job.image_format)
+                self._writes.put((job, latency, future))
+            except Exception as e:
+                print(f"ERROR: Failed to process image for {job.label}. Error: {e}")
+                if holds_buffer:
+                    self._buffers.release()
+                self._finished.put((job, False))
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            job, latency, future = item
+            try:
+                encoded = future.result()
+                _write_file_atomically(job.output_path, encoded)
+                if self.provenance is not None:
+                    self.provenance.record(job.output_path, job.kind, job.prompt, model=job.model, config=job.config,
+                                           seed=job.seed, latency=latency, image_bytes=encoded)
+                print(f"SUCCESS: Generated and saved image for {job.label} to {job.output_path}")
+                self._finished.put((job, True))
+            except Exception as e:
+                print(f"ERROR: Failed to save image for {job.label}. Error: {e}")
+                self._finished.put((job, False))
+            finally:
+                self._buffers.release()
+
+
+def add_pipeline_arguments(parser):
+    """Adds the pipeline concurrency options to an argument parser."""
+    parser.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS,
+                        help=f'API requests to keep in flight at once. Default: {DEFAULT_FETCH_WORKERS}.')
+    parser.add_argument('--decode-workers', type=int, default=None,
+                        help='Processes used to decode and resize images. Default: one per CPU.')
+    parser.add_argument('--max-buffered-images', type=int, default=DEFAULT_MAX_BUFFERED_IMAGES,
+                        help=f'Most fetched images waiting to be decoded and written at once. Default: {DEFAULT_MAX_BUFFERED_IMAGES}.')
+
+
+def pipeline_options_from_args(args):
+    """Returns the ImagePipeline keyword arguments for options added by add_pipeline_arguments."""
+    return {
+        "fetch_workers": args.fetch_workers,
+        "decode_workers": args.decode_workers,
+        "max_buffered_images": args.max_buffered_images,
+    }
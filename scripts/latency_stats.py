@@ -0,0 +1,24 @@
+"""
+Summary statistics for the request latencies the tooling records.
+
+Shared by cassettes.py (cassette summaries) and model_profiles.py (model
+calibration), so both report p50/p95 the same way.
+"""
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of a list of numbers.
+
+    Args:
+      values: The samples, in any order.
+      fraction: The percentile as a fraction, e.g. 0.95 for p95.
+
+    Returns:
+      The sample closest to that rank, or 0.0 if there are no samples.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,387 @@
+"""
+Measure the candidate image models and pick one per asset class.
+
+`python scripts/model_profiles.py profile` sends a small calibration set of
+prompts for each asset class ("portrait", "location", "map") to every
+candidate model, one request at a time and with no retries, and stores for
+each model:
+
+  p50_latency, p95_latency  Seconds per successful call.
+  error_rate                Share of calls that raised (429s included).
+  rate_limit_rate           Share of calls that were rate limited.
+  rai_block_rate            Share of answered calls with no image.
+  images_per_minute         Images produced per minute of calibration time.
+  cost_per_image            From PRICE_PER_IMAGE_USD, when the model is listed.
+
+Profiles live in `provenance/model_profiles.json`, next to the asset
+provenance log. At run time each generator asks model_from_args() for the
+model with the highest images per minute whose error and block rates are
+acceptable. Profiles that are missing or older than --profile-max-age-days
+are ignored, and the generator falls back to its previous fixed model when
+no profile qualifies. Generators only send calibration requests themselves
+when given --refresh-profiles; otherwise refresh with the `profile` command.
+
+Usage:
+  python scripts/model_profiles.py profile [--kind portrait] [--runs 2]
+  python scripts/model_profiles.py show
+
+Usage from a generator:
+  add_model_arguments(parser)
+  model_name = model_from_args(args, client, "portrait", budget)
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from google.genai import types
+
+from cassettes import add_cassette_arguments, make_client
+from client_pool import add_client_pool_arguments, is_rate_limit_error
+from generation_scheduler import GenerationBudget, add_budget_arguments
+from latency_stats import percentile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PROFILES_PATH = os.path.join(PROJECT_ROOT, "provenance", "model_profiles.json")
+DEFAULT_MAX_AGE_DAYS = 7.0
+DEFAULT_RUNS = 1
+MAX_ERROR_RATE = 0.2
+MAX_RAI_BLOCK_RATE = 0.2
+
+# Models each generator may use, in order of preference when profiles tie.
+CANDIDATE_MODELS = {
+    "portrait": [
+        "imagen-4.0-generate-preview-05-20",
+        "imagen-4.0-generate-001",
+        "imagen-3.0-generate-002",
+        "imagen-3.0-fast-generate-001",
+    ],
+    "location": [
+        "imagen-3.0-fast-generate-001",
+        "imagen-3.0-generate-002",
+        "imagen-4.0-generate-preview-05-20",
+        "imagen-4.0-generate-001",
+    ],
+    "map": [
+        "imagen-3.0-fast-generate-001",
+        "imagen-3.0-generate-001",
+        "imagen-3.0-generate-002",
+        "imagen-4.0-generate-preview-05-20",
+        "imagen-4.0-generate-002",
+        "imagegeneration@006",
+    ],
+}
+
+# The model each generator used before profiling existed; used when no profile qualifies.
+DEFAULT_MODELS = {
+    "portrait": "imagen-4.0-generate-preview-05-20",
+    "location": "imagen-3.0-fast-generate-001",
+    "map": "imagen-3.0-fast-generate-001",
+}
+
+# List price per generated image in USD. Update when pricing changes; models
+# missing here are profiled and selected as usual but reported without a cost.
+PRICE_PER_IMAGE_USD = {
+    "imagen-3.0-fast-generate-001": 0.02,
+    "imagen-3.0-generate-001": 0.04,
+    "imagen-3.0-generate-002": 0.04,
+    "imagen-4.0-generate-preview-05-20": 0.04,
+    "imagen-4.0-generate-001": 0.04,
+    "imagen-4.0-generate-002": 0.04,
+    "imagegeneration@006": 0.02,
+}
+
+# Short prompts in the style of each generator's real requests.
+CALIBRATION_PROMPTS = {
+    "portrait": [
+        "A weathered pirate captain with a tricorn hat and a scarred cheek, detailed character portrait. No text.",
+        "A young dockside merchant in a patched waistcoat, warm lantern light, character portrait. No text.",
+        "A mysterious fortune teller wrapped in dark silks, candle-lit, character portrait. No text.",
+    ],
+    "location": [
+        "A bustling pirate port at dusk, wooden piers and moored ships, cinematic wide shot.",
+        "A hidden jungle cove with a waterfall and a half-buried treasure chest, lush foliage.",
+        "A ruined stone fort on a windswept cliff above a stormy sea, dramatic sky.",
+    ],
+    "map": [
+        "A top-down fantasy pirate archipelago game map with jungles, volcanoes and coral reefs. No text.",
+        "A painterly treasure map of scattered tropical islands and dangerous straits. No text.",
+        "A detailed RPG world map of a pirate port, hidden coves and a shipwreck graveyard. No text.",
+    ],
+}
+
+
+def calibration_config(kind):
+    """Returns the GenerateImagesConfig a generator of this asset class sends."""
+    options = {
+        "number_of_images": 1,
+        "include_rai_reason": True,
+        "output_mime_type": "image/jpeg",
+    }
+    if kind == "portrait":
+        options["personGeneration"] = "allow_all"
+    return types.GenerateImagesConfig(**options)
+
+
+def profile_model(client, kind, model, budget, runs=DEFAULT_RUNS):
+    """
+    Sends the calibration prompts for an asset class to one model.
+
+    Requests are made one at a time and never retried, so rate limits and
+    failures show up in the profile instead of being hidden by backoff.
+
+    Args:
+      client: The genai client (or cassette/pool stand-in) to use.
+      kind: The asset class, a key of CALIBRATION_PROMPTS.
+      model: The model id.
+      budget: The GenerationBudget the calibration requests count against.
+      runs: How many times to send each calibration prompt.
+
+    Returns:
+      The profile dict, or None if the budget ran out before any request.
+    """
+    config = calibration_config(kind)
+    latencies = []
+    calls = errors = rate_limited = blocked = images = 0
+    started = time.monotonic()
+    for prompt in CALIBRATION_PROMPTS[kind] * runs:
+        reason = budget.reserve_request()
+        if reason:
+            print(f"WARNING: Stopping calibration of {model} for {kind}s: {reason}.")
+            break
+        calls += 1
+        request_started = time.monotonic()
+        try:
+            response = client.models.generate_images(model=model, prompt=prompt, config=config)
+        except Exception as e:
+            errors += 1
+            if is_rate_limit_error(e):
+                rate_limited += 1
+            print(f"WARNING: Calibration request to {model} failed: {e}")
+            continue
+        latency = time.monotonic() - request_started
+        generated = response.generated_images[0] if response.generated_images else None
+        if generated is not None and generated.image and generated.image.image_bytes:
+            images += 1
+            latencies.append(latency)
+        else:
+            blocked += 1
+    elapsed = time.monotonic() - started
+
+    if not calls:
+        return None
+    answered = calls - errors
+    return {
+        "model": model,
+        "kind": kind,
+        "measured_at": time.time(),
+        "samples": calls,
+        "p50_latency": round(percentile(latencies, 0.5), 3) if latencies else None,
+        "p95_latency": round(percentile(latencies, 0.95), 3) if latencies else None,
+        "error_rate": round(errors / calls, 3),
+        "rate_limit_rate": round(rate_limited / calls, 3),
+        "rai_block_rate": round(blocked / answered, 3) if answered else None,
+        "images_per_minute": round(images * 60.0 / elapsed, 2) if elapsed > 0 else 0.0,
+        "cost_per_image": PRICE_PER_IMAGE_USD.get(model),
+    }
+
+
+def is_acceptable(profile, max_error_rate=MAX_ERROR_RATE, max_rai_block_rate=MAX_RAI_BLOCK_RATE):
+    """Returns True if a profile produced images without too many errors or blocks."""
+    return (profile.get("images_per_minute", 0) > 0
+            and profile["error_rate"] <= max_error_rate
+            and (profile.get("rai_block_rate") or 0.0) <= max_rai_block_rate)
+
+
+class ModelProfileStore:
+    """
+    The stored profiles, keyed by asset class and then model id.
+
+    Args:
+      path: The JSON file. Defaults to provenance/model_profiles.json.
+    """
+
+    def __init__(self, path=DEFAULT_PROFILES_PATH):
+        self.path = path
+        self.profiles = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.profiles = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"WARNING: Could not read model profiles from {path}: {e}. Treating them as missing.")
+
+    def for_kind(self, kind):
+        return self.profiles.get(kind, {})
+
+    def record(self, profile):
+        self.profiles.setdefault(profile["kind"], {})[profile["model"]] = profile
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.profiles, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(temp_path, self.path)
+
+    def stale_models(self, kind, max_age_days=DEFAULT_MAX_AGE_DAYS, now=None):
+        """Returns the candidate models of an asset class with no profile younger than max_age_days."""
+        now = time.time() if now is None else now
+        profiles = self.for_kind(kind)
+        return [model for model in CANDIDATE_MODELS[kind]
+                if model not in profiles or now - profiles[model]["measured_at"] > max_age_days * 86400]
+
+    def select(self, kind, max_age_days=DEFAULT_MAX_AGE_DAYS, now=None):
+        """
+        Picks the model with the highest images per minute among fresh, acceptable profiles.
+
+        Returns:
+          The profile dict, or None if no candidate qualifies.
+        """
+        stale = set(self.stale_models(kind, max_age_days, now))
+        profiles = self.for_kind(kind)
+        usable = [profiles[model] for model in CANDIDATE_MODELS[kind]
+                  if model not in stale and is_acceptable(profiles[model])]
+        if not usable:
+            return None
+        # max() keeps the first of equal entries, so ties go to the earlier candidate.
+        return max(usable, key=lambda profile: (profile["images_per_minute"], -(profile["p95_latency"] or 0.0)))
+
+    def refresh(self, client, kind, budget, models=None, runs=DEFAULT_RUNS):
+        """Profiles the given models (default: all candidates) of an asset class and saves the results."""
+        for model in models if models is not None else CANDIDATE_MODELS[kind]:
+            print(f"INFO: Profiling {model} for {kind}s...")
+            profile = profile_model(client, kind, model, budget, runs=runs)
+            if profile is None:
+                break
+            self.record(profile)
+            print(f"INFO: {describe(profile)}")
+        self.save()
+
+
+def describe(profile):
+    """Formats a profile as one line."""
+    latency = (f"p50 {profile['p50_latency']:.2f}s / p95 {profile['p95_latency']:.2f}s"
+               if profile.get("p50_latency") is not None else "no successful calls")
+    cost = f"${profile['cost_per_image']:.3f}/image" if profile.get("cost_per_image") is not None else "cost unknown"
+    blocked = profile.get("rai_block_rate")
+    return (f"{profile['model']}: {profile['samples']} calls, {latency}, "
+            f"errors {profile['error_rate']:.0%} (rate limited {profile['rate_limit_rate']:.0%}), "
+            f"RAI blocked {'n/a' if blocked is None else f'{blocked:.0%}'}, "
+            f"{profile['images_per_minute']:.2f} images/min, {cost}")
+
+
+def add_model_arguments(parser):
+    """Adds the --model/--profile-max-age-days/--refresh-profiles options to an argument parser."""
+    parser.add_argument('--model', type=str, default=None,
+                        help='Use this model instead of the one picked from the measured model profiles.')
+    parser.add_argument('--profile-max-age-days', type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help=f'Ignore model profiles older than this. Default: {DEFAULT_MAX_AGE_DAYS:g}.')
+    parser.add_argument('--refresh-profiles', action='store_true',
+                        help='Re-measure missing or stale model profiles before picking a model. '
+                             'The calibration requests count against --max-requests.')
+
+
+def model_from_args(args, client, kind, budget, store=None, allow_refresh=True):
+    """
+    Returns the model a generator should use for an asset class.
+
+    Honours --model. With --refresh-profiles (and not --replay), missing or
+    stale profiles are re-measured first, counting against the budget. Then
+    picks the fastest acceptable model among fresh profiles, falling back to
+    DEFAULT_MODELS.
+
+    Args:
+      args: Parsed arguments from a parser set up with add_model_arguments.
+      client: The client used for any calibration requests.
+      kind: The asset class: "portrait", "location" or "map".
+      budget: The run's GenerationBudget.
+      store: The ModelProfileStore. Defaults to the project's store.
+      allow_refresh: False to never make calibration requests, whatever the
+        arguments say.
+    """
+    if args.model:
+        return args.model
+    if store is None:
+        store = ModelProfileStore()
+    stale = store.stale_models(kind, args.profile_max_age_days)
+    if stale and allow_refresh and args.refresh_profiles and not getattr(args, "replay", None):
+        print(f"INFO: Model profiles for {kind}s are missing or older than {args.profile_max_age_days:g} days "
+              f"for {', '.join(stale)}. Re-measuring them with up to "
+              f"{len(stale) * len(CALIBRATION_PROMPTS[kind])} requests from this run's budget.")
+        store.refresh(client, kind, budget, models=stale)
+    elif stale:
+        print(f"INFO: Model profiles for {kind}s are missing or older than {args.profile_max_age_days:g} days "
+              f"for {', '.join(stale)}. Run `python scripts/model_profiles.py profile --kind {kind}` "
+              f"or pass --refresh-profiles to re-measure them.")
+    profile = store.select(kind, args.profile_max_age_days)
+    if profile is None:
+        print(f"INFO: No fresh, acceptable model profile for {kind}s. Using the default model {DEFAULT_MODELS[kind]}.")
+        return DEFAULT_MODELS[kind]
+    print(f"INFO: Using {profile['model']} for {kind}s ({describe(profile)}).")
+    return profile["model"]
+
+
+def show(store, max_age_days=DEFAULT_MAX_AGE_DAYS):
+    """Prints the stored profiles and the model each asset class would use."""
+    for kind in CANDIDATE_MODELS:
+        profiles = store.for_kind(kind)
+        stale = set(store.stale_models(kind, max_age_days))
+        print(f"{kind}:")
+        for model in CANDIDATE_MODELS[kind]:
+            if model not in profiles:
+                print(f"  {model}: not profiled")
+                continue
+            profile = profiles[model]
+            flags = [flag for flag, on in (("stale", model in stale), ("unacceptable", not is_acceptable(profile))) if on]
+            print(f"  {describe(profile)}" + (f" [{', '.join(flags)}]" if flags else ""))
+        selected = store.select(kind, max_age_days)
+        print(f"  -> {selected['model'] if selected else DEFAULT_MODELS[kind] + ' (default)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure image models and show which one each generator would use.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    profile_parser = subparsers.add_parser('profile', help='Send the calibration prompts to every candidate model.')
+    profile_parser.add_argument('--kind', choices=sorted(CANDIDATE_MODELS), action='append', default=None,
+                                help='Asset class to profile; repeat for several. Default: all.')
+    profile_parser.add_argument('--models', nargs='+', default=None,
+                                help='Profile only these models instead of every candidate.')
+    profile_parser.add_argument('--runs', type=int, default=DEFAULT_RUNS,
+                                help=f'How many times to send each calibration prompt. Default: {DEFAULT_RUNS}.')
+    add_budget_arguments(profile_parser)
+    add_cassette_arguments(profile_parser)
+    add_client_pool_arguments(profile_parser)
+    show_parser = subparsers.add_parser('show', help='Print the stored profiles and the selected model per asset class.')
+    show_parser.add_argument('--profile-max-age-days', type=float, default=DEFAULT_MAX_AGE_DAYS)
+    args = parser.parse_args()
+
+    store = ModelProfileStore()
+    if args.command == 'show':
+        show(store, args.profile_max_age_days)
+        return
+
+    budget = GenerationBudget.from_args(args)
+    try:
+        client = make_client(args, budget=budget)
+    except Exception as e:
+        print(f"ERROR: Failed to initialize Gemini Client: {e}. Exiting.")
+        return
+    for kind in args.kind or sorted(CANDIDATE_MODELS):
+        models = [model for model in args.models if model in CANDIDATE_MODELS[kind]] if args.models else None
+        if models == []:
+            continue
+        store.refresh(client, kind, budget, models=models, runs=args.runs)
+        if budget.exhausted():
+            break
+    if getattr(client, "summary", None):
+        print(f"INFO: Client pool usage: {client.summary()}")
+    show(store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Tiny low-quality placeholders for the location and portrait images.
+
+A placeholder is a dictionary the UI can paint before the real JPEG arrives:
+
+  {"color": "#5a4632",                        Dominant colour of the image.
+   "thumbnail": "data:image/jpeg;base64,..."}  A ~20px wide, blurred-up preview.
+
+build_assets.py embeds them in the built data files as `gameViewPlaceholder`
+and `portraitPlaceholder`, and caches them in the asset manifest by content
+hash so only new or changed images are decoded on the next build.
+"""
+
+import base64
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+THUMBNAIL_WIDTH = 20
+THUMBNAIL_QUALITY = 40
+# Colour channels are bucketed to this many levels when finding the dominant colour.
+_COLOR_LEVELS = 8
+
+
+def dominant_colors(thumbnails):
+    """
+    Returns the dominant colour of each RGB pixel array as a "#rrggbb" string.
+
+    Pixels are bucketed into a coarse colour cube; each result is the mean of
+    the pixels in that image's most populated bucket. The pixels of every
+    image are concatenated and reduced in one pass, keyed by image and bucket.
+
+    Args:
+      thumbnails: A list of uint8 NumPy arrays of shape (height, width, 3).
+    """
+    if not thumbnails:
+        return []
+    flat = [pixels.reshape(-1, 3) for pixels in thumbnails]
+    owners = np.repeat(np.arange(len(flat)), [len(pixels) for pixels in flat])
+    flat = np.concatenate(flat).astype(np.int64)
+    buckets = flat // (256 // _COLOR_LEVELS)
+    bucket_count = _COLOR_LEVELS ** 3
+    keys = (buckets[:, 0] * _COLOR_LEVELS + buckets[:, 1]) * _COLOR_LEVELS + buckets[:, 2]
+    counts = np.bincount(owners * bucket_count + keys, minlength=len(thumbnails) * bucket_count)
+    counts = counts.reshape(len(thumbnails), bucket_count)
+    best = counts.argmax(axis=1)
+    selected = keys == best[owners]
+    sums = np.stack([np.bincount(owners[selected], weights=flat[selected, channel], minlength=len(thumbnails))
+                     for channel in range(3)], axis=1)
+    means = (sums / counts[np.arange(len(thumbnails)), best][:, None]).round().astype(int)
+    return [f"#{red:02x}{green:02x}{blue:02x}" for red, green, blue in means]
+
+
+def dominant_color(pixels):
+    """Returns the dominant colour of one RGB pixel array; see dominant_colors."""
+    return dominant_colors([pixels])[0]
+
+
+def load_thumbnail(image_path):
+    """
+    Decodes an image straight to its ~20px wide RGB thumbnail.
+
+    Args:
+      image_path: Path of a JPEG or PNG image.
+    """
+    with Image.open(image_path) as img:
+        # draft() lets the JPEG decoder downscale while decoding, which is far
+        # cheaper than decoding the full image and resizing it.
+        img.draft("RGB", (THUMBNAIL_WIDTH * 4, THUMBNAIL_WIDTH * 4))
+        img = img.convert("RGB")
+        height = max(1, round(img.height * THUMBNAIL_WIDTH / img.width))
+        return img.resize((THUMBNAIL_WIDTH, height), Image.Resampling.BILINEAR)
+
+
+def _thumbnail_data_url(thumbnail):
+    buffer = BytesIO()
+    thumbnail.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def compute_placeholder(image_path):
+    """
+    Computes the placeholder for one image file.
+
+    Args:
+      image_path: Path of a JPEG or PNG image.
+
+    Returns:
+      A {"color", "thumbnail"} dictionary.
+    """
+    thumbnail = load_thumbnail(image_path)
+    return {"color": dominant_color(np.asarray(thumbnail)), "thumbnail": _thumbnail_data_url(thumbnail)}
+
+
+def compute_placeholders(image_paths):
+    """
+    Computes placeholders for a batch of images.
+
+    Each image is decoded to its thumbnail (decoding and JPEG encoding are
+    per file in Pillow), then the dominant colours of the whole batch are
+    found in a single array reduction.
+
+    Args:
+      image_paths: {key: image_path} for every image that needs one.
+
+    Returns:
+      {key: placeholder}. Images that cannot be decoded are reported and left out.
+    """
+    thumbnails = {}
+    for key, image_path in image_paths.items():
+        try:
+            thumbnails[key] = load_thumbnail(image_path)
+        except (IOError, ValueError) as e:
+            print(f"WARNING: Could not compute a placeholder for {image_path}. Error: {e}")
+    colors = dominant_colors([np.asarray(thumbnail) for thumbnail in thumbnails.values()])
+    return {
+        key: {"color": color, "thumbnail": _thumbnail_data_url(thumbnail)}
+        for (key, thumbnail), color in zip(thumbnails.items(), colors)
+    }
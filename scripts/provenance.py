@@ -0,0 +1,309 @@
+"""
+A single indexed record of how every generated asset was made.
+
+Replaces the `*_prompt.txt` files the generators used to write next to each
+image in the web root. Records are appended to `provenance/assets.jsonl`
+(one JSON object per line, outside www/ so nothing is shipped) with:
+
+  asset      Path of the image relative to www/.
+  kind       "portrait", "location" or "map".
+  prompt, model, config
+  seed       Seed of the random generator that picked the prompt's parts.
+  timestamp  When the image was written (seconds since the epoch).
+  latency    Seconds the successful API call took.
+  sha256     Digest of the saved image.
+
+An index file next to the log maps asset paths and models to byte offsets,
+so queries seek straight to the matching lines. It is rebuilt automatically
+whenever it is missing or does not match the log.
+
+Usage:
+  python scripts/provenance.py asset assets/images/portraits/npc_one_eyed_jack_portrait.jpg
+  python scripts/provenance.py model imagen-3.0-fast-generate-001
+  python scripts/provenance.py import-sidecars   # migrate old *_prompt.txt files
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_ROOT = os.path.join(PROJECT_ROOT, "www")
+DEFAULT_STORE_PATH = os.path.join(PROJECT_ROOT, "provenance", "assets.jsonl")
+INDEX_SUFFIX = ".idx"
+DEFAULT_BATCH_SIZE = 20
+SIDECAR_SUFFIX = "_prompt.txt"
+
+
+def web_relative(path):
+    """Returns a filesystem path as a path relative to www/."""
+    return os.path.relpath(os.path.abspath(path), WEB_ROOT).replace(os.sep, "/")
+
+
+def bytes_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return bytes_digest(f.read())
+
+
+class ProvenanceStore:
+    """
+    Append-only provenance log with an offset index.
+
+    Writes are buffered and flushed in batches; call flush() (or use the
+    store as a context manager) before the process exits.
+
+    Args:
+      path: The JSONL log file. Defaults to provenance/assets.jsonl.
+      batch_size: How many records to buffer before appending to disk.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.batch_size = batch_size
+        self._pending = []
+        self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def record(self, asset_path, kind, prompt, model=None, config=None, seed=None, latency=None,
+               image_bytes=None, timestamp=None):
+        """
+        Queues a provenance record for an asset.
+
+        Args:
+          asset_path: Filesystem path of the saved image.
+          kind: "portrait", "location" or "map".
+          prompt: The full prompt text sent to the model.
+          model: The model id.
+          config: The request config (a dict or a GenerateImagesConfig).
+          seed: The seed used to pick the prompt's components.
+          latency: Seconds the successful API call took.
+          image_bytes: The bytes that were written. If omitted the saved file
+            is hashed instead.
+          timestamp: Defaults to now.
+        """
+        if hasattr(config, "model_dump"):
+            config = config.model_dump(mode="json", exclude_none=True)
+        if image_bytes is not None:
+            digest = bytes_digest(image_bytes)
+        elif os.path.exists(asset_path):
+            digest = file_digest(asset_path)
+        else:
+            digest = None
+        self._pending.append({
+            "asset": web_relative(asset_path),
+            "kind": kind,
+            "prompt": prompt,
+            "model": model,
+            "config": config,
+            "seed": seed,
+            "timestamp": round(timestamp if timestamp is not None else time.time(), 3),
+            "latency": round(latency, 3) if latency is not None else None,
+            "sha256": digest,
+        })
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Appends all buffered records to the log and updates the index."""
+        if not self._pending:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        index = self._load_index()
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            for entry in self._pending:
+                line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+                f.write(line)
+                self._add_to_index(index, entry, offset)
+                offset += len(line)
+        index["logSize"] = offset
+        self._save_index(index)
+        print(f"INFO: Recorded provenance for {len(self._pending)} asset(s) in {self.path}.")
+        self._pending = []
+
+    @staticmethod
+    def _add_to_index(index, entry, offset):
+        index["assets"].setdefault(entry["asset"], []).append(offset)
+        if entry.get("model"):
+            index["models"].setdefault(entry["model"], []).append(offset)
+
+    def _log_size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def _load_index(self):
+        if self._index is not None and self._index.get("logSize") == self._log_size():
+            return self._index
+        index = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as f:
+                    index = json.load(f)
+            except (IOError, json.JSONDecodeError):
+                index = None
+        if index is None or index.get("logSize") != self._log_size():
+            index = self.reindex()
+        self._index = index
+        return index
+
+    def _save_index(self, index):
+        with open(self.index_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        self._index = index
+
+    def reindex(self):
+        """Rebuilds the offset index from the log."""
+        index = {"logSize": 0, "assets": {}, "models": {}}
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                offset = 0
+                for line in f:
+                    if line.strip():
+                        self._add_to_index(index, json.loads(line), offset)
+                    offset += len(line)
+                index["logSize"] = offset
+        if os.path.isdir(os.path.dirname(self.path)):
+            self._save_index(index)
+        return index
+
+    def _read_at(self, offsets):
+        records = []
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def for_asset(self, asset):
+        """Returns every record for an asset path (relative to www/), oldest first."""
+        if not os.path.exists(self.path):
+            return []
+        return self._read_at(self._load_index()["assets"].get(asset, []))
+
+    def latest_for_asset(self, asset):
+        records = self.for_asset(asset)
+        return records[-1] if records else None
+
+    def for_model(self, model):
+        """Returns the latest record of every asset made with a model."""
+        if not os.path.exists(self.path):
+            return []
+        latest = {}
+        for entry in self._read_at(self._load_index()["models"].get(model, [])):
+            latest[entry["asset"]] = entry
+        return [entry for entry in latest.values() if self.latest_for_asset(entry["asset"]) == entry]
+
+
+def _sidecar_image_path(sidecar_path):
+    stem = sidecar_path[:-len(SIDECAR_SUFFIX)]
+    for candidate in (stem + "_portrait.jpg", stem + "_generated.jpg", stem + ".jpg"):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _sidecar_kind(image_path):
+    if image_path.endswith("_portrait.jpg"):
+        return "portrait"
+    if image_path.endswith("_generated.jpg"):
+        return "location"
+    return "map"
+
+
+def import_sidecars(store, web_root=WEB_ROOT, delete=True):
+    """
+    Moves legacy *_prompt.txt files into the provenance store.
+
+    Args:
+      store: The ProvenanceStore to record into.
+      web_root: Directory to search for sidecar files.
+      delete: Remove each sidecar once it has been imported.
+
+    Returns:
+      The number of sidecar files imported.
+    """
+    imported = 0
+    imported_paths = []
+    for directory, _, filenames in os.walk(web_root):
+        for filename in sorted(filenames):
+            if not filename.endswith(SIDECAR_SUFFIX):
+                continue
+            sidecar_path = os.path.join(directory, filename)
+            image_path = _sidecar_image_path(sidecar_path)
+            with open(sidecar_path, "r", encoding="utf-8") as f:
+                prompt = f.read()
+            if image_path is None:
+                print(f"WARNING: No image found for {sidecar_path}. Left in place.")
+                continue
+            if prompt and store.latest_for_asset(web_relative(image_path)) is None:
+                store.record(image_path, _sidecar_kind(image_path), prompt,
+                             timestamp=os.path.getmtime(image_path))
+            imported += 1
+            imported_paths.append(sidecar_path)
+    store.flush()
+    if delete:
+        for sidecar_path in imported_paths:
+            os.remove(sidecar_path)
+    print(f"SUCCESS: Imported {imported} sidecar prompt file(s).")
+    return imported
+
+
+def _print_record(entry):
+    print(f"{entry['asset']}")
+    print(f"  kind: {entry.get('kind')}  model: {entry.get('model') or 'unknown'}  seed: {entry.get('seed')}")
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["timestamp"])) if entry.get("timestamp") else "unknown"
+    latency = f"{entry['latency']:.2f}s" if entry.get("latency") is not None else "unknown"
+    print(f"  made: {when}  latency: {latency}  sha256: {entry.get('sha256')}")
+    print(f"  prompt: {entry.get('prompt')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query how generated assets were made.')
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE_PATH, help='Provenance log file.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    asset_parser = subparsers.add_parser('asset', help='Show the prompt and settings that made an asset.')
+    asset_parser.add_argument('path', type=str, help='Asset path, relative to www/ or to the current directory.')
+    asset_parser.add_argument('--history', action='store_true', help='Show every recorded generation, not just the latest.')
+    model_parser = subparsers.add_parser('model', help='List assets whose current version was made with a model.')
+    model_parser.add_argument('model', type=str)
+    subparsers.add_parser('import-sidecars', help='Import and delete legacy *_prompt.txt files.')
+    subparsers.add_parser('reindex', help='Rebuild the offset index from the log.')
+    args = parser.parse_args()
+
+    store = ProvenanceStore(args.store)
+    if args.command == 'asset':
+        asset = args.path
+        if os.path.exists(asset):
+            asset = web_relative(asset)
+        elif asset.startswith("../www/"):
+            asset = asset[len("../www/"):]
+        records = store.for_asset(asset)
+        if not records:
+            print(f"No provenance recorded for {asset}.")
+        for entry in (records if args.history else records[-1:]):
+            _print_record(entry)
+    elif args.command == 'model':
+        records = store.for_model(args.model)
+        for entry in sorted(records, key=lambda entry: entry["asset"]):
+            print(entry["asset"])
+        print(f"{len(records)} asset(s) made with {args.model}.")
+    elif args.command == 'import-sidecars':
+        import_sidecars(store)
+    elif args.command == 'reindex':
+        index = store.reindex()
+        print(f"Indexed {sum(len(offsets) for offsets in index['assets'].values())} record(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,877 @@
+"""
+Explores every game state the data files allow, to check that content can be completed.
+
+Content bugs such as a puzzle whose `successDialogNodeId` can never be reached,
+a hidden item no interaction can reveal or a `requiredItemId` that is never
+obtainable otherwise only show up in play. This script loads the five data
+files and searches the game states reachable from a new game (empty
+inventory, quests at their npcs.json status, neutral alignment).
+
+Modelled actions and effects:
+
+  travel      The map reaches every POI whose `requiredItems` are held;
+              POI actions with a `targetLocationId` reach their target.
+  hidden      Item pickups (with their `condition`, once each), interactable features
+              (`requiredItemId`, `revealsItemId`, `consumesRequiredItem`) and
+              hidden objects that trigger puzzles.
+  markets     Items a market sells to the player.
+  dialogue    Talking to NPCs at reachable POIs, node and choice conditions,
+              node effects (applied on entering the node) and choice effects.
+  puzzles     Success, failure and skip outcomes, with their effects and
+              dialogue nodes.
+  effects     ADD_ITEM, REMOVE_ITEM, SET_GAME_STATE, START_QUEST,
+              COMPLETE_QUEST, FAIL_QUEST, UPDATE_QUEST_STATUS/SET_QUEST_STATUS,
+              UPDATE_QUEST_OBJECTIVE, UPDATE_PLAYER_STAT, ALIGNMENT_SHIFT,
+              RECRUIT_COMPANION/DISMISS_COMPANION and TRIGGER_PUZZLE. An
+              in-progress quest also completes once its `completionConditions`
+              (`gameStateSet`, `itemCollected`) hold.
+
+States are canonicalised into hashable tuples. To keep them few, a state
+holds only what a condition can read: the player's position is left out (the
+map is always one step away), as are resources, XP and standing. Items,
+game-state variables and stats are tracked only if some condition or
+requirement checks them, and quest statuses no condition tests are merged.
+Everything else is recorded once, when it is first obtained or set.
+
+Conversations are memoized. Each one (talking to an NPC, or a puzzle started
+from a hidden object) is explored node by node once per distinct value of
+the variables it can read or write (its footprint), and the outcomes are
+reused for every other state with the same footprint. The outer search runs
+over the states between conversations, cheapest (fewest actions) first, so
+the path found to each quest completion is a shortest one.
+
+Usage:
+  python scripts/world_explorer.py [--data-dir www/data] [--max-states N] [--strict]
+"""
+
+import argparse
+import collections
+import heapq
+import itertools
+import sys
+import time
+
+from world_model import load_world
+
+DEFAULT_MAX_STATES = 1_000_000
+END_NODE_ID = "END"
+ALIGNMENT_CONFLICT_NODE_ID = "ALIGNMENT_CONFLICT_NODE"
+# Dialogue trees the game opens by name rather than through an NPC; their
+# nodes are not expected to be reached by talking and are left out of the report.
+SENTINEL_DIALOGUE_TREES = {"_ALIGNMENT_CONFLICTS"}
+NEUTRAL_ALIGNMENT = "neutral"
+CONFLICTING_ALIGNMENTS = {("good", "evil"), ("evil", "good")}
+IN_PROGRESS_STATUS = "in_progress"
+COMPLETED_STATUS = "completed"
+# Stands in for every quest status no condition tests.
+UNTESTED_STATUS = "*"
+# Effects that set a quest's status; None means the effect names the status.
+QUEST_STATUS_EFFECTS = {"START_QUEST": IN_PROGRESS_STATUS, "COMPLETE_QUEST": COMPLETED_STATUS,
+                        "FAIL_QUEST": "failed", "UPDATE_QUEST_STATUS": None, "SET_QUEST_STATUS": None}
+OBJECTIVE_EFFECTS = ("UPDATE_QUEST_OBJECTIVE", "UPDATE_QUEST_PROGRESS")
+# Effects on things no condition can read.
+IGNORED_EFFECTS = {"ADD_RESOURCE", "ADD_XP", "ADD_STANDING", "DISMISS_COMPANION"}
+
+# A state the search has reached. Every field is hashable and canonical
+# (frozensets, or tuples in a fixed order), so equal situations compare equal.
+GameState = collections.namedtuple("GameState", [
+    "node_id",      # Current dialogue node, or None between conversations.
+    "inventory",    # frozenset of tracked item ids.
+    "quests",       # Tuple of quest statuses, in WorldExplorer.quest_ids order.
+                    # Statuses no condition tests are all UNTESTED_STATUS.
+    "objectives",   # frozenset of completed objective ids.
+    "game_state",   # frozenset of (variable, value) pairs for tracked variables.
+    "stats",        # frozenset of (stat, value) pairs for tracked stats.
+    "handled",      # frozenset of (poi_id, hidden_object_id) features already used
+                    # or items already picked up.
+    "alignment",
+])
+
+# The parts of a state a conversation can read or write. `quests` holds
+# indexes into the state's quest tuple.
+Footprint = collections.namedtuple("Footprint", [
+    "items", "quests", "objectives", "variables", "stats", "alignment",
+])
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _compare(left, operator, right):
+    if left is None:
+        return False
+    if operator == "===":
+        return left == right
+    if operator == "!==":
+        return left != right
+    try:
+        if operator == ">=":
+            return left >= right
+        if operator == "<=":
+            return left <= right
+        if operator == ">":
+            return left > right
+        if operator == "<":
+            return left < right
+    except TypeError:
+        return False
+    return False
+
+
+def _keep(pairs, names):
+    return frozenset(pair for pair in pairs if pair[0] in names)
+
+
+def _drop(pairs, names):
+    return frozenset(pair for pair in pairs if pair[0] not in names)
+
+
+class ExplorationReport:
+    """
+    What the search reached.
+
+    Attributes:
+      states: Number of distinct states between conversations expanded.
+      conversation_states: Number of states explored inside conversations.
+      truncated: True if the search stopped at max_states.
+      seconds: Wall-clock time the search took.
+      unreachable: {category: [description]} for content never reached.
+      quest_paths: {quest_id: [action]} shortest action list completing each quest.
+      problems: Broken references and unsupported data found along the way.
+    """
+
+    def __init__(self):
+        self.states = 0
+        self.conversation_states = 0
+        self.truncated = False
+        self.seconds = 0.0
+        self.unreachable = {}
+        self.quest_paths = {}
+        self.problems = []
+
+    def has_unreachable_content(self):
+        return any(self.unreachable.values())
+
+
+class WorldExplorer:
+    """
+    Searches the game states a WorldModel allows.
+
+    Args:
+      world: A WorldModel (see world_model.load_world).
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self._problems = []
+
+        self.quest_ids = []
+        self.quests_by_id = {}
+        for npc in world.npcs:
+            for quest in npc.quests or []:
+                if isinstance(quest, dict) and quest.get("id") and quest["id"] not in self.quests_by_id:
+                    self.quest_ids.append(quest["id"])
+                    self.quests_by_id[quest["id"]] = quest
+        for quest_id in sorted(self._referenced_quest_ids() - set(self.quests_by_id)):
+            self._problem(f"Quest {quest_id} is referenced but not defined in any NPC's quests.")
+            self.quest_ids.append(quest_id)
+        self._quest_index = {quest_id: number for number, quest_id in enumerate(self.quest_ids)}
+
+        self._collect_tracked_variables()
+        self._tested_statuses = [self._collect_tested_statuses(quest_id) for quest_id in self.quest_ids]
+        self._accessible_cache = {}
+        self._footprints = {}
+        self._reset_search()
+
+    # --- Setup -----------------------------------------------------------
+
+    def _problem(self, message):
+        if message not in self._problems:
+            self._problems.append(message)
+
+    def _reset_search(self):
+        # Everything ever obtained or set, including what states do not track.
+        self._obtained = {"items": set(), "variables": set(), "companions": set()}
+        self._coverage = {key: set() for key in
+                          ("nodes", "choices", "puzzles", "puzzle_outcomes", "hidden_objects", "pois")}
+        self._outcome_cache = {}
+        self._conversation_states = 0
+
+    def _iter_conditions(self):
+        for nodes in self.world.dialogues.values():
+            for node in nodes.values():
+                if node.condition:
+                    yield node.condition
+                for choice in node.player_choices or []:
+                    if choice.condition:
+                        yield choice.condition
+        for poi in self.world.pois:
+            for hidden_object in poi.hidden_objects or []:
+                if hidden_object.condition:
+                    yield hidden_object.condition
+
+    def _iter_effects(self):
+        for nodes in self.world.dialogues.values():
+            for node in nodes.values():
+                yield from node.effects or []
+                for choice in node.player_choices or []:
+                    yield from choice.effects or []
+        for puzzle in self.world.puzzles:
+            yield from puzzle.success_effects or []
+            yield from puzzle.failure_effects or []
+
+    def _referenced_quest_ids(self):
+        quest_ids = set()
+        for effect in self._iter_effects():
+            if isinstance(effect, dict) and effect.get("questId"):
+                quest_ids.add(effect["questId"])
+        for condition in self._iter_conditions():
+            if isinstance(condition.get("questStatus"), dict):
+                quest_ids.add(condition["questStatus"].get("questId"))
+            if condition.get("questInProgress"):
+                quest_ids.add(condition["questInProgress"])
+        return quest_ids - {None}
+
+    def _collect_tracked_variables(self):
+        """Finds the items, game-state variables and stats some condition reads."""
+        self.tracked_items = set()
+        self.tracked_variables = set()
+        self.stat_bounds = {}
+        for condition in self._iter_conditions():
+            for key in ("hasItem", "lacksItem", "hasItems"):
+                self.tracked_items.update(_as_list(condition.get(key)))
+            if isinstance(condition.get("gameState"), dict):
+                self.tracked_variables.add(condition["gameState"].get("variable"))
+            if isinstance(condition.get("playerStat"), dict):
+                stat = condition["playerStat"].get("stat")
+                value = condition["playerStat"].get("value")
+                if isinstance(value, (int, float)):
+                    low, high = self.stat_bounds.get(stat, (value, value))
+                    self.stat_bounds[stat] = (min(low, value), max(high, value))
+        for poi in self.world.pois:
+            self.tracked_items.update(poi.required_items or [])
+            for hidden_object in poi.hidden_objects or []:
+                if isinstance(hidden_object.interaction, dict) and hidden_object.interaction.get("requiredItemId"):
+                    self.tracked_items.add(hidden_object.interaction["requiredItemId"])
+        for quest_id in self.quest_ids:
+            items, variables = self._completion_variables(quest_id)
+            self.tracked_items.update(items)
+            self.tracked_variables.update(variables)
+        self.tracked_items.discard(None)
+        self.tracked_variables.discard(None)
+
+    def _completion_variables(self, quest_id):
+        """Returns the (items, variables) a quest's completionConditions read."""
+        completion = self.quests_by_id.get(quest_id, {}).get("completionConditions") or {}
+        return set(_as_list(completion.get("itemCollected"))), set(_as_list(completion.get("gameStateSet")))
+
+    def _collect_tested_statuses(self, quest_id):
+        """Returns the statuses of a quest that some condition can tell apart."""
+        statuses = set()
+        for condition in self._iter_conditions():
+            if isinstance(condition.get("questStatus"), dict) and condition["questStatus"].get("questId") == quest_id:
+                statuses.update(_as_list(condition["questStatus"].get("status")))
+            if condition.get("questInProgress") == quest_id:
+                statuses.add(IN_PROGRESS_STATUS)
+        if self.quests_by_id.get(quest_id, {}).get("completionConditions"):
+            statuses.add(IN_PROGRESS_STATUS)
+        return statuses
+
+    def canonical_status(self, index, status):
+        return status if status in self._tested_statuses[index] else UNTESTED_STATUS
+
+    def initial_state(self):
+        statuses = tuple(self.canonical_status(index, self.quests_by_id.get(quest_id, {}).get("status"))
+                         for index, quest_id in enumerate(self.quest_ids))
+        return GameState(None, frozenset(), statuses, frozenset(), frozenset(), frozenset(), frozenset(),
+                         NEUTRAL_ALIGNMENT)
+
+    # --- Conditions and effects --------------------------------------------
+
+    def quest_status(self, state, quest_id):
+        index = self._quest_index.get(quest_id)
+        return state.quests[index] if index is not None else None
+
+    def condition_met(self, condition, state):
+        """Returns True if every clause of a node, choice or hidden-object condition holds."""
+        if not condition:
+            return True
+        for key, details in condition.items():
+            if key == "questStatus":
+                statuses = _as_list(details.get("status"))
+                if self.quest_status(state, details.get("questId")) not in statuses:
+                    return False
+            elif key == "questInProgress":
+                if self.quest_status(state, details) != IN_PROGRESS_STATUS:
+                    return False
+            elif key == "questObjectiveCompleted":
+                if details not in state.objectives:
+                    return False
+            elif key == "questObjectiveIncomplete":
+                if details in state.objectives:
+                    return False
+            elif key == "hasItem":
+                if details not in state.inventory:
+                    return False
+            elif key == "hasItems":
+                if not all(item_id in state.inventory for item_id in details):
+                    return False
+            elif key == "lacksItem":
+                if details in state.inventory:
+                    return False
+            elif key == "gameState":
+                value = dict(state.game_state).get(details.get("variable"))
+                if not _compare(value, details.get("operator", "==="), details.get("value")):
+                    return False
+            elif key == "playerStat":
+                value = dict(state.stats).get(details.get("stat"), 0)
+                if not _compare(value, details.get("operator", "==="), details.get("value")):
+                    return False
+            else:
+                self._problem(f"Unknown condition type {key!r}; treated as never met.")
+                return False
+        return True
+
+    def apply_effects(self, state, effects):
+        """
+        Applies a list of effects to a state.
+
+        Untracked items, variables and companions are recorded as obtained
+        but do not change the state.
+
+        Returns:
+          (new_state, puzzle_id, completed), where puzzle_id is the puzzle a
+          TRIGGER_PUZZLE effect started, or None, and completed is a tuple of
+          the quests the effects completed.
+        """
+        if not effects:
+            return state, None, ()
+        inventory = set(state.inventory)
+        quests = list(state.quests)
+        objectives = set(state.objectives)
+        game_state = dict(state.game_state)
+        stats = dict(state.stats)
+        alignment = state.alignment
+        puzzle_id = None
+        completed = []
+
+        for effect in effects:
+            if not isinstance(effect, dict):
+                continue
+            effect_type = effect.get("type")
+            if effect_type == "ADD_ITEM":
+                item_id = effect.get("itemId")
+                self._obtained["items"].add(item_id)
+                if item_id in self.tracked_items:
+                    inventory.add(item_id)
+            elif effect_type == "REMOVE_ITEM":
+                inventory.discard(effect.get("itemId"))
+            elif effect_type == "SET_GAME_STATE":
+                variable = effect.get("variable")
+                self._obtained["variables"].add(variable)
+                if variable in self.tracked_variables:
+                    game_state[variable] = effect.get("value")
+            elif effect_type in QUEST_STATUS_EFFECTS:
+                status = QUEST_STATUS_EFFECTS[effect_type] or effect.get("status")
+                index = self._quest_index.get(effect.get("questId"))
+                if index is not None:
+                    if status == COMPLETED_STATUS:
+                        completed.append(effect["questId"])
+                    quests[index] = self.canonical_status(index, status)
+            elif effect_type in OBJECTIVE_EFFECTS:
+                if effect.get("isCompleted", True):
+                    objectives.add(effect.get("objectiveId"))
+                else:
+                    objectives.discard(effect.get("objectiveId"))
+            elif effect_type == "UPDATE_PLAYER_STAT":
+                stat = effect.get("stat")
+                if stat in self.stat_bounds:
+                    low, high = self.stat_bounds[stat]
+                    value = stats.get(stat, 0) + (effect.get("change") or 0)
+                    # Values beyond the thresholds conditions test behave the same.
+                    stats[stat] = max(low - 1, min(high + 1, value))
+            elif effect_type == "ALIGNMENT_SHIFT":
+                if effect.get("direction"):
+                    alignment = effect["direction"]
+            elif effect_type == "RECRUIT_COMPANION":
+                self._obtained["companions"].add(effect.get("companionId") or effect.get("npcId"))
+            elif effect_type == "TRIGGER_PUZZLE":
+                puzzle_id = effect.get("puzzleId")
+            elif effect_type not in IGNORED_EFFECTS:
+                self._problem(f"Unknown effect type {effect_type!r}; ignored.")
+
+        for index, quest_id in enumerate(self.quest_ids):
+            if quests[index] == IN_PROGRESS_STATUS and self._completion_met(quest_id, inventory, game_state):
+                completed.append(quest_id)
+                quests[index] = self.canonical_status(index, COMPLETED_STATUS)
+
+        return state._replace(
+            inventory=frozenset(inventory),
+            quests=tuple(quests),
+            objectives=frozenset(objectives),
+            game_state=frozenset(game_state.items()),
+            stats=frozenset(stats.items()),
+            alignment=alignment,
+        ), puzzle_id, tuple(completed)
+
+    def _completion_met(self, quest_id, inventory, game_state):
+        completion = self.quests_by_id.get(quest_id, {}).get("completionConditions") or {}
+        if completion.get("gameStateSet") and game_state.get(completion["gameStateSet"]):
+            return True
+        if completion.get("itemCollected") and completion["itemCollected"] in inventory:
+            return True
+        return False
+
+    # --- Conversations -------------------------------------------------------
+
+    def _conversation_content(self, entry):
+        """Returns the (conditions, effects) of every node, choice and puzzle a conversation can reach."""
+        kind, key = entry
+        node_ids = [next(iter(self.world.dialogues[key]))] if kind == "npc" else []
+        puzzle_ids = [key] if kind == "puzzle" else []
+        seen_nodes, seen_puzzles = set(), set()
+        conditions, effects = [], []
+
+        def add_effects(new_effects):
+            for effect in new_effects or []:
+                if isinstance(effect, dict):
+                    effects.append(effect)
+                    if effect.get("type") == "TRIGGER_PUZZLE":
+                        puzzle_ids.append(effect.get("puzzleId"))
+
+        while node_ids or puzzle_ids:
+            if puzzle_ids:
+                puzzle = self.world.puzzles_by_id.get(puzzle_ids.pop())
+                if puzzle is None or puzzle.id in seen_puzzles:
+                    continue
+                seen_puzzles.add(puzzle.id)
+                add_effects(puzzle.success_effects)
+                add_effects(puzzle.failure_effects)
+                node_ids.extend([puzzle.success_dialog_node_id, puzzle.failure_dialog_node_id,
+                                 puzzle.skip_dialog_node_id])
+                continue
+            node = self.world.dialogue_nodes_by_id.get(node_ids.pop())
+            if node is None or node.id in seen_nodes:
+                continue
+            seen_nodes.add(node.id)
+            conditions.append(node.condition)
+            add_effects(node.effects)
+            for choice in node.player_choices or []:
+                conditions.append(choice.condition)
+                add_effects(choice.effects)
+                node_ids.append(choice.next_node_id)
+        return [condition for condition in conditions if condition], effects
+
+    def footprint(self, entry):
+        """
+        Returns the Footprint of a conversation: every tracked variable it can read or write.
+
+        States that agree on a conversation's footprint have the same
+        conversation outcomes, and a conversation changes nothing outside its
+        footprint. Memoized per entry.
+        """
+        if entry in self._footprints:
+            return self._footprints[entry]
+        conditions, effects = self._conversation_content(entry)
+        items, quests, objectives, variables, stats = set(), set(), set(), set(), set()
+        alignment = False
+        for condition in conditions:
+            for key in ("hasItem", "lacksItem", "hasItems"):
+                items.update(_as_list(condition.get(key)))
+            if isinstance(condition.get("questStatus"), dict):
+                quests.add(condition["questStatus"].get("questId"))
+            quests.add(condition.get("questInProgress"))
+            objectives.update(_as_list(condition.get("questObjectiveCompleted")))
+            objectives.update(_as_list(condition.get("questObjectiveIncomplete")))
+            if isinstance(condition.get("gameState"), dict):
+                variables.add(condition["gameState"].get("variable"))
+            if isinstance(condition.get("playerStat"), dict):
+                stats.add(condition["playerStat"].get("stat"))
+        for effect in effects:
+            effect_type = effect.get("type")
+            if effect_type in ("ADD_ITEM", "REMOVE_ITEM"):
+                items.add(effect.get("itemId"))
+            elif effect_type in QUEST_STATUS_EFFECTS:
+                quests.add(effect.get("questId"))
+            elif effect_type in OBJECTIVE_EFFECTS:
+                objectives.add(effect.get("objectiveId"))
+            elif effect_type == "SET_GAME_STATE":
+                variables.add(effect.get("variable"))
+            elif effect_type == "UPDATE_PLAYER_STAT":
+                stats.add(effect.get("stat"))
+            elif effect_type == "ALIGNMENT_SHIFT":
+                alignment = True
+        # A quest also completes when a variable its completionConditions read changes.
+        for quest_id in self.quest_ids:
+            completion_items, completion_variables = self._completion_variables(quest_id)
+            if quest_id in quests or completion_items & items or completion_variables & variables:
+                quests.add(quest_id)
+                items.update(completion_items)
+                variables.update(completion_variables)
+        footprint = Footprint(
+            frozenset(items & self.tracked_items),
+            tuple(sorted(self._quest_index[quest_id] for quest_id in quests if quest_id in self._quest_index)),
+            frozenset(objectives - {None}),
+            frozenset(variables & self.tracked_variables),
+            frozenset(stats & set(self.stat_bounds)),
+            alignment,
+        )
+        self._footprints[entry] = footprint
+        return footprint
+
+    @staticmethod
+    def _project(state, footprint):
+        return (
+            state.inventory & footprint.items,
+            tuple(state.quests[index] for index in footprint.quests),
+            state.objectives & footprint.objectives,
+            _keep(state.game_state, footprint.variables),
+            _keep(state.stats, footprint.stats),
+            state.alignment if footprint.alignment else None,
+        )
+
+    @staticmethod
+    def _merge(state, outcome, footprint):
+        """Returns `state` with the footprint's variables taken from a conversation's end state."""
+        quests = list(state.quests)
+        for index in footprint.quests:
+            quests[index] = outcome.quests[index]
+        game_state, stats = state.game_state, state.stats
+        if footprint.variables:
+            game_state = _drop(game_state, footprint.variables) | _keep(outcome.game_state, footprint.variables)
+        if footprint.stats:
+            stats = _drop(stats, footprint.stats) | _keep(outcome.stats, footprint.stats)
+        return state._replace(
+            node_id=None,
+            inventory=(state.inventory - footprint.items) | (outcome.inventory & footprint.items),
+            quests=tuple(quests),
+            objectives=(state.objectives - footprint.objectives) | (outcome.objectives & footprint.objectives),
+            game_state=game_state,
+            stats=stats,
+            alignment=outcome.alignment if footprint.alignment else state.alignment,
+        )
+
+    def _enter_node(self, state, node_id, completed=()):
+        """
+        Moves into a dialogue node.
+
+        Returns:
+          [(label suffix, next state, completed quests)] for the states it
+          leads to; empty if the node cannot be entered.
+        """
+        if node_id in (None, END_NODE_ID):
+            return [("", state._replace(node_id=None), completed)]
+        node = self.world.dialogue_nodes_by_id.get(node_id)
+        if node is None:
+            self._problem(f"Dialogue node {node_id} is referenced but does not exist.")
+            return []
+        if not self.condition_met(node.condition, state):
+            return []
+        self._coverage["nodes"].add(node_id)
+        state, puzzle_id, node_completed = self.apply_effects(state._replace(node_id=node_id), node.effects)
+        if puzzle_id:
+            return self._puzzle_outcomes(state, puzzle_id, completed + node_completed)
+        return [("", state, completed + node_completed)]
+
+    def _puzzle_outcomes(self, state, puzzle_id, completed=()):
+        """Returns [(label suffix, next state, completed quests)] for each way a puzzle can end."""
+        puzzle = self.world.puzzles_by_id.get(puzzle_id)
+        if puzzle is None:
+            self._problem(f"Puzzle {puzzle_id} is triggered but does not exist.")
+            return []
+        self._coverage["puzzles"].add(puzzle_id)
+        outcomes = [
+            ("solve", puzzle.success_effects, puzzle.success_dialog_node_id),
+            ("fail", puzzle.failure_effects, puzzle.failure_dialog_node_id),
+            ("skip", None, puzzle.skip_dialog_node_id or puzzle.failure_dialog_node_id),
+        ]
+        results = []
+        for outcome, effects, node_id in outcomes:
+            after, _, outcome_completed = self.apply_effects(state._replace(node_id=None), effects)
+            for _, next_state, next_completed in self._enter_node(after, node_id, completed + outcome_completed):
+                self._coverage["puzzle_outcomes"].add((puzzle_id, outcome))
+                results.append((f", then {outcome} puzzle {puzzle_id}", next_state, next_completed))
+        return results
+
+    def _choices(self, state):
+        """Yields (action, next state, completed quests) for each choice open at the current node."""
+        node = self.world.dialogue_nodes_by_id[state.node_id]
+        for number, choice in enumerate(node.player_choices or []):
+            if not self.condition_met(choice.condition, state):
+                continue
+            self._coverage["choices"].add((state.node_id, number))
+            label = f"Choose \"{choice.text}\" ({state.node_id})"
+            after, puzzle_id, completed = self.apply_effects(state, choice.effects)
+            if puzzle_id:
+                results = self._puzzle_outcomes(after, puzzle_id, completed)
+            else:
+                results = self._enter_node(after, choice.next_node_id or END_NODE_ID, completed)
+            for suffix, next_state, next_completed in results:
+                yield label + suffix, next_state, next_completed
+
+    def _explore_conversation(self, starts):
+        """
+        Explores a conversation node by node until it ends.
+
+        Args:
+          starts: [(label suffix, state, completed quests)] from entering it.
+
+        Returns:
+          [(actions, end state, completed quests)], one per distinct way the
+          conversation can end, each with the fewest choices.
+        """
+        outcomes = []
+        seen = set()
+        queue = collections.deque(((suffix,), state, completed) for suffix, state, completed in starts)
+        while queue:
+            actions, state, completed = queue.popleft()
+            key = (state, frozenset(completed))
+            if key in seen:
+                continue
+            seen.add(key)
+            if state.node_id is None:
+                outcomes.append((actions, state, completed))
+                continue
+            self._conversation_states += 1
+            for action, next_state, next_completed in self._choices(state):
+                queue.append((actions + (action,), next_state, completed + next_completed))
+        return outcomes
+
+    def conversation_outcomes(self, state, entry, start):
+        """
+        Returns [(actions, next state, completed quests)] for a conversation.
+
+        Args:
+          state: The state the conversation starts from.
+          entry: ("npc", npc_id) or ("puzzle", puzzle_id).
+          start: Called with a state to enter the conversation; returns
+            [(label suffix, state, completed quests)].
+        """
+        footprint = self.footprint(entry)
+        key = (entry, self._project(state, footprint))
+        outcomes = self._outcome_cache.get(key)
+        if outcomes is None:
+            # Outcomes that change nothing lead back to the same state and are dropped.
+            outcomes = [(actions, end, completed) for actions, end, completed in self._explore_conversation(start(state))
+                        if completed or self._project(end, footprint) != key[1]]
+            self._outcome_cache[key] = outcomes
+        return [(actions, self._merge(state, end, footprint), completed) for actions, end, completed in outcomes]
+
+    # --- Actions between conversations ---------------------------------------
+
+    def accessible_poi_ids(self, inventory):
+        """Returns the POIs reachable with an inventory. Memoized per inventory."""
+        if inventory in self._accessible_cache:
+            return self._accessible_cache[inventory]
+        accessible = [poi.id for poi in self.world.pois
+                      if all(item_id in inventory for item_id in poi.required_items or [])]
+        seen = set(accessible)
+        for poi_id in accessible:
+            for action in self.world.pois_by_id[poi_id].actions or []:
+                target = action.get("targetLocationId") if isinstance(action, dict) else None
+                if not target:
+                    continue
+                if target not in self.world.pois_by_id:
+                    self._problem(f"POI {poi_id} has an action to unknown location {target}.")
+                elif target not in seen:
+                    seen.add(target)
+                    accessible.append(target)
+        self._accessible_cache[inventory] = accessible
+        return accessible
+
+    def actions(self, state):
+        """Yields (actions, next state, completed quests) for everything the player can do next."""
+        for poi_id in self.accessible_poi_ids(state.inventory):
+            self._coverage["pois"].add(poi_id)
+            poi = self.world.pois_by_id[poi_id]
+            yield from self._hidden_object_actions(state, poi)
+            for good in poi.tradable_goods or []:
+                if (isinstance(good, dict) and good.get("type") == "item"
+                        and good.get("marketSellsToPlayerPrice") and good.get("itemIdToTrade")):
+                    item_id = good["itemIdToTrade"]
+                    self._obtained["items"].add(item_id)
+                    if item_id in self.tracked_items and item_id not in state.inventory:
+                        next_state, _, completed = self.apply_effects(state, [{"type": "ADD_ITEM", "itemId": item_id}])
+                        yield (f"At {poi_id}: buy {item_id}",), next_state, completed
+            for npc in self.world.npcs_by_location.get(poi_id, []):
+                yield from self._talk_actions(state, poi_id, npc)
+
+    def _hidden_object_actions(self, state, poi):
+        for number, hidden_object in enumerate(poi.hidden_objects or []):
+            key = (poi.id, hidden_object.id or str(number))
+            name = hidden_object.name or hidden_object.id or hidden_object.item_id
+            if not self.condition_met(hidden_object.condition, state):
+                continue
+            if hidden_object.triggers_puzzle_id:
+                self._coverage["hidden_objects"].add(key)
+                puzzle_id = hidden_object.triggers_puzzle_id
+                outcomes = self.conversation_outcomes(state, ("puzzle", puzzle_id),
+                                                      lambda start: self._puzzle_outcomes(start, puzzle_id))
+                for actions, next_state, completed in outcomes:
+                    yield (f"At {poi.id}: search {name}{actions[0]}",) + actions[1:], next_state, completed
+            elif hidden_object.is_interactable_feature:
+                interaction = hidden_object.interaction if isinstance(hidden_object.interaction, dict) else {}
+                required = interaction.get("requiredItemId")
+                if key in state.handled or (required and required not in state.inventory):
+                    continue
+                self._coverage["hidden_objects"].add(key)
+                effects = []
+                if required and interaction.get("consumesRequiredItem"):
+                    effects.append({"type": "REMOVE_ITEM", "itemId": required})
+                if interaction.get("revealsItemId"):
+                    effects.append({"type": "ADD_ITEM", "itemId": interaction["revealsItemId"]})
+                next_state, _, completed = self.apply_effects(state._replace(handled=state.handled | {key}), effects)
+                yield (f"At {poi.id}: use {name}",), next_state, completed
+            elif hidden_object.grants_resources:
+                self._coverage["hidden_objects"].add(key)
+            elif hidden_object.item_id:
+                self._coverage["hidden_objects"].add(key)
+                self._obtained["items"].add(hidden_object.item_id)
+                if (hidden_object.item_id in self.tracked_items and key not in state.handled
+                        and hidden_object.item_id not in state.inventory):
+                    next_state, _, completed = self.apply_effects(
+                        state._replace(handled=state.handled | {key}), [{"type": "ADD_ITEM", "itemId": hidden_object.item_id}])
+                    yield (f"At {poi.id}: pick up {name}",), next_state, completed
+
+    def _talk_actions(self, state, poi_id, npc):
+        tree = self.world.dialogues.get(npc.id)
+        if not tree:
+            return
+        if (state.alignment, npc.alignment) in CONFLICTING_ALIGNMENTS:
+            self._coverage["nodes"].add(ALIGNMENT_CONFLICT_NODE_ID)
+            return
+        start_node_id = next(iter(tree))
+        outcomes = self.conversation_outcomes(state, ("npc", npc.id),
+                                              lambda start: self._enter_node(start, start_node_id))
+        for actions, next_state, completed in outcomes:
+            yield (f"At {poi_id}: talk to {npc.name or npc.id}{actions[0]}",) + actions[1:], next_state, completed
+
+    # --- Search ----------------------------------------------------------
+
+    def explore(self, max_states=DEFAULT_MAX_STATES):
+        """
+        Runs the search and builds the report.
+
+        Args:
+          max_states: Stop after expanding this many states between conversations.
+
+        Returns:
+          An ExplorationReport.
+        """
+        started = time.monotonic()
+        self._reset_search()
+        report = ExplorationReport()
+
+        initial = self.initial_state()
+        costs = {initial: 0}
+        parents = {initial: None} # State -> (previous state, actions)
+        first_completions = {} # Quest id -> (cost, state, actions) of the cheapest completing step.
+        order = itertools.count()
+        frontier = [(0, next(order), initial)]
+        while frontier:
+            cost, _, state = heapq.heappop(frontier)
+            if cost > costs[state]:
+                continue
+            if report.states >= max_states:
+                report.truncated = True
+                break
+            report.states += 1
+            for actions, next_state, completed in self.actions(state):
+                next_cost = cost + len(actions)
+                for quest_id in completed:
+                    if quest_id not in first_completions or next_cost < first_completions[quest_id][0]:
+                        first_completions[quest_id] = (next_cost, state, actions)
+                if next_cost < costs.get(next_state, next_cost + 1):
+                    costs[next_state] = next_cost
+                    parents[next_state] = (state, actions)
+                    heapq.heappush(frontier, (next_cost, next(order), next_state))
+
+        for quest_id, (_, state, actions) in first_completions.items():
+            path = list(reversed(actions))
+            while parents[state] is not None:
+                state, actions = parents[state]
+                path.extend(reversed(actions))
+            report.quest_paths[quest_id] = list(reversed(path))
+
+        self._fill_unreachable(report)
+        report.conversation_states = self._conversation_states
+        report.problems = list(self._problems)
+        report.seconds = time.monotonic() - started
+        return report
+
+    def _fill_unreachable(self, report):
+        coverage = self._coverage
+        unreachable = report.unreachable
+        unreachable["quests never completed"] = [
+            quest_id for quest_id in self.quest_ids if quest_id not in report.quest_paths]
+        unreachable["POIs"] = [poi.id for poi in self.world.pois if poi.id not in coverage["pois"]]
+        unreachable["dialogue nodes"] = [
+            f"{npc_id}: {node_id}" for npc_id, nodes in self.world.dialogues.items()
+            if npc_id not in SENTINEL_DIALOGUE_TREES
+            for node_id in nodes if node_id not in coverage["nodes"]]
+        unreachable["dialogue choices"] = [
+            f"{node_id}: \"{choice.text}\"" for npc_id, nodes in self.world.dialogues.items()
+            if npc_id not in SENTINEL_DIALOGUE_TREES
+            for node_id, node in nodes.items() if node_id in coverage["nodes"]
+            for number, choice in enumerate(node.player_choices or [])
+            if (node_id, number) not in coverage["choices"]]
+        unreachable["puzzles never triggered"] = [
+            puzzle.id for puzzle in self.world.puzzles if puzzle.id not in coverage["puzzles"]]
+        unreachable["puzzle outcomes"] = [
+            f"{puzzle.id}: {outcome} -> {node_id}" for puzzle in self.world.puzzles
+            if puzzle.id in coverage["puzzles"]
+            for outcome, node_id in (("solve", puzzle.success_dialog_node_id),
+                                     ("fail", puzzle.failure_dialog_node_id))
+            if node_id and (puzzle.id, outcome) not in coverage["puzzle_outcomes"]]
+        unreachable["hidden objects"] = [
+            f"{poi.id}: {hidden_object.name or hidden_object.id or hidden_object.item_id}"
+            for poi in self.world.pois if poi.id in coverage["pois"]
+            for number, hidden_object in enumerate(poi.hidden_objects or [])
+            if (poi.id, hidden_object.id or str(number)) not in coverage["hidden_objects"]]
+        obtained = self._obtained
+        unreachable["required items never obtainable"] = sorted(self.tracked_items - obtained["items"])
+        unreachable["items never obtainable"] = sorted(
+            item.id for item in self.world.items
+            if item.id not in obtained["items"] and item.id not in self.tracked_items)
+        unreachable["game-state variables never set"] = sorted(self.tracked_variables - obtained["variables"])
+
+
+def print_report(report):
+    print(f"INFO: Explored {report.states} states between conversations and "
+          f"{report.conversation_states} inside them in {report.seconds:.2f} seconds.")
+    if report.truncated:
+        print("WARNING: Stopped at the state limit; results below are incomplete.")
+    for problem in report.problems:
+        print(f"WARNING: {problem}")
+    for category, entries in report.unreachable.items():
+        if entries:
+            print(f"\nUnreachable {category} ({len(entries)}):")
+            for entry in entries:
+                print(f"  {entry}")
+    for quest_id, path in sorted(report.quest_paths.items()):
+        print(f"\nShortest completion of {quest_id} ({len(path)} actions):")
+        for number, action in enumerate(path, start=1):
+            print(f"  {number}. {action}")
+    if not report.has_unreachable_content():
+        print("\nSUCCESS: All content is reachable.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that every quest, puzzle and dialogue in the data files can be reached.')
+    parser.add_argument('--data-dir', type=str, default=None, help='Directory containing the data files. Default: www/data.')
+    parser.add_argument('--max-states', type=int, default=DEFAULT_MAX_STATES,
+                        help=f'Stop after expanding this many states between conversations. Default: {DEFAULT_MAX_STATES}.')
+    parser.add_argument('--strict', action='store_true', help='Exit with status 1 if any content is unreachable.')
+    args = parser.parse_args()
+
+    report = WorldExplorer(load_world(args.data_dir)).explore(max_states=args.max_states)
+    print_report(report)
+    if args.strict and (report.has_unreachable_content() or report.truncated):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
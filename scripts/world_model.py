@@ -0,0 +1,431 @@
+"""
+Shared loader for the game's data files.
+
+Parses npcs.json, pois.json, items.json, puzzles.json and dialogues.json once
+into compact `__slots__` records and builds the id and reverse indexes the
+generators and build steps need, so lookups are O(1) attribute accesses
+instead of repeated `.get()` calls on raw dictionaries.
+
+Records remember the key order of the entry they were parsed from and keep
+unknown keys in `extra`, so `to_dict()` writes a file back out unchanged
+apart from the fields a script actually modified. Scripts that modify data
+call `world.update(record, attr, value)` and then `world.save_changes()`,
+which patches only the changed entries through data_store.DataStore.
+
+Data files are streamed entry by entry from either the single-file or the
+sharded layout (see data_store.py).
+"""
+
+import json
+import os
+
+from data_store import DataStore
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "www", "data")
+
+NPCS_FILENAME = "npcs.json"
+POIS_FILENAME = "pois.json"
+ITEMS_FILENAME = "items.json"
+PUZZLES_FILENAME = "puzzles.json"
+DIALOGUES_FILENAME = "dialogues.json"
+
+# Key-order tuples are shared between records with the same layout.
+_KEY_ORDERS = {}
+
+
+def _intern_keys(keys):
+    keys = tuple(keys)
+    return _KEY_ORDERS.setdefault(keys, keys)
+
+
+class Record:
+    """
+    Base class for a typed data-file entry.
+
+    Subclasses list their known JSON keys in FIELDS as
+    (json_key, attribute_name, nested_record_class_or_None) tuples.
+    """
+
+    __slots__ = ("_keys", "extra")
+    FIELDS = ()
+
+    @classmethod
+    def _field_map(cls):
+        mapping = cls.__dict__.get("_FIELD_MAP")
+        if mapping is None:
+            mapping = {json_key: (attr, nested) for json_key, attr, nested in cls.FIELDS}
+            cls._FIELD_MAP = mapping
+        return mapping
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls.__new__(cls)
+        field_map = cls._field_map()
+        for attr in cls.__slots__:
+            setattr(record, attr, None)
+        record._keys = _intern_keys(data.keys())
+        record.extra = None
+        for key, value in data.items():
+            field = field_map.get(key)
+            if field is None:
+                if record.extra is None:
+                    record.extra = {}
+                record.extra[key] = value
+                continue
+            attr, nested = field
+            if nested is not None and isinstance(value, list):
+                value = [nested.from_dict(entry) if isinstance(entry, dict) else entry for entry in value]
+            setattr(record, attr, value)
+        return record
+
+    def to_dict(self):
+        field_map = self._field_map()
+        result = {}
+        for key in self._keys:
+            result[key] = self._export(key, field_map)
+        for json_key, attr, _ in self.FIELDS:
+            if json_key not in result and getattr(self, attr) is not None:
+                result[json_key] = self._export(json_key, field_map)
+        return result
+
+    def _export(self, key, field_map):
+        field = field_map.get(key)
+        if field is None:
+            return self.extra[key]
+        value = getattr(self, field[0])
+        if field[1] is not None and isinstance(value, list):
+            value = [entry.to_dict() if isinstance(entry, Record) else entry for entry in value]
+        return value
+
+    def get(self, key, default=None):
+        """Dictionary-style access by JSON key, for code that still expects raw entries."""
+        field = self._field_map().get(key)
+        if field is not None:
+            value = getattr(self, field[0])
+            return default if value is None else value
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __repr__(self):
+        return f"{type(self).__name__}({getattr(self, 'id', None)!r})"
+
+
+class Npc(Record):
+    __slots__ = ("id", "name", "description", "icon", "default_location_id", "portrait_image",
+                 "portrait_placeholder", "alignment", "position", "quests", "companion_data")
+    FIELDS = (
+        ("id", "id", None),
+        ("name", "name", None),
+        ("description", "description", None),
+        ("icon", "icon", None),
+        ("defaultLocationId", "default_location_id", None),
+        ("portraitImage", "portrait_image", None),
+        ("portraitPlaceholder", "portrait_placeholder", None),
+        ("alignment", "alignment", None),
+        ("position", "position", None),
+        ("quests", "quests", None),
+        ("companionData", "companion_data", None),
+    )
+
+
+class HiddenObject(Record):
+    __slots__ = ("id", "item_id", "name", "description", "icon", "position", "item_image",
+                 "found_message", "condition", "condition_not_met_message", "is_interactable_feature",
+                 "interaction", "grants_resources", "triggers_puzzle_id")
+    FIELDS = (
+        ("id", "id", None),
+        ("itemId", "item_id", None),
+        ("name", "name", None),
+        ("description", "description", None),
+        ("icon", "icon", None),
+        ("position", "position", None),
+        ("itemImage", "item_image", None),
+        ("foundMessage", "found_message", None),
+        ("condition", "condition", None),
+        ("conditionNotMetMessage", "condition_not_met_message", None),
+        ("isInteractableFeature", "is_interactable_feature", None),
+        ("interaction", "interaction", None),
+        ("grantsResources", "grants_resources", None),
+        ("triggersPuzzleId", "triggers_puzzle_id", None),
+    )
+
+    def referenced_item_ids(self):
+        """Returns the item ids this hidden object gives, requires or reveals."""
+        item_ids = []
+        if self.item_id:
+            item_ids.append(self.item_id)
+        if isinstance(self.interaction, dict):
+            for key in ("requiredItemId", "revealsItemId"):
+                if self.interaction.get(key):
+                    item_ids.append(self.interaction[key])
+        return item_ids
+
+
+class Poi(Record):
+    __slots__ = ("id", "name", "description", "icon", "x", "y", "game_view_image", "game_view_placeholder",
+                 "required_items", "is_market", "npc_ids", "tradable_goods", "hidden_objects", "actions")
+    FIELDS = (
+        ("id", "id", None),
+        ("name", "name", None),
+        ("description", "description", None),
+        ("icon", "icon", None),
+        ("x", "x", None),
+        ("y", "y", None),
+        ("gameViewImage", "game_view_image", None),
+        ("gameViewPlaceholder", "game_view_placeholder", None),
+        ("requiredItems", "required_items", None),
+        ("isMarket", "is_market", None),
+        ("npcIds", "npc_ids", None),
+        ("tradableGoods", "tradable_goods", None),
+        ("hiddenObjects", "hidden_objects", HiddenObject),
+        ("actions", "actions", None),
+    )
+
+
+class Item(Record):
+    __slots__ = ("id", "name", "description", "icon", "item_image", "type", "value", "cursed")
+    FIELDS = (
+        ("id", "id", None),
+        ("name", "name", None),
+        ("description", "description", None),
+        ("icon", "icon", None),
+        ("itemImage", "item_image", None),
+        ("type", "type", None),
+        ("value", "value", None),
+        ("cursed", "cursed", None),
+    )
+
+
+class Puzzle(Record):
+    __slots__ = ("id", "puzzle_type", "npc_id", "dialog_owner_npc_id", "description",
+                 "success_dialog_node_id", "failure_dialog_node_id", "skip_dialog_node_id",
+                 "success_effects", "failure_effects", "data")
+    FIELDS = (
+        ("id", "id", None),
+        ("puzzle_type", "puzzle_type", None),
+        ("npcId", "npc_id", None),
+        ("dialogOwnerNpcId", "dialog_owner_npc_id", None),
+        ("description", "description", None),
+        ("successDialogNodeId", "success_dialog_node_id", None),
+        ("failureDialogNodeId", "failure_dialog_node_id", None),
+        ("skipDialogNodeId", "skip_dialog_node_id", None),
+        ("successEffects", "success_effects", None),
+        ("failureEffects", "failure_effects", None),
+        ("data", "data", None),
+    )
+
+
+class DialogueChoice(Record):
+    __slots__ = ("text", "next_node_id", "action", "condition", "effects")
+    FIELDS = (
+        ("text", "text", None),
+        ("nextNodeId", "next_node_id", None),
+        ("action", "action", None),
+        ("condition", "condition", None),
+        ("effects", "effects", None),
+    )
+
+
+class DialogueNode(Record):
+    __slots__ = ("id", "npc_id", "npc_text", "effects", "condition", "player_choices")
+    FIELDS = (
+        ("id", "id", None),
+        ("npcText", "npc_text", None),
+        ("effects", "effects", None),
+        ("condition", "condition", None),
+        ("playerChoices", "player_choices", DialogueChoice),
+    )
+
+
+def save_json_file(filepath, data):
+    """
+    Saves data to a JSON file in the repository's indent=2 layout.
+
+    Args:
+      filepath: The path to the JSON file.
+      data: The JSON-serialisable data, or a list of Records.
+
+    Returns:
+      True if saving was successful, False otherwise.
+    """
+    if isinstance(data, list):
+        data = [entry.to_dict() if isinstance(entry, Record) else entry for entry in data]
+    try:
+        with open(filepath, 'w') as f:
+            json.dump(data, f, indent=2)
+        print(f"Successfully saved data to {filepath}")
+        return True
+    except IOError as e:
+        print(f"ERROR: Could not write data to {filepath}. Error: {e}")
+        return False
+    except Exception as e: # Catch any other potential errors during save
+        print(f"ERROR: An unexpected error occurred while saving data to {filepath}. Error: {e}")
+        return False
+
+
+def _parse_records(record_cls, entries):
+    return [record_cls.from_dict(entry) for entry in entries or [] if isinstance(entry, dict)]
+
+
+# Which data file each top-level record type is saved to.
+_RECORD_FILENAMES = {Npc: NPCS_FILENAME, Poi: POIS_FILENAME, Item: ITEMS_FILENAME, Puzzle: PUZZLES_FILENAME}
+
+
+class WorldModel:
+    """
+    All game data, parsed into records and indexed.
+
+    Attributes:
+      npcs, pois, items, puzzles: Record lists in file order.
+      dialogues: {npc_id: {node_id: DialogueNode}} in file order.
+      npcs_by_id, pois_by_id, items_by_id, puzzles_by_id: Id indexes.
+      dialogue_nodes_by_id: Every dialogue node keyed by its (globally unique) id.
+      npcs_by_location: {poi_id: [Npc]} from defaultLocationId and POI npcIds.
+      location_id_by_npc: {npc_id: poi_id}, preferring defaultLocationId.
+      puzzles_by_npc: {npc_id: [Puzzle]} from npcId and dialogOwnerNpcId.
+      hidden_objects_by_item: {item_id: [(Poi, HiddenObject)]} for every item
+        a hidden object gives, requires or reveals.
+    """
+
+    def __init__(self, npcs=None, pois=None, items=None, puzzles=None, dialogues=None, data_dir=None):
+        self.data_dir = data_dir
+        self.npcs = _parse_records(Npc, npcs)
+        self.pois = _parse_records(Poi, pois)
+        self.items = _parse_records(Item, items)
+        self.puzzles = _parse_records(Puzzle, puzzles)
+        self.dialogues = {}
+        self._pending_changes = {}
+        if isinstance(dialogues, dict):
+            dialogues = dialogues.items()
+        for npc_id, nodes in dialogues or ():
+            if not isinstance(nodes, dict):
+                continue
+            self.dialogues[npc_id] = {}
+            for node_id, node_data in nodes.items():
+                node = DialogueNode.from_dict(node_data)
+                node.npc_id = npc_id
+                self.dialogues[npc_id][node_id] = node
+        self._build_indexes()
+
+    def _build_indexes(self):
+        self.npcs_by_id = {npc.id: npc for npc in self.npcs}
+        self.pois_by_id = {poi.id: poi for poi in self.pois}
+        self.items_by_id = {item.id: item for item in self.items}
+        self.puzzles_by_id = {puzzle.id: puzzle for puzzle in self.puzzles}
+        self.dialogue_nodes_by_id = {}
+        for nodes in self.dialogues.values():
+            for node_id, node in nodes.items():
+                self.dialogue_nodes_by_id[node_id] = node
+
+        self.npcs_by_location = {}
+        self.location_id_by_npc = {}
+        for npc in self.npcs:
+            if npc.default_location_id:
+                self.npcs_by_location.setdefault(npc.default_location_id, []).append(npc)
+                self.location_id_by_npc[npc.id] = npc.default_location_id
+        self.hidden_objects_by_item = {}
+        for poi in self.pois:
+            for npc_id in poi.npc_ids or []:
+                npc = self.npcs_by_id.get(npc_id)
+                located = self.npcs_by_location.setdefault(poi.id, [])
+                if npc is not None and npc not in located:
+                    located.append(npc)
+                self.location_id_by_npc.setdefault(npc_id, poi.id)
+            for hidden_object in poi.hidden_objects or []:
+                for item_id in hidden_object.referenced_item_ids():
+                    self.hidden_objects_by_item.setdefault(item_id, []).append((poi, hidden_object))
+
+        self.puzzles_by_npc = {}
+        for puzzle in self.puzzles:
+            for npc_id in {puzzle.npc_id, puzzle.dialog_owner_npc_id} - {None}:
+                self.puzzles_by_npc.setdefault(npc_id, []).append(puzzle)
+
+    def dialogues_to_dict(self):
+        return {npc_id: {node_id: node.to_dict() for node_id, node in nodes.items()}
+                for npc_id, nodes in self.dialogues.items()}
+
+    def path(self, filename):
+        return os.path.join(self.data_dir or DEFAULT_DATA_DIR, filename)
+
+    def update(self, record, attr, value):
+        """
+        Sets a field on an NPC, POI, item or puzzle record and queues it for saving.
+
+        Args:
+          record: A top-level record from this world.
+          attr: The record attribute to set, e.g. "portrait_image".
+          value: The new value.
+        """
+        if getattr(record, attr) == value:
+            return
+        setattr(record, attr, value)
+        json_key = next(key for key, field_attr, _ in record.FIELDS if field_attr == attr)
+        filename = _RECORD_FILENAMES[type(record)]
+        self._pending_changes.setdefault(filename, {}).setdefault(record.id, {})[json_key] = value
+
+    def has_changes(self):
+        return any(self._pending_changes.values())
+
+    def save_changes(self):
+        """
+        Writes every queued update to disk as a patch of the affected entries.
+
+        Returns:
+          True if saving was successful (or there was nothing to save), False otherwise.
+        """
+        try:
+            for filename, updates in self._pending_changes.items():
+                DataStore(filename, data_dir=self.data_dir or DEFAULT_DATA_DIR).patch(updates)
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"ERROR: Could not save data changes. Error: {e}")
+            return False
+        self._pending_changes = {}
+        return True
+
+
+def stream_collection(filename, data_dir=None):
+    """
+    Streams a data collection's entries (or (key, value) pairs for dialogues).
+
+    Missing or unparsable collections are reported and yield nothing further.
+
+    Args:
+      filename: The collection file name, e.g. "npcs.json".
+      data_dir: Directory containing the data files. Defaults to www/data.
+    """
+    store = DataStore(filename, data_dir=data_dir or DEFAULT_DATA_DIR)
+    if not store.exists():
+        print(f"Error: File not found at {store.file_path}")
+        return
+    try:
+        if store.container() == "list":
+            yield from store.iter_entries()
+        else:
+            yield from store.iter_items()
+    except json.JSONDecodeError:
+        print(f"Error: Could not parse JSON data from {store.file_path}")
+
+
+def load_world(data_dir=None):
+    """
+    Loads and indexes all five data files.
+
+    Missing or unparsable files are reported and treated as empty, so a
+    script that only needs NPCs still works without, say, puzzles.json.
+
+    Args:
+      data_dir: Directory containing the data files. Defaults to www/data.
+
+    Returns:
+      A WorldModel.
+    """
+    data_dir = data_dir or DEFAULT_DATA_DIR
+    return WorldModel(
+        npcs=stream_collection(NPCS_FILENAME, data_dir),
+        pois=stream_collection(POIS_FILENAME, data_dir),
+        items=stream_collection(ITEMS_FILENAME, data_dir),
+        puzzles=stream_collection(PUZZLES_FILENAME, data_dir),
+        dialogues=stream_collection(DIALOGUES_FILENAME, data_dir),
+        data_dir=data_dir,
+    )
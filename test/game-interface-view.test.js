@@ -6,6 +6,7 @@ class MockGameInterfaceView {
     this.playerInventory = [];
     this.playerResources = { gold: 0, silver: 0, rum: 0 };
     this._lastFoundMessage = '';
+    this._loadedViewImage = null;
     this.dispatchedEvents = [];
 
     this.dispatchEvent = (event) => {
@@ -14,6 +15,30 @@ class MockGameInterfaceView {
     this.requestUpdate = () => { /* console.log("MockGameInterfaceView: requestUpdate called"); */ };
   }
 
+  // Mirrors the placeholder styles GameInterfaceView builds with image-placeholder.js.
+  _viewportStyle() {
+    const viewImage = this.locationData.gameViewImage;
+    const placeholder = this.locationData.gameViewPlaceholder;
+    if (!viewImage) return 'background-image: none;';
+    if (!placeholder || viewImage === this._loadedViewImage) return `background-image: url(${viewImage});`;
+    return `background-image: url(${viewImage}), url(${placeholder.thumbnail}); background-color: ${placeholder.color};`;
+  }
+
+  _portraitStyle(npc) {
+    const placeholder = npc.portraitPlaceholder;
+    return placeholder ? `background: ${placeholder.color} url(${placeholder.thumbnail}) center / cover no-repeat;` : '';
+  }
+
+  _handleViewImageLoaded(viewImage) {
+    if (this.locationData?.gameViewImage === viewImage) {
+      this._loadedViewImage = viewImage;
+    }
+  }
+
+  _handlePortraitLoaded(img) {
+    img.style.background = '';
+  }
+
   _formatPrice(priceObject) {
     if (!priceObject) return '';
     const currency = Object.keys(priceObject)[0];
@@ -266,6 +291,26 @@ function testGameInterfaceInteractions() {
   assertEqual(view.dispatchedEvents.length, 0, "Test 7.1: No events if no sextant to sell");
   assertMatch(view._lastFoundMessage, "You don't have Sextant to sell", "Test 7.2: Don't have sextant message");
   view.dispatchedEvents = [];
+
+  const placeholder = { color: "#5a4632", thumbnail: "data:image/jpeg;base64,AAAA" };
+  view = new MockGameInterfaceView();
+  view.locationData = { gameViewImage: "docks.jpg", gameViewPlaceholder: placeholder };
+  assertMatch(view._viewportStyle(), "url(docks.jpg), url(data:image/jpeg;base64,AAAA)", "Test 8.1: Thumbnail layered under the location image");
+  assertMatch(view._viewportStyle(), "background-color: #5a4632", "Test 8.2: Placeholder colour painted while loading");
+  view._handleViewImageLoaded("market.jpg");
+  assertMatch(view._viewportStyle(), "data:image/jpeg", "Test 8.3: Placeholder kept when another image loads");
+  view._handleViewImageLoaded("docks.jpg");
+  assertEqual(view._viewportStyle(), "background-image: url(docks.jpg);", "Test 8.4: Placeholder dropped once the location image loads");
+  view.locationData = { gameViewImage: "tavern.jpg", gameViewPlaceholder: placeholder };
+  assertMatch(view._viewportStyle(), "background-color: #5a4632", "Test 8.5: Placeholder painted again for the next location");
+  view.locationData = { gameViewImage: "tavern.jpg" };
+  assertEqual(view._viewportStyle(), "background-image: url(tavern.jpg);", "Test 8.6: No placeholder layers without placeholder data");
+
+  const portrait = { style: { background: view._portraitStyle({ portraitPlaceholder: placeholder }) } };
+  assertMatch(portrait.style.background, "#5a4632 url(data:image/jpeg;base64,AAAA)", "Test 9.1: Portrait placeholder colour and thumbnail");
+  view._handlePortraitLoaded(portrait);
+  assertEqual(portrait.style.background, "", "Test 9.2: Portrait placeholder cleared once the image loads");
+  assertEqual(view._portraitStyle({}), "", "Test 9.3: No portrait style without placeholder data");
   
   console.log(`--- ${testSuiteName} ---`);
   if (results.length > 0) { results.forEach(r => console.log(r)); }
@@ -224,6 +224,30 @@ async function testNpcDialogOverlay() {
     teardownElement(element);
   }
 
+  // Test 5: Portrait placeholder until the image loads
+  try {
+    const portraitPlaceholder = { color: "#5a4632", thumbnail: "data:image/jpeg;base64,AAAA" };
+    element = await setupElement({ npcDetails: { ...mockNpcDetails, portraitPlaceholder } });
+    const portraitImg = element.shadowRoot.querySelector('.portrait img');
+    assertNotNull(portraitImg, "Test 5.1: Portrait image should render with a placeholder");
+    if (portraitImg) {
+      assertMatch(portraitImg.getAttribute('style'), portraitPlaceholder.color, "Test 5.2: Placeholder colour painted behind the portrait");
+      assertMatch(portraitImg.getAttribute('style'), portraitPlaceholder.thumbnail, "Test 5.3: Placeholder thumbnail painted behind the portrait");
+      portraitImg.dispatchEvent(new Event('load'));
+      assertEqual(portraitImg.style.background, '', "Test 5.4: Placeholder cleared once the portrait loads");
+    }
+    teardownElement(element);
+
+    element = await setupElement();
+    const plainImg = element.shadowRoot.querySelector('.portrait img');
+    if (plainImg) assertFalse(plainImg.style.background.includes('data:image'), "Test 5.5: No placeholder without placeholder data");
+  } catch (e) {
+    testsFailed++; results.push(`FAIL: Test 5.x Portrait Placeholder - Unexpected error: ${e.message}`);
+    console.error(e);
+  } finally {
+    teardownElement(element);
+  }
+
 
   console.log(`--- ${testSuiteName} ---`);
   if (results.length > 0) { results.forEach(r => console.log(r)); }
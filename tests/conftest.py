@@ -0,0 +1,24 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# The scripts import their siblings by module name, as when run from scripts/.
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A copy of the fixture data files that tests may modify."""
+    path = tmp_path / "data"
+    shutil.copytree(FIXTURES_DIR, path)
+    return str(path)
+
+
+def read_text(path):
+    with open(path, "r") as f:
+        return f.read()
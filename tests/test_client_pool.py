@@ -0,0 +1,152 @@
+import time
+
+import pytest
+
+import client_pool
+from client_pool import ClientPool, PoolEntry, is_rate_limit_error
+from generation_scheduler import GenerationBudget
+
+
+class RateLimitError(Exception):
+    code = 429
+
+
+class FakeModels:
+    def __init__(self, name, responses):
+        self.name = name
+        self.responses = list(responses)
+        self.calls = []
+
+    def generate_images(self, **kwargs):
+        self.calls.append(kwargs)
+        response = self.responses.pop(0) if self.responses else "ok"
+        if isinstance(response, Exception):
+            raise response
+        return f"{self.name}: {response}"
+
+
+class FakeClient:
+    def __init__(self, name, responses=()):
+        self.models = FakeModels(name, responses)
+
+
+def make_entry(name, responses=(), requests_per_minute=20):
+    return PoolEntry(name, FakeClient(name, responses), requests_per_minute)
+
+
+def generate(pool):
+    return pool.models.generate_images(model="imagen-3.0-generate-002", prompt="A tavern.")
+
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(RateLimitError())
+    assert is_rate_limit_error(RuntimeError("429 RESOURCE_EXHAUSTED: quota"))
+    assert not is_rate_limit_error(RuntimeError("500 INTERNAL"))
+
+
+def test_routes_to_the_entry_with_the_most_headroom():
+    small, large = make_entry("small", requests_per_minute=2), make_entry("large", requests_per_minute=4)
+    pool = ClientPool([small, large])
+    results = [generate(pool) for _ in range(6)]
+    assert sorted(result.split(":")[0] for result in results) == ["large"] * 4 + ["small"] * 2
+    assert (small.requests, large.requests) == (2, 4)
+    assert small.headroom(time.monotonic()) == large.headroom(time.monotonic()) == 0
+
+
+def test_failover_drains_the_rate_limited_entry_and_charges_the_budget():
+    first, second = make_entry("first", [RateLimitError()]), make_entry("second")
+    budget = GenerationBudget()
+    failovers = []
+    pool = ClientPool([first, second], budget=budget)
+    pool.on_failover = lambda *args: failovers.append(args)
+
+    assert budget.reserve_request() is None # The caller's reservation covers the first attempt
+    assert generate(pool) == "second: ok"
+
+    assert budget.requests_made == 2
+    assert first.is_drained(time.monotonic()) and (first.strikes, first.rate_limited) == (1, 1)
+    assert (first.in_flight, second.in_flight) == (0, 0)
+    [(name, method_name, kwargs, error, started, finished)] = failovers
+    assert (name, method_name, kwargs["prompt"]) == ("first", "generate_images", "A tavern.")
+    assert isinstance(error, RateLimitError) and started <= finished
+    # The drained entry stays out of rotation.
+    assert generate(pool) == "second: ok"
+    assert (first.requests, second.requests) == (1, 2)
+    assert pool.summary() == "first: 1 requests (1 rate limited), second: 2 requests (0 rate limited)"
+
+
+def test_consecutive_rate_limits_double_the_drain():
+    entry = make_entry("only", [RateLimitError(), RateLimitError()])
+    pool = ClientPool([entry], max_wait_seconds=0)
+    for strikes in (1, 2):
+        entry.drained_until = 0.0 # The previous drain has run out
+        with pytest.raises(RateLimitError):
+            generate(pool)
+        remaining = entry.drained_until - time.monotonic()
+        assert strikes == entry.strikes
+        assert client_pool.DRAIN_SECONDS * 2 ** (strikes - 1) - 1 < remaining <= client_pool.DRAIN_SECONDS * 2 ** (strikes - 1)
+
+
+def test_gives_up_and_refunds_when_every_entry_is_drained():
+    first, second = make_entry("first", [RateLimitError()]), make_entry("second", [RateLimitError()])
+    budget = GenerationBudget()
+    pool = ClientPool([first, second], budget=budget, max_wait_seconds=0)
+
+    budget.reserve_request()
+    with pytest.raises(RateLimitError):
+        generate(pool)
+    # Two requests were sent; the third reservation was refunded when no entry was left.
+    assert budget.requests_made == 2
+    assert (first.requests, second.requests) == (1, 1)
+
+
+def test_refunds_when_drained_before_the_first_attempt():
+    entry = make_entry("only")
+    entry.drained_until = time.monotonic() + 60
+    budget = GenerationBudget()
+    pool = ClientPool([entry], budget=budget, max_wait_seconds=0)
+
+    budget.reserve_request()
+    with pytest.raises(RuntimeError, match="429 RESOURCE_EXHAUSTED"):
+        generate(pool)
+    assert budget.requests_made == 0
+    assert entry.client.models.calls == []
+
+
+def test_does_not_fail_over_past_the_request_budget():
+    first, second = make_entry("first", [RateLimitError()]), make_entry("second")
+    budget = GenerationBudget(max_requests=1)
+    pool = ClientPool([first, second], budget=budget)
+
+    assert budget.reserve_request() is None
+    with pytest.raises(RateLimitError):
+        generate(pool)
+    assert budget.requests_made == 1
+    assert second.client.models.calls == []
+
+
+def test_waits_for_a_drained_entry_to_return(monkeypatch):
+    monkeypatch.setattr(client_pool, "DRAIN_SECONDS", 0.05)
+    entry = make_entry("only", [RateLimitError()])
+    failovers = []
+    pool = ClientPool([entry], max_wait_seconds=5)
+    pool.on_failover = lambda *args: failovers.append(args[0])
+    assert generate(pool) == "only: ok"
+    assert (entry.requests, entry.strikes, failovers) == (2, 0, ["only"])
+
+
+def test_other_errors_are_raised_without_failover():
+    first, second = make_entry("first", [ValueError("bad prompt")]), make_entry("second")
+    budget = GenerationBudget()
+    pool = ClientPool([first, second], budget=budget)
+    budget.reserve_request()
+    with pytest.raises(ValueError):
+        generate(pool)
+    assert budget.requests_made == 1
+    assert not first.is_drained(time.monotonic()) and first.in_flight == 0
+    assert second.client.models.calls == []
+
+
+def test_needs_an_entry():
+    with pytest.raises(ValueError):
+        ClientPool([])
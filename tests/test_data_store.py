@@ -0,0 +1,115 @@
+import io
+import json
+import os
+
+import pytest
+
+import data_store
+from conftest import read_text
+from data_store import DataStore, iter_json_array, iter_json_object, write_json_container
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Forces values to straddle read chunks, as they do in large files."""
+    monkeypatch.setattr(data_store, "_CHUNK_SIZE", 7)
+
+
+def test_iter_json_array_streams_every_element(small_chunks):
+    data = [{"id": "a", "value": 12345}, [1, 2], "text, with ] and }", 3.25, None, True]
+    assert list(iter_json_array(io.StringIO(json.dumps(data, indent=2)))) == data
+
+
+def test_iter_json_array_empty():
+    assert list(iter_json_array(io.StringIO(" [ ] "))) == []
+
+
+def test_iter_json_object_keeps_key_order(small_chunks):
+    data = {"zeta": {"nested": [1, 2, 3]}, "alpha": 1, "mid": "x"}
+    assert list(iter_json_object(io.StringIO(json.dumps(data)))) == list(data.items())
+
+
+def test_iter_json_array_rejects_an_object():
+    with pytest.raises(json.JSONDecodeError):
+        next(iter_json_array(io.StringIO('{"a": 1}')))
+
+
+@pytest.mark.parametrize("data", [[], {}, [{"id": "a", "b": [1, {"c": None}]}, {"id": "b"}], {"x": {"y": 1}, "z": []}])
+def test_write_json_container_matches_json_dump(data):
+    container = "list" if isinstance(data, list) else "dict"
+    pairs = [(None, entry) for entry in data] if container == "list" else data.items()
+    out = io.StringIO()
+    write_json_container(out, container, pairs)
+    assert out.getvalue() == json.dumps(data, indent=2)
+
+
+def test_load_and_get(data_dir):
+    npcs = DataStore("npcs.json", data_dir)
+    assert npcs.container() == "list"
+    assert [npc["id"] for npc in npcs.load()] == ["npc_one_eyed_jack", "npc_esmeralda", "npc_harbour_master"]
+    assert npcs.get("npc_esmeralda")["name"] == "Madame Esmeralda"
+    assert npcs.get("npc_missing") is None
+
+    dialogues = DataStore("dialogues.json", data_dir)
+    assert dialogues.container() == "dict"
+    assert list(dialogues.load()) == ["npc_one_eyed_jack", "npc_esmeralda"]
+
+
+def test_patch_rewrites_only_changed_fields(data_dir):
+    path = os.path.join(data_dir, "npcs.json")
+    with open(path, "r") as f:
+        expected = json.load(f)
+    expected[1]["portraitImage"] = "assets/images/portraits/npc_esmeralda_portrait.jpg"
+    expected[2]["name"] = "Harbourmaster"
+
+    changed = DataStore("npcs.json", data_dir).patch({
+        "npc_esmeralda": {"portraitImage": "assets/images/portraits/npc_esmeralda_portrait.jpg"},
+        "npc_harbour_master": {"name": "Harbourmaster"},
+        "npc_missing": {"name": "Nobody"},
+    })
+
+    assert changed == 2
+    assert read_text(path) == json.dumps(expected, indent=2)
+
+
+def test_shard_and_unshard_round_trip(data_dir):
+    path = os.path.join(data_dir, "npcs.json")
+    original = read_text(path)
+    store = DataStore("npcs.json", data_dir)
+
+    store.shard(shard_size=2)
+    assert store.is_sharded and not os.path.exists(path)
+    index = store.index()
+    assert index["shards"] == ["npcs-00000.json", "npcs-00001.json"]
+    assert index["ids"] == {"npc_one_eyed_jack": 0, "npc_esmeralda": 0, "npc_harbour_master": 1}
+    assert [npc["id"] for npc in store.iter_entries()] == ["npc_one_eyed_jack", "npc_esmeralda", "npc_harbour_master"]
+    assert store.get("npc_harbour_master")["defaultLocationId"] == "poi_docks"
+
+    store.unshard()
+    assert not store.is_sharded and not os.path.exists(store.shard_dir)
+    assert read_text(path) == original
+
+
+def test_patch_sharded_rewrites_only_affected_shard(data_dir):
+    store = DataStore("npcs.json", data_dir)
+    store.shard(shard_size=2)
+    first_shard = os.path.join(store.shard_dir, "npcs-00000.json")
+    first_shard_text = read_text(first_shard)
+
+    assert store.patch({"npc_harbour_master": {"icon": "⚓️"}}) == 1
+    assert read_text(first_shard) == first_shard_text
+    assert store.get("npc_harbour_master")["icon"] == "⚓️"
+
+    store.unshard()
+    assert DataStore("npcs.json", data_dir).get("npc_harbour_master")["icon"] == "⚓️"
+
+
+def test_shard_dict_collection(data_dir):
+    path = os.path.join(data_dir, "dialogues.json")
+    original = read_text(path)
+    store = DataStore("dialogues.json", data_dir)
+    store.shard(shard_size=1)
+    assert store.index()["container"] == "dict"
+    assert store.get("npc_esmeralda")["esmeralda_greeting"]["npcText"] == "I see your future..."
+    store.unshard()
+    assert read_text(path) == original
@@ -0,0 +1,131 @@
+import json
+import os
+
+import pytest
+
+import provenance
+from provenance import ProvenanceStore, bytes_digest, import_sidecars
+
+PORTRAIT = "assets/images/portraits/npc_esmeralda_portrait.jpg"
+LOCATION = "assets/images/locations/poi_tavern_generated.jpg"
+
+
+@pytest.fixture
+def web_root(tmp_path, monkeypatch):
+    path = tmp_path / "www"
+    path.mkdir()
+    monkeypatch.setattr(provenance, "WEB_ROOT", str(path))
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProvenanceStore(str(tmp_path / "provenance" / "assets.jsonl"), batch_size=10)
+
+
+def record(store, web_root, asset, model="imagen-3.0-generate-002", prompt="A fortune teller.", **kwargs):
+    store.record(os.path.join(web_root, asset), "portrait", prompt, model=model, config={"numberOfImages": 1},
+                 seed=7, latency=1.23456, image_bytes=prompt.encode("utf-8"), timestamp=1700000000.0, **kwargs)
+
+
+def read_lines(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_are_buffered_until_flushed(store, web_root):
+    record(store, web_root, PORTRAIT)
+    assert not os.path.exists(store.path)
+    store.flush()
+    [entry] = read_lines(store.path)
+    assert entry == {"asset": PORTRAIT, "kind": "portrait", "prompt": "A fortune teller.",
+                     "model": "imagen-3.0-generate-002", "config": {"numberOfImages": 1}, "seed": 7,
+                     "timestamp": 1700000000.0, "latency": 1.235, "sha256": bytes_digest(b"A fortune teller.")}
+
+
+def test_batch_size_and_context_manager_flush(tmp_path, web_root):
+    path = str(tmp_path / "provenance" / "assets.jsonl")
+    with ProvenanceStore(path, batch_size=2) as store:
+        record(store, web_root, PORTRAIT)
+        record(store, web_root, LOCATION)
+        assert len(read_lines(path)) == 2
+        record(store, web_root, PORTRAIT, prompt="Again.")
+        assert len(read_lines(path)) == 2
+    assert len(read_lines(path)) == 3
+
+
+def test_queries(store, web_root):
+    record(store, web_root, PORTRAIT, prompt="First.")
+    record(store, web_root, LOCATION, prompt="Tavern.")
+    record(store, web_root, PORTRAIT, model="imagen-3.0-fast-generate-001", prompt="Second.")
+    store.flush()
+
+    assert [entry["prompt"] for entry in store.for_asset(PORTRAIT)] == ["First.", "Second."]
+    assert store.latest_for_asset(PORTRAIT)["prompt"] == "Second."
+    assert store.latest_for_asset("assets/missing.jpg") is None
+    # The portrait's current version came from the fast model, so only the location is listed.
+    assert [entry["asset"] for entry in store.for_model("imagen-3.0-generate-002")] == [LOCATION]
+    assert [entry["asset"] for entry in store.for_model("imagen-3.0-fast-generate-001")] == [PORTRAIT]
+
+
+def test_queries_on_an_empty_store(store):
+    assert store.for_asset(PORTRAIT) == []
+    assert store.for_model("imagen-3.0-generate-002") == []
+
+
+def test_index_is_rebuilt_when_missing(store, web_root):
+    record(store, web_root, PORTRAIT)
+    store.flush()
+    os.remove(store.index_path)
+    fresh = ProvenanceStore(store.path)
+    assert [entry["asset"] for entry in fresh.for_asset(PORTRAIT)] == [PORTRAIT]
+    assert os.path.exists(fresh.index_path)
+
+
+def test_index_is_rebuilt_when_the_log_changes(store, web_root):
+    record(store, web_root, PORTRAIT)
+    store.flush()
+    # Another process appends to the log without updating this store's index.
+    with open(store.path, "a") as f:
+        f.write(json.dumps({"asset": LOCATION, "kind": "location", "prompt": "Tavern.",
+                            "model": "imagen-3.0-generate-002"}) + "\n")
+    assert [entry["prompt"] for entry in store.for_asset(LOCATION)] == ["Tavern."]
+    with open(store.index_path, "r") as f:
+        index = json.load(f)
+    assert index["logSize"] == os.path.getsize(store.path)
+    assert sorted(index["assets"]) == [LOCATION, PORTRAIT]
+
+
+def test_corrupt_index_is_rebuilt(store, web_root):
+    record(store, web_root, PORTRAIT)
+    store.flush()
+    with open(store.index_path, "w") as f:
+        f.write("{not json")
+    assert len(ProvenanceStore(store.path).for_asset(PORTRAIT)) == 1
+
+
+def test_reindex_matches_incremental_index(store, web_root):
+    record(store, web_root, PORTRAIT)
+    store.flush()
+    record(store, web_root, LOCATION)
+    record(store, web_root, PORTRAIT, model="imagen-3.0-fast-generate-001")
+    store.flush()
+    with open(store.index_path, "r") as f:
+        incremental = json.load(f)
+    assert ProvenanceStore(store.path).reindex() == incremental
+
+
+def test_import_sidecars(store, web_root):
+    portraits = os.path.join(web_root, "assets", "images", "portraits")
+    os.makedirs(portraits)
+    with open(os.path.join(portraits, "npc_esmeralda_portrait.jpg"), "wb") as f:
+        f.write(b"jpeg bytes")
+    with open(os.path.join(portraits, "npc_esmeralda_prompt.txt"), "w") as f:
+        f.write("A fortune teller.")
+    with open(os.path.join(portraits, "npc_orphan_prompt.txt"), "w") as f:
+        f.write("No image.")
+
+    assert import_sidecars(store, web_root=web_root) == 1
+    entry = store.latest_for_asset(PORTRAIT)
+    assert (entry["kind"], entry["prompt"], entry["sha256"]) == ("portrait", "A fortune teller.", bytes_digest(b"jpeg bytes"))
+    assert sorted(os.listdir(portraits)) == ["npc_esmeralda_portrait.jpg", "npc_orphan_prompt.txt"]
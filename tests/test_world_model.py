@@ -0,0 +1,102 @@
+import json
+import os
+
+from conftest import read_text
+from data_store import DataStore
+from world_model import Npc, Poi, WorldModel, load_world
+
+
+def test_to_dict_preserves_key_order_and_unknown_keys():
+    data = {"name": "Madame Esmeralda", "mood": "serene", "id": "npc_esmeralda", "icon": "🔮"}
+    npc = Npc.from_dict(data)
+    assert npc.id == "npc_esmeralda"
+    assert npc.extra == {"mood": "serene"}
+    assert npc.get("mood") == "serene"
+    assert list(npc.to_dict().items()) == list(data.items())
+
+
+def test_to_dict_appends_fields_set_after_parsing():
+    npc = Npc.from_dict({"id": "npc_esmeralda", "name": "Madame Esmeralda"})
+    npc.portrait_image = "assets/images/portraits/npc_esmeralda_portrait.jpg"
+    assert list(npc.to_dict()) == ["id", "name", "portraitImage"]
+
+
+def test_nested_records_round_trip():
+    data = {"id": "poi_tavern", "hiddenObjects": [{"name": "Loose plank", "id": "ho_loose_plank",
+                                                     "itemId": "item_rusty_key", "sparkle": True}]}
+    poi = Poi.from_dict(data)
+    assert poi.hidden_objects[0].item_id == "item_rusty_key"
+    assert json.dumps(poi.to_dict()) == json.dumps(data)
+
+
+def test_fixture_files_round_trip_unchanged(data_dir):
+    world = load_world(data_dir)
+    for filename, records in (("npcs.json", world.npcs), ("pois.json", world.pois),
+                              ("items.json", world.items), ("puzzles.json", world.puzzles)):
+        expected = read_text(os.path.join(data_dir, filename))
+        assert json.dumps([record.to_dict() for record in records], indent=2) == expected
+    assert json.dumps(world.dialogues_to_dict(), indent=2) == read_text(os.path.join(data_dir, "dialogues.json"))
+
+
+def test_load_world_builds_indexes(data_dir):
+    world = load_world(data_dir)
+    jack = world.npcs_by_id["npc_one_eyed_jack"]
+    assert [npc.id for npc in world.npcs_by_location["poi_tavern"]] == ["npc_one_eyed_jack", "npc_esmeralda"]
+    assert world.location_id_by_npc == {"npc_one_eyed_jack": "poi_tavern", "npc_harbour_master": "poi_docks",
+                                        "npc_esmeralda": "poi_tavern"}
+    assert world.npcs_by_location["poi_docks"][0].id == "npc_harbour_master"
+    assert jack.portrait_image.endswith("npc_one_eyed_jack_portrait.jpg")
+    assert [puzzle.id for puzzle in world.puzzles_by_npc["npc_esmeralda"]] == ["puzzle_riddle"]
+    [(poi, hidden_object)] = world.hidden_objects_by_item["item_rusty_key"]
+    assert (poi.id, hidden_object.id) == ("poi_tavern", "ho_loose_plank")
+    node = world.dialogue_nodes_by_id["jack_drink"]
+    assert node.npc_id == "npc_one_eyed_jack"
+    assert world.dialogue_nodes_by_id["jack_greeting"].player_choices[1].next_node_id == "jack_drink"
+
+
+def test_load_world_tolerates_missing_files(data_dir):
+    os.remove(os.path.join(data_dir, "puzzles.json"))
+    world = load_world(data_dir)
+    assert world.puzzles == [] and world.puzzles_by_npc == {}
+    assert len(world.npcs) == 3
+
+
+def test_update_and_save_changes_patch_only_changed_entries(data_dir):
+    npcs_path = os.path.join(data_dir, "npcs.json")
+    with open(npcs_path, "r") as f:
+        expected = json.load(f)
+    expected[1]["portraitImage"] = "assets/images/portraits/npc_esmeralda_portrait.jpg"
+    pois_text = read_text(os.path.join(data_dir, "pois.json"))
+
+    world = load_world(data_dir)
+    assert not world.has_changes()
+    world.update(world.npcs_by_id["npc_one_eyed_jack"], "portrait_image",
+                 "assets/images/portraits/npc_one_eyed_jack_portrait.jpg") # Unchanged value
+    assert not world.has_changes()
+    world.update(world.npcs_by_id["npc_esmeralda"], "portrait_image",
+                 "assets/images/portraits/npc_esmeralda_portrait.jpg")
+    assert world.has_changes()
+
+    assert world.save_changes()
+    assert not world.has_changes()
+    assert read_text(npcs_path) == json.dumps(expected, indent=2)
+    assert read_text(os.path.join(data_dir, "pois.json")) == pois_text
+    reloaded = load_world(data_dir)
+    assert reloaded.npcs_by_id["npc_esmeralda"].to_dict() == world.npcs_by_id["npc_esmeralda"].to_dict()
+
+
+def test_load_world_reads_sharded_collections(data_dir):
+    DataStore("npcs.json", data_dir).shard(shard_size=1)
+    world = load_world(data_dir)
+    assert [npc.id for npc in world.npcs] == ["npc_one_eyed_jack", "npc_esmeralda", "npc_harbour_master"]
+    world.update(world.npcs_by_id["npc_harbour_master"], "name", "Harbourmaster")
+    assert world.save_changes()
+    assert DataStore("npcs.json", data_dir).get("npc_harbour_master")["name"] == "Harbourmaster"
+
+
+def test_world_model_from_in_memory_data():
+    world = WorldModel(npcs=[{"id": "npc_a", "defaultLocationId": "poi_a"}, "not an entry"],
+                       pois=[{"id": "poi_a", "npcIds": ["npc_a", "npc_b"]}])
+    assert [npc.id for npc in world.npcs] == ["npc_a"]
+    assert world.location_id_by_npc == {"npc_a": "poi_a", "npc_b": "poi_a"}
+    assert [npc.id for npc in world.npcs_by_location["poi_a"]] == ["npc_a"]
@@ -5,6 +5,7 @@ import '@material/web/iconbutton/icon-button.js';
 import '@material/web/icon/icon.js';
 import '@material/web/button/filled-button.js';
 import './npc-dialog-overlay.js'; // Import the new component
+import { backgroundWithPlaceholder, clearPlaceholder, placeholderStyle } from './image-placeholder.js';
 
 class GameInterfaceView extends LitElement {
   static styles = css`
@@ -174,7 +175,8 @@ class GameInterfaceView extends LitElement {
     _lastFoundMessage: { type: String, state: true },
     _activeDialogueNpcId: { type: String, state: true },
     _currentDialogueNodeId: { type: String, state: true },
-    _currentDialogueNode: { type: Object, state: true }
+    _currentDialogueNode: { type: Object, state: true },
+    _loadedViewImage: { type: String, state: true }
   };
 
   constructor() {
@@ -193,6 +195,7 @@ class GameInterfaceView extends LitElement {
     this._activeDialogueNpcId = null;
     this._currentDialogueNodeId = null;
     this._currentDialogueNode = null;
+    this._loadedViewImage = null;
     this._boundHandlePuzzleResolved = this._handlePuzzleResolved.bind(this);
   }
 
@@ -209,6 +212,22 @@ class GameInterfaceView extends LitElement {
     super.disconnectedCallback();
   }
 
+  updated(changedProperties) {
+    const viewImage = this.locationData?.gameViewImage;
+    if (changedProperties.has('locationData') && viewImage && viewImage !== this._loadedViewImage) {
+      // Fetch the full location image so its placeholder layers can be dropped once it has arrived.
+      const image = new Image();
+      image.onload = () => this._handleViewImageLoaded(viewImage);
+      image.src = viewImage;
+    }
+  }
+
+  _handleViewImageLoaded(viewImage) {
+    if (this.locationData?.gameViewImage === viewImage) {
+      this._loadedViewImage = viewImage;
+    }
+  }
+
   _handlePuzzleResolved(event) {
     const { puzzle, outcome } = event.detail;
     console.log(`GameInterfaceView: Received puzzle-resolved event for puzzle ${puzzle.id} with outcome: ${outcome}`);
@@ -746,7 +765,10 @@ class GameInterfaceView extends LitElement {
       return html`<div class="viewport"><p style="text-align:center; color:white; padding-top: 50px;">Loading location...</p></div>`;
     }
 
-    const backgroundImage = this.locationData.gameViewImage ? `url(${this.locationData.gameViewImage})` : 'none';
+    // The built data carries a tiny placeholder that is painted until the full image arrives.
+    const viewImage = this.locationData.gameViewImage;
+    const viewportStyle = backgroundWithPlaceholder(
+      viewImage, this.locationData.gameViewPlaceholder, viewImage === this._loadedViewImage);
 
     let contentHtml;
     let npcListHtml = html``;
@@ -767,7 +789,7 @@ class GameInterfaceView extends LitElement {
                      title="${npc.name}"
                      @click=${() => this._handleNpcClick(npc.id)}>
                   ${npc.portraitImage ? html`
-                    <img src="${npc.portraitImage}" alt="Portrait of ${npc.name}" class="npc-portrait-image">
+                    <img src="${npc.portraitImage}" alt="Portrait of ${npc.name}" class="npc-portrait-image" style="${placeholderStyle(npc.portraitPlaceholder)}" @load=${clearPlaceholder}>
                   ` : html`
                     <md-icon>${npc.icon || 'person'}</md-icon>
                   `}
@@ -911,7 +933,7 @@ class GameInterfaceView extends LitElement {
     }
 
     return html`
-      <div class="viewport" style="background-image: ${backgroundImage};">
+      <div class="viewport" style="${viewportStyle}">
         <div class="location-title">${this.locationData.name}</div>
         ${contentHtml}
 
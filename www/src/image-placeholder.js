@@ -0,0 +1,35 @@
+/**
+ * Inline style that paints an image's low-quality placeholder (embedded in
+ * the built data files by scripts/build_assets.py) behind an <img> until the
+ * full image has loaded. Returns an empty string when there is no placeholder.
+ */
+export function placeholderStyle(placeholder) {
+  if (!placeholder) {
+    return '';
+  }
+  return `background: ${placeholder.color} url(${placeholder.thumbnail}) center / cover no-repeat;`;
+}
+
+/**
+ * `@load` handler for an <img> styled with placeholderStyle(): drops the
+ * placeholder once the full image is showing, so it never shows through
+ * transparent parts of the image.
+ */
+export function clearPlaceholder(event) {
+  event.target.style.background = '';
+}
+
+/**
+ * Inline background style for an element showing a full-size image: the
+ * image layered over its placeholder thumbnail and colour while it loads,
+ * and the image alone once `loaded` is true (or when there is no placeholder).
+ */
+export function backgroundWithPlaceholder(imageUrl, placeholder, loaded) {
+  if (!imageUrl) {
+    return 'background-image: none;';
+  }
+  if (!placeholder || loaded) {
+    return `background-image: url(${imageUrl});`;
+  }
+  return `background-image: url(${imageUrl}), url(${placeholder.thumbnail}); background-color: ${placeholder.color};`;
+}
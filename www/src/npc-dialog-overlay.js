@@ -2,6 +2,7 @@ import { LitElement, html, css } from 'lit';
 import '@material/web/dialog/dialog.js';
 import '@material/web/button/text-button.js';
 import '@material/web/icon/icon.js'; // For potential future use or fallback portrait
+import { clearPlaceholder, placeholderStyle } from './image-placeholder.js';
 
 class NpcDialogOverlay extends LitElement {
   static properties = {
@@ -370,7 +371,7 @@ class NpcDialogOverlay extends LitElement {
         <div slot="headline" id="dialog-title">${this.npcDetails?.name || 'Mysterious Figure'}</div>
         <form id="dialog-form" slot="content" method="dialog">
           <div id="dialog-content">
-            ${this.npcDetails?.portraitImage ? html`<div class="portrait"><img src="${this.npcDetails.portraitImage}" alt="Portrait of ${this.npcDetails.name}"></div>` : ''}
+            ${this.npcDetails?.portraitImage ? html`<div class="portrait"><img src="${this.npcDetails.portraitImage}" alt="Portrait of ${this.npcDetails.name}" style="${placeholderStyle(this.npcDetails.portraitPlaceholder)}" @load=${clearPlaceholder}></div>` : ''}
             <div class="npc-text">${this.dialogueNode.npcText}</div>
           </div>
         </form>